@@ -0,0 +1,59 @@
+"""
+act_ids.py — 可用 act_id 记录的表结构、写入方法与“检查 act_id”日志行格式
+
+server.ActIdStore 与 check_exist.py 共用这里的定义，避免两边各写一份后逐渐不一致。
+只依赖标准库，check_exist.py 的多进程 worker 导入时不会加载 Flask / bilibili_api。
+"""
+
+import re
+from datetime import datetime
+
+# 可用 act_id 记录表
+ACT_IDS_DDL = """
+    CREATE TABLE IF NOT EXISTS act_ids (
+        act_id     INTEGER PRIMARY KEY,
+        name       TEXT NOT NULL DEFAULT '',
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_act_ids_updated ON act_ids (updated_at);
+"""
+
+# 已存在的记录保留最早的 created_at、最新的 updated_at；name 非空时才覆盖名称
+_UPSERT_SQL = """
+    INSERT INTO act_ids (act_id, name, created_at, updated_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT (act_id) DO UPDATE SET
+        name = CASE WHEN ? != '' THEN excluded.name ELSE act_ids.name END,
+        created_at = MIN(act_ids.created_at, excluded.created_at),
+        updated_at = MAX(act_ids.updated_at, excluded.updated_at)
+"""
+
+
+def upsert_act_ids(conn, items) -> int:
+    """
+    把 [{"act_id", "name", "created_at"?, "updated_at"?}, ...] 写入 act_ids 表（不提交事务）。
+    act_id 非法的条目被忽略，返回有效条目数。
+    """
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    rows = []
+    for item in items:
+        act_id = str(item.get("act_id") or "").strip()
+        if not act_id.isdigit() or act_id == "0":
+            continue
+        name = str(item.get("name") or "").strip()
+        rows.append((int(act_id), name or act_id, item.get("created_at") or now, item.get("updated_at") or now, name))
+    if rows:
+        conn.executemany(_UPSERT_SQL, rows)
+    return len(rows)
+
+
+# 服务端每次向 B站查询 act_id 后记录一行，check_exist.py 从日志中挖掘这些行
+def check_log_message(act_id, exists: bool, name: str) -> str:
+    return f"检查 act_id={act_id}: exists={exists}, name={name!r}"
+
+
+# 匹配完整日志行：[2026-06-10 12:00:00] [INFO] 检查 act_id=123: exists=True, name='xxx'
+CHECK_LINE_RE = re.compile(
+    r"^\[([\d\- :]{19})\] \[INFO\] 检查 act_id=(\d+): exists=(True|False), name=(.*?)\r?$".encode("utf-8"),
+    re.MULTILINE,
+)
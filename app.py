@@ -13,7 +13,7 @@ import socket
 # ── 正常 GUI 模式 ──────────────────────────────────────────────────────
 import os
 import webview
-from server import app as flask_app  # reuse existing Flask app
+from server import app as flask_app, resume_download_jobs  # reuse existing Flask app
 
 
 def _resource_path(relative: str) -> str:
@@ -31,6 +31,7 @@ def _get_free_port() -> int:
 
 def _start_flask(port: int) -> None:
     """Run Flask in a daemon thread so it exits when the main thread exits."""
+    resume_download_jobs()
     flask_app.run(host="127.0.0.1", port=port, debug=False, use_reloader=False)
 
 
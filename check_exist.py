@@ -1,22 +1,202 @@
-import re
+"""
+check_exist.py — 从服务端日志中挖掘已确认存在的 act_id，合并到可用 act_id 记录
 
-input_file = "./logs/biliCollectionDownloader_2026-06-10.log"
-output_file = "./logs/act_ids_exists_true.txt"
+用法：
+  python check_exist.py                  # 增量扫描 logs/biliCollectionDownloader_*.log
+  python check_exist.py --full           # 忽略已记录的偏移量，全部重新扫描
+  python check_exist.py --output ids.txt # 另外把本次找到的 act_id 写入文本文件
 
-act_ids = set()
+日志文件按块并行处理（mmap + 正则），每个文件已处理到的字节偏移量保存在
+logs/available_act_ids.db 中，再次运行时只处理新增的内容。
+日志中最后一次检查为 exists=False 的 act_id 会从记录中删除（记录在该次检查之后被更新过的除外）。
+"""
 
-with open(input_file, "r", encoding="utf-8") as f:
-    for line in f:
+import argparse
+import ast
+import glob
+import mmap
+import os
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
 
-        # ✔ 只匹配 exists=True 的“检查行”
-        if "检查 act_id=" in line and "exists=True" in line:
+from act_ids import ACT_IDS_DDL, CHECK_LINE_RE, upsert_act_ids
 
-            match = re.search(r"act_id=(\d+)", line)
-            if match:
-                act_ids.add(match.group(1))
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+# 只匹配按日期命名的主日志，跳过 *.error.log
+LOG_PATTERN = "biliCollectionDownloader_[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9].log"
+CHUNK_SIZE = 64 * 1024 * 1024
 
-with open(output_file, "w", encoding="utf-8") as f:
-    for act_id in sorted(act_ids):
-        f.write(act_id + "\n")
 
-print(f"完成：{len(act_ids)} 个 exists=True act_id")
\ No newline at end of file
+def _parse_name(raw: bytes) -> str:
+    text = raw.decode("utf-8", errors="replace")
+    try:
+        value = ast.literal_eval(text)
+        return value if isinstance(value, str) else str(value)
+    except (ValueError, SyntaxError):
+        return text.strip("'\"")
+
+
+def _mine_chunk(path: str, start: int, end: int) -> dict:
+    """扫描 [start, end) 字节范围（均位于行首），返回 {act_id: [exists, name, first_seen, last_seen]}。"""
+    found = {}
+    with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for match in CHECK_LINE_RE.finditer(mm, start, end):
+            ts = match.group(1).decode("ascii")
+            act_id = int(match.group(2))
+            exists = match.group(3) == b"True"
+            name = _parse_name(match.group(4)) if exists else ""
+            entry = found.get(act_id)
+            if entry is None:
+                found[act_id] = [exists, name, ts, ts]
+            else:
+                entry[0] = exists
+                entry[1] = name or entry[1]
+                entry[3] = ts
+    return found
+
+
+def _split_chunks(path: str, start: int, end: int) -> list:
+    """把 [start, end) 按 CHUNK_SIZE 切分，切点对齐到下一个换行符之后。"""
+    chunks = []
+    with open(path, "rb") as fh:
+        pos = start
+        while pos < end:
+            cut = min(pos + CHUNK_SIZE, end)
+            if cut < end:
+                fh.seek(cut)
+                fh.readline()
+                cut = min(fh.tell(), end)
+            chunks.append((path, pos, cut))
+            pos = cut
+    return chunks
+
+
+def _complete_size(path: str, size: int) -> int:
+    """返回最后一个换行符之后的位置，正在写入的半行留到下次处理。"""
+    with open(path, "rb") as fh:
+        pos = size
+        while pos > 0:
+            step = min(4096, pos)
+            fh.seek(pos - step)
+            block = fh.read(step)
+            idx = block.rfind(b"\n")
+            if idx >= 0:
+                return pos - step + idx + 1
+            pos -= step
+    return 0
+
+
+def _open_store(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # act_ids 表与 server.ActIdStore 共用 act_ids.py 中的定义
+    conn.executescript(ACT_IDS_DDL + """
+        CREATE TABLE IF NOT EXISTS log_offsets (
+            path   TEXT PRIMARY KEY,
+            offset INTEGER NOT NULL
+        );
+    """)
+    return conn
+
+
+def mine_logs(log_dir: str, db_path: str, workers=None, full: bool = False) -> dict:
+    """
+    增量扫描 log_dir 下的日志并合并到 db_path，返回统计信息及本次确认存在的 act_id 列表。
+    最后一次检查为 exists=False 的 act_id 在同一事务中删除，除非记录的 updated_at 晚于该次检查。
+    """
+    conn = _open_store(db_path)
+    offsets = {} if full else dict(conn.execute("SELECT path, offset FROM log_offsets"))
+
+    chunks, new_offsets, scanned_bytes = [], {}, 0
+    for path in sorted(glob.glob(os.path.join(log_dir, LOG_PATTERN))):
+        name = os.path.basename(path)
+        size = os.path.getsize(path)
+        start = offsets.get(name, 0)
+        if size < start:
+            # 文件被截断或替换，从头开始
+            start = 0
+        end = _complete_size(path, size) if size > start else start
+        if end > start:
+            chunks.extend(_split_chunks(path, start, end))
+            scanned_bytes += end - start
+        new_offsets[name] = end
+
+    # 按文件名（日期）与偏移量顺序合并，后出现的记录覆盖先出现的
+    merged = {}
+    if chunks:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for found in executor.map(_mine_chunk, *zip(*chunks)):
+                for act_id, (exists, name, first_seen, last_seen) in found.items():
+                    entry = merged.get(act_id)
+                    if entry is None:
+                        merged[act_id] = [exists, name, first_seen, last_seen]
+                    else:
+                        entry[0] = exists
+                        entry[1] = name or entry[1]
+                        entry[3] = last_seen
+
+    items = [
+        {"act_id": act_id, "name": name, "created_at": first_seen, "updated_at": last_seen}
+        for act_id, (exists, name, first_seen, last_seen) in merged.items()
+        if exists
+    ]
+    gone = [(act_id, last_seen) for act_id, (exists, _name, _first, last_seen) in merged.items() if not exists]
+    with conn:
+        upsert_act_ids(conn, items)
+        removed = conn.executemany(
+            "DELETE FROM act_ids WHERE act_id = ? AND updated_at <= ?", gone,
+        ).rowcount if gone else 0
+        conn.executemany(
+            "INSERT OR REPLACE INTO log_offsets (path, offset) VALUES (?, ?)",
+            list(new_offsets.items()),
+        )
+    total = conn.execute("SELECT COUNT(*) FROM act_ids").fetchone()[0]
+    conn.close()
+
+    return {
+        "files": len(new_offsets),
+        "chunks": len(chunks),
+        "scanned_bytes": scanned_bytes,
+        "checked": len(merged),
+        "exists": sorted(item["act_id"] for item in items),
+        "removed": removed,
+        "total": total,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="从日志中挖掘已确认存在的 act_id，并删除最后一次检查为不存在的记录")
+    parser.add_argument("--log-dir", default=os.path.join(ROOT_DIR, "logs"), help="日志目录（默认 ./logs）")
+    parser.add_argument("--db", default="", help="可用 act_id 数据库（默认 <log-dir>/available_act_ids.db）")
+    parser.add_argument("--workers", type=int, default=None, help="并行进程数（默认 CPU 核数）")
+    parser.add_argument("--full", action="store_true", help="忽略已记录的偏移量，全部重新扫描")
+    parser.add_argument("--output", default="", help="把本次确认存在的 act_id 写入该文本文件")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.log_dir):
+        print(f"日志目录不存在：{args.log_dir}")
+        return 1
+
+    started = datetime.now()
+    db_path = args.db or os.path.join(args.log_dir, "available_act_ids.db")
+    stats = mine_logs(args.log_dir, db_path, workers=args.workers, full=args.full)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for act_id in stats["exists"]:
+                f.write(f"{act_id}\n")
+
+    elapsed = (datetime.now() - started).total_seconds()
+    print(
+        f"完成：扫描 {stats['files']} 个日志文件（新增 {stats['scanned_bytes'] / 1048576:.1f} MB，"
+        f"{stats['chunks']} 块），检查记录 {stats['checked']} 个 act_id，"
+        f"其中 exists=True {len(stats['exists'])} 个，删除已不存在的记录 {stats['removed']} 个；"
+        f"记录总数 {stats['total']}，用时 {elapsed:.1f}s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
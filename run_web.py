@@ -12,9 +12,10 @@ ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 if ROOT_DIR not in sys.path:
     sys.path.insert(0, ROOT_DIR)
 
-from server import app
+from server import app, resume_download_jobs
 
 if __name__ == "__main__":
+    resume_download_jobs()
     import socket
     hostname = socket.gethostname()
     local_ip = socket.gethostbyname(hostname)
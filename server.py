@@ -1,22 +1,49 @@
+import asyncio
+import atexit
+import errno
 import mimetypes
 import os
 import logging
 import hashlib
+import itertools
 import json
 import re
+import sqlite3
+import struct
+import sys
 import time
 import random
+import shutil
+import tempfile
+import threading
+import uuid
+import zipfile
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import (
+    FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait as wait_futures,
+)
 from datetime import datetime
 from urllib.parse import quote, urlparse, unquote
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+import cv2
+import httpx
+import numpy as np
 import requests as req_lib
 from flask import Flask, Response, jsonify, request, send_file
 
-from bilibili_api import sync, ResponseCodeException, NetworkException
+from bilibili_api import ResponseCodeException, NetworkException, get_client, select_client, set_session
 from bilibili_api.garb import DLC
 from bilibili_api.utils.network import Api
 from bilibili_api.utils.utils import get_api
 
+from act_ids import ACT_IDS_DDL, check_log_message, upsert_act_ids
+
 app = Flask(__name__)
 
 _GARB_API = get_api("garb")
@@ -56,22 +83,213 @@ if not BILI_COOKIES["SESSDATA"]:
         except Exception:
             pass
 
-_bili_session = req_lib.Session()
+# ====== 共享 HTTP 连接池 ======
+# API（api.bilibili.com、b23.tv 等）与 CDN（i0.hdslb.com、视频节点等）使用独立的连接池，
+# 大批量下载占满 CDN 连接时不影响元数据请求；连接保持 keep-alive 复用，避免每个文件重新握手。
+
+HTTP_API_POOL_SIZE = int(os.environ.get("BILI_HTTP_API_POOL", "16"))
+HTTP_CDN_POOL_SIZE = int(os.environ.get("BILI_HTTP_CDN_POOL", "64"))
+# 设置 BILI_HTTP2=1 时 CDN 请求改用 httpx 的 HTTP/2 客户端（需要安装 h2）
+HTTP_CDN_HTTP2 = os.environ.get("BILI_HTTP2", "") == "1"
+
+
+def _pooled_session(pool_size: int) -> req_lib.Session:
+    session = req_lib.Session()
+    adapter = req_lib.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=max(1, pool_size))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_bili_session = _pooled_session(HTTP_API_POOL_SIZE)
 _bili_session.headers.update(BILI_HEADERS)
+_cdn_session = _pooled_session(HTTP_CDN_POOL_SIZE)
+
+_http2_client = None
+_http2_client_lock = threading.Lock()
+_http2_unavailable = False
+
+
+class _HttpxStreamResponse:
+    """把 httpx 流式响应包装成下载代码用到的 requests.Response 接口，异常也转换为 requests 的类型。"""
+
+    def __init__(self, resp):
+        self._resp = resp
+        self.status_code = resp.status_code
+        self.headers = resp.headers
+        self.url = str(resp.url)
+
+    @property
+    def content(self) -> bytes:
+        return self._resp.read()
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise req_lib.exceptions.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+    def iter_content(self, chunk_size=None):
+        try:
+            yield from self._resp.iter_bytes(chunk_size)
+        except httpx.TimeoutException as e:
+            raise req_lib.exceptions.Timeout(e)
+        except httpx.TransportError as e:
+            raise req_lib.exceptions.ChunkedEncodingError(e)
+
+    def close(self):
+        self._resp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _get_http2_client():
+    """按需创建 HTTP/2 客户端；未开启或缺少 h2 依赖时返回 None，回退到 requests 连接池。"""
+    global _http2_client, _http2_unavailable
+    if not HTTP_CDN_HTTP2 or _http2_unavailable:
+        return None
+    with _http2_client_lock:
+        if _http2_client is None:
+            try:
+                _http2_client = httpx.Client(
+                    http2=True,
+                    limits=httpx.Limits(
+                        max_connections=HTTP_CDN_POOL_SIZE,
+                        max_keepalive_connections=HTTP_CDN_POOL_SIZE,
+                    ),
+                )
+            except ImportError:
+                _http2_unavailable = True
+                LOGGER.warning("未安装 h2，HTTP/2 不可用，CDN 请求继续使用 HTTP/1.1 连接池")
+                return None
+        return _http2_client
+
+
+def _cdn_get(url: str, headers=None, stream: bool = False, timeout=(8, 30)):
+    """通过 CDN 连接池发起 GET 请求，返回值可按 requests.Response 使用（支持 with）。"""
+    client = _get_http2_client()
+    if client is None:
+        return _cdn_session.get(url, headers=headers, stream=stream, timeout=timeout)
+
+    connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+    try:
+        req = client.build_request("GET", url, headers=headers, timeout=httpx.Timeout(read, connect=connect))
+        resp = _HttpxStreamResponse(client.send(req, stream=True, follow_redirects=True))
+    except httpx.TimeoutException as e:
+        raise req_lib.exceptions.Timeout(e)
+    except httpx.TransportError as e:
+        raise req_lib.exceptions.ConnectionError(e)
+    if not stream:
+        resp.content
+    return resp
+
+# ====== 自适应令牌桶限速（防止触发风控）======
+
+class AdaptiveTokenBucket:
+    """
+    线程安全的令牌桶限速器。
+    - acquire() 预约一个令牌，在锁外等待，多个线程按到达顺序排队，互不覆盖
+    - on_throttled() 在触发 412 时把速率减半，并记住触发时的速率作为上限参考
+    - on_success() 连续成功若干次后逐步提速，但不超过上次触发风控速率的 90%
+    """
+
+    def __init__(self, name, rate, min_rate=0.2, max_rate=4.0, burst=1.0,
+                 backoff=0.5, ramp_after=20, ramp_factor=1.1, jitter=0.15):
+        self.name = name
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.backoff = backoff
+        self.ramp_after = ramp_after
+        self.ramp_factor = ramp_factor
+        self.jitter = jitter
+        self._ceiling = max_rate
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._success_streak = 0
+        self._throttled_count = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """预约一个令牌并返回需要等待的秒数（不休眠），协程中配合 asyncio.sleep 使用。"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        return wait + random.uniform(0, self.jitter) if wait > 0 else 0.0
+
+    def acquire(self):
+        """取得一个令牌；令牌不足时在锁外休眠到预约时间。"""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self._success_streak += 1
+            if self._success_streak < self.ramp_after:
+                return
+            self._success_streak = 0
+            if self.rate >= self._ceiling:
+                # 长时间未再触发风控，缓慢放宽上限
+                self._ceiling = min(self.max_rate, self._ceiling * 1.02)
+            self.rate = min(self._ceiling, self.rate * self.ramp_factor)
+
+    def on_throttled(self):
+        with self._lock:
+            self._ceiling = max(self.min_rate, self.rate * 0.9)
+            self.rate = max(self.min_rate, self.rate * self.backoff)
+            self._success_streak = 0
+            self._throttled_count += 1
+            # 清空已积累的令牌，下一个请求至少等待一个完整间隔
+            self._tokens = min(self._tokens, 0.0)
+            rate = self.rate
+        LOGGER.warning(f"[rate_limit] {self.name} 触发风控，速率降至 {rate:.2f} req/s")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "rate": round(self.rate, 3),
+                "ceiling": round(self._ceiling, 3),
+                "success_streak": self._success_streak,
+                "throttled_count": self._throttled_count,
+            }
 
-# 请求间隔控制（防止触发风控）
-_last_request_time = 0.0
-_MIN_REQUEST_INTERVAL = 0.8  # 最短 800ms 一个请求
+
+# 每类接口独立限速，初始 1.25 req/s（即原先的 800ms 间隔）
+_RATE_LIMITERS = {
+    "garb_detail": AdaptiveTokenBucket("garb_detail", rate=1.25),
+    "act_basic": AdaptiveTokenBucket("act_basic", rate=1.25),
+    "search": AdaptiveTokenBucket("search", rate=1.25),
+    "suit_benefit": AdaptiveTokenBucket("suit_benefit", rate=1.25),
+}
+
+
+def _bili_rate_limit(rate_class: str):
+    """请求限速：按接口类别从对应令牌桶取令牌"""
+    _RATE_LIMITERS[rate_class].acquire()
 
 
-def _bili_rate_limit():
-    """请求限速：确保请求间隔不小于 _MIN_REQUEST_INTERVAL 秒"""
-    global _last_request_time
-    elapsed = time.time() - _last_request_time
-    if elapsed < _MIN_REQUEST_INTERVAL:
-        sleep_time = _MIN_REQUEST_INTERVAL - elapsed + random.uniform(0, 0.3)
-        time.sleep(sleep_time)
-    _last_request_time = time.time()
+def _bili_report(rate_class: str, throttled: bool = False):
+    """把请求结果反馈给对应令牌桶：412 时退避，成功时逐步提速"""
+    limiter = _RATE_LIMITERS[rate_class]
+    if throttled:
+        limiter.on_throttled()
+    else:
+        limiter.on_success()
+
+
+def _is_412_error(exc) -> bool:
+    """检测 bilibili_api 抛出的 NetworkException 是否为 412 风控"""
+    err_str = str(exc)
+    return "412" in err_str or "状态码：412" in err_str
 
 
 def _is_412_response(resp):
@@ -87,16 +305,18 @@ def _is_412_response(resp):
 def bili_request(url, **kwargs):
     """
     带 Cookie + 完整请求头 + 限速 + 重试 的 B站 API 请求。
+    rate_class 指定使用的限速桶（默认 search）。
     返回: (response_json | None, error_message | None)
     """
-    _bili_rate_limit()
-
     timeout = kwargs.pop("timeout", 15)
     max_retry = kwargs.pop("max_retry", 3)
     cookies = kwargs.pop("cookies", None) or BILI_COOKIES
+    rate_class = kwargs.pop("rate_class", "search")
 
     for attempt in range(max_retry):
         try:
+            # 每次尝试都经过令牌桶，412 后的重试会自动按退避后的速率等待
+            _bili_rate_limit(rate_class)
             resp = _bili_session.get(
                 url,
                 cookies=cookies,
@@ -106,8 +326,7 @@ def bili_request(url, **kwargs):
 
             if _is_412_response(resp):
                 LOGGER.warning(f"[retry {attempt + 1}/{max_retry}] 触发 B站 412 风控: {url}")
-                if attempt < max_retry - 1:
-                    time.sleep(1.5 + attempt * 1.0)
+                _bili_report(rate_class, throttled=True)
                 continue
 
             if resp.status_code != 200:
@@ -128,6 +347,7 @@ def bili_request(url, **kwargs):
                     time.sleep(1.0 + attempt * 0.5)
                 continue
 
+            _bili_report(rate_class)
             return resp.json(), None
 
         except req_lib.exceptions.Timeout:
@@ -154,6 +374,290 @@ def safe_request(func, fallback_msg="请求失败"):
         return None
 
 
+# ====== 相同请求合并（single-flight）======
+
+class _FlightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    合并并发的相同上游请求：同一 key 同时只有一个线程（leader）真正发起请求，
+    其余线程等待并共享其结果或异常。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def begin(self, key):
+        """登记一次调用，返回 (是否为 leader, 调用对象)；leader 必须在结束时调用 finish()。"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return False, call
+            call = _FlightCall()
+            self._calls[key] = call
+            return True, call
+
+    def finish(self, key, result=None, error=None):
+        """结束 leader 的调用并唤醒等待者，重复调用无副作用。"""
+        with self._lock:
+            call = self._calls.pop(key, None)
+        if call is not None:
+            call.result = result
+            call.error = error
+            call.done.set()
+
+    def do(self, key, fn):
+        """执行 fn()；若相同 key 已有调用在进行中，则等待并返回它的结果。"""
+        leader, call = self.begin(key)
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, error=e)
+            raise
+        self.finish(key, result=result)
+        return result
+
+
+_single_flight = SingleFlight()
+
+
+class KeyedLock:
+    """
+    按 key 区分的互斥锁：同一 key 同时只有一个线程持有，不同 key 互不影响。
+    锁按引用计数管理，最后一个持有/等待的线程释放后即删除，不会随 key 数量无限增长。
+    """
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks = {}  # key -> [Lock, 持有/等待的线程数]
+
+    @contextmanager
+    def hold(self, key):
+        with self._guard:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+    def __len__(self):
+        with self._guard:
+            return len(self._locks)
+
+
+# ====== 图片代理磁盘缓存 ======
+
+PROXY_CACHE_MAX_BYTES = int(os.environ.get("BILI_PROXY_CACHE_MB", "512")) * 1024 * 1024
+# 缓存条目在该时间内直接返回，超过后向源站发条件请求校验
+PROXY_CACHE_FRESH_SECONDS = 24 * 3600
+PROXY_BROWSER_MAX_AGE = 7 * 24 * 3600
+_PROXY_CHUNK_SIZE = 64 * 1024
+# 同一图片正在被其他请求下载时，最多等待的秒数
+_PROXY_FOLLOWER_TIMEOUT = 15
+
+
+class DiskLRUCache:
+    """
+    磁盘 LRU 缓存，总大小超过 max_bytes 时按最近访问时间淘汰。
+    每个条目由数据文件和同名 .json 元数据文件组成，文件名为 key（通常是 URL 的 sha256）。
+    目录在第一次写入时才创建，import server 不会在磁盘上留下空目录。
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = sum(size for _path, size, _atime in self._entries())
+
+    def _paths(self, key: str):
+        sub_dir = os.path.join(self.cache_dir, key[:2])
+        data_path = os.path.join(sub_dir, key)
+        return data_path, data_path + ".json"
+
+    def _entries(self):
+        for current, _dirs, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".json") or name.endswith(".tmp"):
+                    continue
+                path = os.path.join(current, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def get(self, key: str):
+        """返回条目元数据（含 path），不存在时返回 None；命中时刷新访问时间。"""
+        data_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            os.utime(data_path)
+        except (OSError, ValueError):
+            return None
+        meta["path"] = data_path
+        return meta
+
+    def update_meta(self, key: str, **updates):
+        data_path, meta_path = self._paths(key)
+        meta = self.get(key)
+        if not meta:
+            return
+        meta.pop("path", None)
+        meta.update(updates)
+        self._write_meta(meta_path, meta)
+
+    @staticmethod
+    def _write_meta(meta_path: str, meta: dict):
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, meta_path)
+
+    def tmp_path(self, key: str) -> str:
+        data_path, _meta_path = self._paths(key)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        return f"{data_path}.{uuid.uuid4().hex[:8]}.tmp"
+
+    def commit(self, key: str, tmp_path: str, meta: dict):
+        """把写好的临时文件登记为缓存条目，并按需淘汰旧条目。"""
+        data_path, meta_path = self._paths(key)
+        size = os.path.getsize(tmp_path)
+        with self._lock:
+            old_size = os.path.getsize(data_path) if os.path.exists(data_path) else 0
+            os.replace(tmp_path, data_path)
+            self._write_meta(meta_path, {**meta, "size": size})
+            self._total_bytes += size - old_size
+            over = self._total_bytes > self.max_bytes
+        if over:
+            self._evict()
+
+    def put_bytes(self, key: str, content: bytes, meta: dict):
+        tmp_path = self.tmp_path(key)
+        with open(tmp_path, "wb") as fh:
+            fh.write(content)
+        self.commit(key, tmp_path, {"sha256": hashlib.sha256(content).hexdigest(), **meta})
+
+    def _evict(self):
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda entry: entry[2])
+            total = sum(size for _path, size, _atime in entries)
+            target = int(self.max_bytes * 0.9)
+            for path, size, _atime in entries:
+                if total <= target:
+                    break
+                for victim in (path, path + ".json"):
+                    try:
+                        os.remove(victim)
+                    except OSError:
+                        pass
+                total -= size
+            self._total_bytes = total
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"bytes": self._total_bytes, "max_bytes": self.max_bytes}
+
+
+def _cache_dir(name: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", name)
+
+
+_proxy_cache = DiskLRUCache(_cache_dir("proxy_img"), PROXY_CACHE_MAX_BYTES)
+
+
+def _content_disposition(filename: str, disposition: str = "inline") -> str:
+    """生成 Content-Disposition，非 ASCII 文件名使用 RFC 5987 编码。"""
+    try:
+        filename.encode("ascii")
+        return f'{disposition}; filename="{filename}"'
+    except UnicodeEncodeError:
+        return f"{disposition}; filename*=UTF-8''{quote(filename)}"
+
+
+def _proxy_filename(url: str, content_type: str) -> str:
+    """从 URL 中提取原始文件名，避免浏览器保存成 proxy_img.png"""
+    filename = unquote(os.path.basename(urlparse(url).path))
+    if not filename:
+        ext = mimetypes.guess_extension(content_type) or ".jpg"
+        filename = f"image{ext}"
+    return filename
+
+
+def _proxy_etag(meta: dict) -> str:
+    """
+    给浏览器的 ETag 跟随内容变化：优先由源站的 ETag/Last-Modified 派生（流式转发时即可确定），
+    否则使用缓存内容的 sha256；两者都没有时返回空字符串（不发送 ETag）。
+    """
+    if meta.get("etag") or meta.get("last_modified"):
+        validator = f'{meta["key"]}|{meta.get("etag", "")}|{meta.get("last_modified", "")}'
+        return f'"{hashlib.sha256(validator.encode("utf-8")).hexdigest()[:32]}"'
+    if meta.get("sha256"):
+        return f'"{meta["sha256"][:32]}"'
+    return ""
+
+
+def _proxy_browser_headers(meta: dict) -> dict:
+    headers = {
+        "Content-Disposition": _content_disposition(meta["filename"]),
+        "Cache-Control": f"public, max-age={PROXY_BROWSER_MAX_AGE}",
+    }
+    etag = _proxy_etag(meta)
+    if etag:
+        headers["ETag"] = etag
+    return headers
+
+
+def _serve_cached_image(meta: dict):
+    """从磁盘缓存返回图片；浏览器带有匹配的 If-None-Match 时直接返回 304。"""
+    headers = _proxy_browser_headers(meta)
+    if "ETag" in headers and request.headers.get("If-None-Match") == headers["ETag"]:
+        return Response(status=304, headers=headers)
+    response = send_file(meta["path"], mimetype=meta["content_type"], conditional=False)
+    response.headers.update(headers)
+    return response
+
+
+def _stream_and_cache(resp, key: str, meta: dict):
+    """逐块把源站响应转发给浏览器，同时写入缓存临时文件；完整传输后才登记进缓存。"""
+    tmp_path = _proxy_cache.tmp_path(key)
+    hasher = hashlib.sha256()
+    completed = False
+    try:
+        with open(tmp_path, "wb") as fh:
+            for chunk in resp.iter_content(chunk_size=_PROXY_CHUNK_SIZE):
+                if chunk:
+                    fh.write(chunk)
+                    hasher.update(chunk)
+                    yield chunk
+        completed = True
+    finally:
+        resp.close()
+        if completed:
+            _proxy_cache.commit(key, tmp_path, {**meta, "sha256": hasher.hexdigest()})
+        else:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
 # ====== 图片代理接口 ======
 
 @app.route("/api/proxy_img")
@@ -161,9 +665,12 @@ def proxy_img():
     """
     代理图片请求，解决B站图片 Referer 防盗链问题。
     同时保留原始文件名，避免浏览器保存成 proxy_img.png
+    图片会缓存到磁盘（LRU，总大小受 BILI_PROXY_CACHE_MB 限制），过期后用 ETag/Last-Modified 向源站校验；
+    未缓存时边下载边转发，不在内存中缓存整张图片。
 
     用法：
         /api/proxy_img?url=xxx
+        /api/proxy_img?url=xxx&w=360[&format=webp|jpeg]   返回缩略图（宽度按档位取整，单独缓存）
     """
 
     url = request.args.get("url", "").strip()
@@ -174,20 +681,77 @@ def proxy_img():
             "message": "缺少或错误的url参数"
         }), 400
 
+    width = _int_arg("w")
+    if width:
+        try:
+            response = _proxy_thumbnail(url, width, _thumb_format(request.args.get("format")))
+            if not request.args.get("format"):
+                response.headers["Vary"] = "Accept"
+            return response
+        except Exception as e:
+            # 无法解码的格式（如 GIF）或生成失败时回退为原图
+            LOGGER.warning(f"缩略图生成失败，返回原图: {url} | {e}")
+
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    cached = _proxy_cache.get(key)
+    if cached and time.time() - cached.get("fetched_at", 0) < PROXY_CACHE_FRESH_SECONDS:
+        return _serve_cached_image(cached)
+
+    # 同一图片已有请求在下载时，等它写入缓存后直接读缓存
+    flight_key = f"img:{key}"
+    leader, call = _single_flight.begin(flight_key)
+    if not leader:
+        call.done.wait(_PROXY_FOLLOWER_TIMEOUT)
+        fresh = _proxy_cache.get(key)
+        if fresh:
+            return _serve_cached_image(fresh)
+        # leader 失败或超时，自行请求（不再登记为 leader）
+    try:
+        response = _proxy_fetch(url, key, cached)
+    except BaseException:
+        if leader:
+            _single_flight.finish(flight_key)
+        raise
+    if leader:
+        if isinstance(response, tuple):
+            # 请求失败（返回错误 JSON），立即唤醒等待者
+            _single_flight.finish(flight_key)
+        else:
+            # 流式响应结束（或客户端断开）后才唤醒等待者
+            response.call_on_close(lambda: _single_flight.finish(flight_key))
+    return response
+
+
+def _proxy_fetch(url: str, key: str, cached):
+    """向源站请求图片（有旧缓存时带条件请求头），返回流式响应或缓存响应。"""
     try:
         headers = {
             "Referer": "https://www.bilibili.com/",
             "User-Agent": _RESOLVE_HEADERS["User-Agent"]
         }
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
 
-        resp = req_lib.get(
+        resp = _cdn_get(
             url,
             headers=headers,
             stream=True,
             timeout=10
         )
 
-        resp.raise_for_status()
+        if cached and resp.status_code == 304:
+            resp.close()
+            _proxy_cache.update_meta(key, fetched_at=time.time())
+            return _serve_cached_image(cached)
+
+        try:
+            resp.raise_for_status()
+        except Exception:
+            resp.close()
+            raise
 
         # Content-Type
         content_type = resp.headers.get("Content-Type")
@@ -199,37 +763,32 @@ def proxy_img():
                 or "image/jpeg"
             )
 
-        # =========================
-        # 提取原始文件名
-        # =========================
-
-        parsed = urlparse(url)
-
-        filename = os.path.basename(parsed.path)
-
-        # URL 解码
-        filename = unquote(filename)
-
-        # 防止空文件名
-        if not filename:
-            ext = mimetypes.guess_extension(content_type) or ".jpg"
-            filename = f"image{ext}"
-
-        # =========================
-        # 返回代理内容
-        # =========================
+        meta = {
+            "key": key,
+            "url": url,
+            "content_type": content_type,
+            "filename": _proxy_filename(url, content_type),
+            "etag": resp.headers.get("ETag", ""),
+            "last_modified": resp.headers.get("Last-Modified", ""),
+            "fetched_at": time.time(),
+        }
+        response_headers = _proxy_browser_headers(meta)
+        # iter_content 会解开 gzip/br，此时源站的 Content-Length 是压缩后的长度，不能转发
+        if resp.headers.get("Content-Length", "").isdigit() and not resp.headers.get("Content-Encoding"):
+            response_headers["Content-Length"] = resp.headers["Content-Length"]
 
         return Response(
-            resp.raw.read(),
+            _stream_and_cache(resp, key, meta),
             content_type=content_type,
-            headers={
-                # inline = 浏览器内显示
-                # attachment = 强制下载
-                "Content-Disposition": f'inline; filename="{filename}"'
-            }
+            headers=response_headers,
         )
 
     except Exception as e:
+        if cached:
+            # 源站不可用时返回旧缓存
+            LOGGER.warning(f"图片代理校验失败，返回旧缓存: {url} | {e}")
+            return _serve_cached_image(cached)
+
         LOGGER.error(
             f"图片代理失败: {url} | {e}",
             exc_info=True
@@ -239,6 +798,440 @@ def proxy_img():
             "code": -1,
             "message": "图片代理失败"
         }), 502
+
+
+# ====== 缩略图（预览网格用）======
+
+THUMB_CACHE_MAX_BYTES = int(os.environ.get("BILI_THUMB_CACHE_MB", "256")) * 1024 * 1024
+THUMB_WORKERS = int(os.environ.get("BILI_THUMB_WORKERS", str(min(4, os.cpu_count() or 1))))
+THUMB_QUALITY = 80
+# 宽度向上取整到固定档位，避免任意宽度把缓存撑散
+_THUMB_WIDTH_STEP = 60
+_THUMB_MAX_WIDTH = 1920
+_THUMB_FORMATS = {
+    "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+    "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY),
+}
+
+_thumb_cache = DiskLRUCache(_cache_dir("thumbs"), THUMB_CACHE_MAX_BYTES)
+_thumb_executor = ThreadPoolExecutor(max_workers=THUMB_WORKERS, thread_name_prefix="thumb")
+
+
+def _fetch_image_bytes(url: str) -> bytes:
+    """读取图片内容，优先使用图片代理的磁盘缓存；未缓存时下载并写入该缓存。"""
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    cached = _proxy_cache.get(key)
+    if cached:
+        with open(cached["path"], "rb") as fh:
+            return fh.read()
+    headers = {"Referer": "https://www.bilibili.com/", "User-Agent": _RESOLVE_HEADERS["User-Agent"]}
+    with _cdn_get(url, headers=headers, timeout=(8, 30)) as resp:
+        resp.raise_for_status()
+        content = resp.content
+        content_type = resp.headers.get("Content-Type") or mimetypes.guess_type(url)[0] or "image/jpeg"
+        _proxy_cache.put_bytes(key, content, {
+            "key": key,
+            "url": url,
+            "content_type": content_type,
+            "filename": _proxy_filename(url, content_type),
+            "etag": resp.headers.get("ETag", ""),
+            "last_modified": resp.headers.get("Last-Modified", ""),
+            "fetched_at": time.time(),
+        })
+    return content
+
+
+def _thumb_format(value: str) -> str:
+    """解析 format 参数；未指定时按浏览器 Accept 选择 WebP，否则 JPEG。"""
+    value = (value or "").strip().lower()
+    if value in ("jpg", "jpeg"):
+        return "jpeg"
+    if value == "webp":
+        return "webp"
+    return "webp" if "image/webp" in request.headers.get("Accept", "") else "jpeg"
+
+
+def _thumb_width(width: int) -> int:
+    return min(_THUMB_MAX_WIDTH, -(-max(width, 1) // _THUMB_WIDTH_STEP) * _THUMB_WIDTH_STEP)
+
+
+def _resize_to_width(image, width: int):
+    """等比缩小到 width 宽度，不放大。"""
+    height, src_width = image.shape[:2]
+    if src_width <= width:
+        return image
+    return cv2.resize(image, (width, max(1, round(height * width / src_width))), interpolation=cv2.INTER_AREA)
+
+
+def _make_thumbnail(content: bytes, width: int, fmt: str) -> bytes:
+    """把图片缩放到不超过 width 的宽度并编码为 WebP/JPEG（在线程池中执行）。"""
+    image = cv2.imdecode(np.frombuffer(content, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise ValueError("无法解码图片")
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    if image.dtype != np.uint8:
+        image = cv2.convertScaleAbs(image, alpha=255.0 / 65535.0)
+
+    image = _resize_to_width(image, width)
+
+    if image.shape[2] == 4 and fmt == "jpeg":
+        # JPEG 不支持透明通道，铺白底
+        alpha = image[:, :, 3:4].astype(np.float32) / 255.0
+        image = (image[:, :, :3] * alpha + 255.0 * (1.0 - alpha)).astype(np.uint8)
+
+    ext, _content_type, quality_flag = _THUMB_FORMATS[fmt]
+    ok, encoded = cv2.imencode(ext, image, [quality_flag, THUMB_QUALITY])
+    if not ok:
+        raise ValueError("缩略图编码失败")
+    return encoded.tobytes()
+
+
+def _proxy_thumbnail(url: str, width: int, fmt: str):
+    """返回缩略图响应，未缓存时生成；同一缩略图的并发请求只生成一次。"""
+    width = _thumb_width(width)
+    key = hashlib.sha256(f"{url}|w={width}|{fmt}".encode("utf-8")).hexdigest()
+    cached = _thumb_cache.get(key)
+    if cached:
+        return _serve_cached_image(cached)
+
+    def _build():
+        content = _fetch_image_bytes(url)
+        thumb = _thumb_executor.submit(_make_thumbnail, content, width, fmt).result()
+        ext, content_type, _quality_flag = _THUMB_FORMATS[fmt]
+        stem = os.path.splitext(_proxy_filename(url, content_type))[0]
+        _thumb_cache.put_bytes(key, thumb, {
+            "key": key,
+            "url": url,
+            "width": width,
+            "content_type": content_type,
+            "filename": f"{stem}_w{width}{ext}",
+            "source_bytes": len(content),
+        })
+        return _thumb_cache.get(key)
+
+    return _serve_cached_image(_single_flight.do(f"thumb:{key}", _build))
+
+
+# ====== 视频封面帧 ======
+
+POSTER_CACHE_MAX_BYTES = int(os.environ.get("BILI_POSTER_CACHE_MB", "64")) * 1024 * 1024
+# 先取文件头部；需要更靠后的帧时按码率估算再补取，总量不超过 _POSTER_MAX_BYTES
+_POSTER_HEAD_BYTES = 2 * 1024 * 1024
+_POSTER_MAX_BYTES = 32 * 1024 * 1024
+# moov 在文件末尾（未做 faststart）时单独取回，超过该大小则放弃
+_POSTER_MAX_TAIL_BYTES = 16 * 1024 * 1024
+
+_poster_cache = DiskLRUCache(_cache_dir("posters"), POSTER_CACHE_MAX_BYTES)
+
+
+def _fetch_range(url: str, start: int, end: int = None):
+    """用 Range 请求读取 [start, end] 字节，返回 (content, 文件总大小或 None)。"""
+    headers = {
+        "Referer": "https://www.bilibili.com/",
+        "User-Agent": _RESOLVE_HEADERS["User-Agent"],
+        "Range": f"bytes={start}-{'' if end is None else end}",
+    }
+    limit = None if end is None else end - start + 1
+    with _cdn_get(url, headers=headers, stream=True, timeout=(8, 30)) as resp:
+        resp.raise_for_status()
+        if resp.status_code == 206:
+            total = resp.headers.get("Content-Range", "").rpartition("/")[2]
+        elif start == 0:
+            # 源站不支持 Range，读到 limit 为止后断开
+            total = resp.headers.get("Content-Length", "")
+        else:
+            raise ValueError("源站不支持 Range 请求")
+        chunks, received = [], 0
+        for chunk in resp.iter_content(chunk_size=_PROXY_CHUNK_SIZE):
+            chunks.append(chunk)
+            received += len(chunk)
+            if limit is not None and received >= limit:
+                break
+    content = b"".join(chunks)
+    return (content[:limit] if limit is not None else content), (int(total) if total.isdigit() else None)
+
+
+def _mp4_tail_offset(head: bytes, total: int):
+    """
+    遍历 MP4 顶层 box；若头部中找不到完整的 moov（文件未做 faststart），
+    返回头部之后第一个 box 的偏移量，否则返回 None。
+    """
+    pos = 0
+    while pos + 8 <= len(head):
+        size, box_type = struct.unpack(">I4s", head[pos:pos + 8])
+        if size == 1:
+            if pos + 16 > len(head):
+                break
+            size = struct.unpack(">Q", head[pos + 8:pos + 16])[0]
+        elif size == 0:
+            size = total - pos
+        if size < 8:
+            return None
+        if box_type == b"moov":
+            return None if pos + size <= len(head) else pos
+        pos += size
+    return pos if pos < total else None
+
+
+def _video_duration(path: str):
+    """只解析容器头部得到时长（秒），不解码；无法获取时返回 None。"""
+    cap = cv2.VideoCapture(path)
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        return frames / fps if cap.isOpened() and fps > 0 and frames > 0 else None
+    finally:
+        cap.release()
+
+
+def _read_video_frame(path: str, seconds: float):
+    """读取 seconds 处的一帧，失败返回 None。"""
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            return None
+        if seconds > 0:
+            cap.set(cv2.CAP_PROP_POS_MSEC, seconds * 1000)
+        ok, frame = cap.read()
+        return frame if ok else None
+    finally:
+        cap.release()
+
+
+def _extract_poster(url: str, seconds: float):
+    """
+    只下载视频开头（必要时加上末尾的 moov）拼成稀疏临时文件，用 OpenCV 取出一帧。
+    指定的时间点超出开头部分时，先按平均码率估算所需字节数补取，再解码。
+    """
+    head, total = _fetch_range(url, 0, _POSTER_HEAD_BYTES - 1)
+    fd, tmp_path = tempfile.mkstemp(suffix=".mp4", prefix="poster_")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(head)
+            is_mp4 = head[4:8] == b"ftyp"
+            tail_offset = _mp4_tail_offset(head, total) if is_mp4 and total else None
+            if tail_offset is not None:
+                if total - tail_offset > _POSTER_MAX_TAIL_BYTES:
+                    raise ValueError("moov 位于文件末尾且过大")
+                tail, _total = _fetch_range(url, tail_offset, total - 1)
+                fh.seek(tail_offset)
+                fh.write(tail)
+            if total:
+                fh.truncate(total)
+
+        if seconds > 0 and total and len(head) < total:
+            duration = _video_duration(tmp_path)
+            if duration:
+                # 多取 20%，避免估算偏差导致目标帧落在未下载区域
+                limit = tail_offset if tail_offset is not None else total
+                needed = min(limit, _POSTER_MAX_BYTES, int(total * min(1.0, seconds / duration * 1.2)) + _POSTER_HEAD_BYTES)
+                if needed > len(head):
+                    more, _total = _fetch_range(url, len(head), needed - 1)
+                    with open(tmp_path, "r+b") as fh:
+                        fh.seek(len(head))
+                        fh.write(more)
+
+        frame = _thumb_executor.submit(_read_video_frame, tmp_path, seconds).result()
+        if frame is None:
+            raise ValueError("无法读取视频帧")
+        return frame
+    finally:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+@app.route("/api/video_poster")
+def video_poster():
+    """
+    视频封面帧（JPEG），用于预览时代替加载完整 MP4。
+    参数:
+      url — 视频地址（必填）
+      t   — 取帧时间（秒，默认 0 即第一帧）
+      w   — 输出宽度（可选，按缩略图档位取整）
+    """
+    url = request.args.get("url", "").strip()
+    if not url or not (url.startswith("http://") or url.startswith("https://")):
+        return jsonify({"code": -1, "message": "缺少或错误的url参数"}), 400
+    try:
+        seconds = max(0.0, float(request.args.get("t", "0") or 0))
+    except ValueError:
+        return jsonify({"code": -1, "message": "t 参数必须是秒数"}), 400
+    width = _int_arg("w")
+    width = _thumb_width(width) if width else 0
+
+    key = hashlib.sha256(f"{url}|t={seconds:.3f}|w={width}".encode("utf-8")).hexdigest()
+    cached = _poster_cache.get(key)
+    if cached:
+        return _serve_cached_image(cached)
+
+    def _build():
+        frame = _extract_poster(url, seconds)
+        if width:
+            frame = _resize_to_width(frame, width)
+        ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, THUMB_QUALITY])
+        if not ok:
+            raise ValueError("封面编码失败")
+        stem = os.path.splitext(_proxy_filename(url, "video/mp4"))[0]
+        _poster_cache.put_bytes(key, encoded.tobytes(), {
+            "key": key,
+            "url": url,
+            "seconds": seconds,
+            "content_type": "image/jpeg",
+            "filename": f"{stem}_poster.jpg",
+        })
+        LOGGER.info(f"视频封面帧已生成: {url} (t={seconds:g}s)")
+        return _poster_cache.get(key)
+
+    try:
+        meta = _single_flight.do(f"poster:{key}", _build)
+    except Exception as e:
+        LOGGER.warning(f"视频封面帧生成失败: {url} | {e}")
+        return jsonify({"code": -1, "message": "视频封面帧生成失败"}), 502
+    return _serve_cached_image(meta)
+
+
+# ====== 表情包拼图服务端切分 ======
+
+EMOJI_CACHE_MAX_BYTES = int(os.environ.get("BILI_EMOJI_CACHE_MB", "128")) * 1024 * 1024
+# 与前端原 splitEmojiSheet 保持一致的阈值
+_EMOJI_ALPHA_THRESHOLD = 30
+_EMOJI_PAD = 1
+_EMOJI_KEY_RE = re.compile(r"^[0-9a-f]{64}$")
+
+# 每张拼图的切分结果缓存为一个 ZIP（tiles 存储为 1.png、2.png ...），元数据中记录每块的位置
+_emoji_cache = DiskLRUCache(_cache_dir("emoji_tiles"), EMOJI_CACHE_MAX_BYTES)
+
+
+def _true_runs(flags):
+    """返回布尔数组中连续 True 区间的 [(start, end), ...]（end 含）。"""
+    padded = np.concatenate(([0], flags.astype(np.int8), [0]))
+    diff = np.diff(padded)
+    starts = np.flatnonzero(diff == 1)
+    ends = np.flatnonzero(diff == -1) - 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def _split_emoji_sheet(content: bytes) -> list:
+    """
+    用 alpha 通道的行/列投影切分表情包拼图，返回 [{"x", "y", "w", "h", "png"}, ...]。
+    先按行投影找出表情行，再在每一行内按列投影找出单个表情；
+    透明区域超过 70% 或只有白色像素的块（文字、分隔线等）会被过滤掉。
+    """
+    image = cv2.imdecode(np.frombuffer(content, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise ValueError("无法解码图片")
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGRA)
+    elif image.shape[2] == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
+    height, width = image.shape[:2]
+    opaque = image[:, :, 3] > _EMOJI_ALPHA_THRESHOLD
+
+    tiles = []
+    for top, bottom in _true_runs(opaque.any(axis=1)):
+        for left, right in _true_runs(opaque[top:bottom + 1].any(axis=0)):
+            x0, y0 = max(0, left - _EMOJI_PAD), max(0, top - _EMOJI_PAD)
+            x1, y1 = min(width, right + 1 + _EMOJI_PAD), min(height, bottom + 1 + _EMOJI_PAD)
+            tile = image[y0:y1, x0:x1]
+            alpha = tile[:, :, 3]
+            visible = alpha >= _EMOJI_ALPHA_THRESHOLD
+            white = (tile[:, :, :3] > 240).all(axis=2)
+            if (~visible).mean() >= 0.7 or not (visible & ~white).any():
+                continue
+            ok, encoded = cv2.imencode(".png", tile)
+            if ok:
+                tiles.append({"x": left, "y": top, "w": x1 - x0, "h": y1 - y0, "png": encoded.tobytes()})
+    return tiles
+
+
+def _emoji_tiles(url: str, refresh: bool = False) -> dict:
+    """返回拼图切分结果的缓存元数据（含 ZIP 路径），未缓存时下载并切分。"""
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    if not refresh:
+        cached = _emoji_cache.get(key)
+        if cached:
+            return cached
+
+    def _build():
+        tiles = _split_emoji_sheet(_fetch_image_bytes(url))
+        tmp_path = _emoji_cache.tmp_path(key)
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_STORED) as zf:
+            for index, tile in enumerate(tiles, 1):
+                zf.writestr(f"{index}.png", tile.pop("png"))
+        meta = {"key": key, "url": url, "tiles": tiles, "created_at": time.time()}
+        _emoji_cache.commit(key, tmp_path, meta)
+        LOGGER.info(f"表情包拼图切分完成: {len(tiles)} 个, url={url}")
+        return _emoji_cache.get(key)
+
+    return _single_flight.do(f"emoji:{key}", _build)
+
+
+@app.route("/api/emoji_tiles")
+def emoji_tiles():
+    """
+    服务端切分表情包拼图。
+    参数:
+      url     — 拼图图片地址（必填）
+      refresh — 为 1 时重新下载并切分（可选）
+    返回每个表情的位置与图片地址，以及打包好的 ZIP 地址。
+    """
+    url = request.args.get("url", "").strip()
+    if not url or not (url.startswith("http://") or url.startswith("https://")):
+        return jsonify({"code": -1, "message": "缺少或错误的url参数"}), 400
+    try:
+        meta = _emoji_tiles(url, refresh=_is_refresh_requested())
+    except Exception as e:
+        LOGGER.error(f"表情包拼图切分失败: {url} | {e}", exc_info=True)
+        return jsonify({"code": -1, "message": "表情包拼图切分失败"}), 502
+
+    key = meta["key"]
+    tiles = [
+        {**tile, "index": index, "url": f"/api/emoji_tiles/{key}/{index}.png"}
+        for index, tile in enumerate(meta["tiles"], 1)
+    ]
+    return jsonify({"code": 0, "data": {
+        "key": key,
+        "count": len(tiles),
+        "tiles": tiles,
+        "zip": f"/api/emoji_tiles/{key}.zip",
+    }})
+
+
+def _emoji_cached_meta(key: str):
+    if not _EMOJI_KEY_RE.match(key):
+        return None
+    return _emoji_cache.get(key)
+
+
+@app.route("/api/emoji_tiles/<key>/<int:index>.png")
+def emoji_tile(key, index):
+    """返回单个表情图片（需先通过 /api/emoji_tiles 生成）。"""
+    meta = _emoji_cached_meta(key)
+    if not meta or not 1 <= index <= len(meta["tiles"]):
+        return jsonify({"code": -1, "message": "表情不存在或缓存已过期"}), 404
+    with zipfile.ZipFile(meta["path"]) as zf:
+        content = zf.read(f"{index}.png")
+    return Response(content, content_type="image/png", headers={
+        "Cache-Control": f"public, max-age={PROXY_BROWSER_MAX_AGE}",
+        "Content-Disposition": _content_disposition(f"{index}.png"),
+    })
+
+
+@app.route("/api/emoji_tiles/<key>.zip")
+def emoji_tiles_zip(key):
+    """下载全部表情的 ZIP；name 参数指定下载文件名（不含扩展名）。"""
+    meta = _emoji_cached_meta(key)
+    if not meta:
+        return jsonify({"code": -1, "message": "表情不存在或缓存已过期"}), 404
+    name = _sanitize_name(request.args.get("name", ""), "表情包")
+    response = send_file(meta["path"], mimetype="application/zip", conditional=True)
+    response.headers["Content-Disposition"] = _content_disposition(f"{name}.zip", "attachment")
+    return response
+
+
 # ====== 日志管理（与 main.py 保持一致）======
 
 class LazyErrorHandler(logging.Handler):
@@ -299,22 +1292,417 @@ def setup_logger(app_name: str, log_dir="logs"):
 LOGGER = setup_logger(APP_NAME)
 
 
+# ====== 常驻事件循环（bilibili_api 协程统一在此执行）======
+
+# bilibili_api 按事件循环缓存 HTTP 客户端；所有协程都在同一个循环里执行，即可共享连接池与 keep-alive
+BILI_API_MAX_CONNECTIONS = int(os.environ.get("BILI_API_MAX_CONNECTIONS", "20"))
+_ASYNC_CALL_TIMEOUT = 30
+
+
+class AsyncLoopThread:
+    """
+    在后台守护线程中运行一个常驻 asyncio 事件循环。
+    Flask 请求线程通过 run() 提交协程并阻塞等待结果，取代每次调用 bilibili_api.sync()。
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is not None:
+                return self._loop
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def _runner():
+                asyncio.set_event_loop(loop)
+                ready.set()
+                loop.run_forever()
+
+            threading.Thread(target=_runner, name="bili-async-loop", daemon=True).start()
+            ready.wait()
+            asyncio.run_coroutine_threadsafe(self._install_client(), loop).result()
+            self._loop = loop
+            return loop
+
+    @staticmethod
+    async def _install_client():
+        """为该事件循环安装带连接池上限的 httpx 客户端，所有 bilibili_api 请求共用。"""
+        select_client("httpx")
+        # set_session 要求当前循环已有客户端，先让库创建默认客户端再替换掉
+        await get_client().close()
+        set_session(httpx.AsyncClient(
+            timeout=httpx.Timeout(15.0),
+            limits=httpx.Limits(
+                max_connections=BILI_API_MAX_CONNECTIONS,
+                max_keepalive_connections=BILI_API_MAX_CONNECTIONS,
+            ),
+        ))
+
+    def run(self, coro, timeout=_ASYNC_CALL_TIMEOUT):
+        """提交协程并等待结果，协程中的异常原样抛出；超时视为网络错误。"""
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise NetworkException(-1, f"请求超时（{timeout}s）")
+
+
+_async_loop = AsyncLoopThread()
+
+
+def _run_async(coro, timeout=_ASYNC_CALL_TIMEOUT):
+    """在常驻事件循环中执行 bilibili_api 协程并返回结果"""
+    return _async_loop.run(coro, timeout)
+
+
+# ====== 收藏集元数据缓存（TTL + LRU，可持久化）======
+
+# 收藏集发布后 act/basic 与 lottery 详情几乎不变，默认缓存 1 天；act/basic 的分组列表可能追加，缓存 6 小时
+METADATA_CACHE_TTL = int(os.environ.get("BILI_META_CACHE_TTL", str(24 * 3600)))
+METADATA_CACHE_ACT_TTL = int(os.environ.get("BILI_META_CACHE_ACT_TTL", str(6 * 3600)))
+METADATA_CACHE_MAX_ITEMS = int(os.environ.get("BILI_META_CACHE_MAX_ITEMS", "2000"))
+METADATA_CACHE_PERSIST = os.environ.get("BILI_META_CACHE_PERSIST", "1") != "0"
+
+
+class TTLCache:
+    """
+    线程安全的 TTL + LRU 缓存。
+    超过 max_items 时淘汰最久未使用的条目；指定 persist_path 时变更会延迟批量写入磁盘，
+    启动时自动加载未过期的条目。
+    """
+
+    _FLUSH_DELAY = 5.0
+
+    def __init__(self, max_items, ttl, persist_path=""):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.persist_path = persist_path
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._flush_timer = None
+        if persist_path:
+            self._load()
+
+    def get(self, key):
+        """返回缓存值，未命中或已过期时返回 None。"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.time() + (ttl or self.ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+        self._schedule_flush()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+        self._schedule_flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_items": self.max_items,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }
+
+    def _load(self):
+        if not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                items = json.load(f)
+            now = time.time()
+            for key, expires_at, value in items[-self.max_items:]:
+                if expires_at > now:
+                    self._data[key] = (expires_at, value)
+        except Exception:
+            LOGGER.warning(f"读取元数据缓存失败: {self.persist_path}", exc_info=True)
+
+    def _schedule_flush(self):
+        if not self.persist_path:
+            return
+        with self._lock:
+            if self._flush_timer is not None:
+                return
+            self._flush_timer = threading.Timer(self._FLUSH_DELAY, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush(self):
+        """把缓存写入磁盘（先写临时文件再替换，避免中途退出损坏文件）。"""
+        with self._lock:
+            self._flush_timer = None
+            items = [[key, expires_at, value] for key, (expires_at, value) in self._data.items()]
+        try:
+            tmp_path = self.persist_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(items, f, ensure_ascii=False)
+            os.replace(tmp_path, self.persist_path)
+        except Exception:
+            LOGGER.warning(f"写入元数据缓存失败: {self.persist_path}", exc_info=True)
+
+
+def _metadata_cache_path():
+    logs_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+    os.makedirs(logs_dir, exist_ok=True)
+    return os.path.join(logs_dir, "metadata_cache.json")
+
+
+_metadata_cache = TTLCache(
+    METADATA_CACHE_MAX_ITEMS,
+    METADATA_CACHE_TTL,
+    _metadata_cache_path() if METADATA_CACHE_PERSIST else "",
+)
+if METADATA_CACHE_PERSIST:
+    atexit.register(_metadata_cache.flush)
+
+
+# ====== act_id 不存在结果缓存（分代稀疏位图）======
+
+# 已确认不存在的 act_id 在该时间内不再重复查询（新收藏集可能占用之前不存在的 ID，不宜过长）
+NEGATIVE_CACHE_TTL = int(os.environ.get("BILI_NEGATIVE_CACHE_TTL", str(24 * 3600)))
+
+
+class NegativeIdCache:
+    """
+    已确认不存在的 act_id 集合，按代分桶的稀疏位图。
+    - act_id 空间按 4096 个 ID 切块，每块 512 字节，只为出现过的块分配内存
+    - 每 TTL/8 开启新的一代，查询只看未过期的代，过期的代整块丢弃（过期精度为一代）
+    - 变化的块由后台定时线程批量写入 SQLite，进程退出时也会写回；
+      add/discard 会在事件循环线程中调用，只改内存，不在锁内做磁盘 IO
+    """
+
+    BLOCK_BITS = 4096
+    GENERATIONS = 8
+    FLUSH_BLOCKS = 256
+    FLUSH_INTERVAL = 30.0
+
+    def __init__(self, db_path: str, ttl: int):
+        self.ttl = ttl
+        self.gen_seconds = max(60, ttl // self.GENERATIONS)
+        self._blocks = {}  # (代, 块号) → bytearray
+        self._dirty = set()
+        self._flush_timer = None
+        self._lock = threading.Lock()
+        # 串行化 SQLite 写入；先取 _db_lock 再取 _lock，写盘期间不占用 _lock
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS blocks (
+                gen   INTEGER NOT NULL,
+                block INTEGER NOT NULL,
+                bits  BLOB NOT NULL,
+                PRIMARY KEY (gen, block)
+            )
+        """)
+        self._conn.commit()
+        oldest = self._oldest_gen()
+        for gen, block, bits in self._conn.execute("SELECT gen, block, bits FROM blocks WHERE gen >= ?", (oldest,)):
+            self._blocks[(gen, block)] = bytearray(bits)
+
+    def _current_gen(self) -> int:
+        return int(time.time() // self.gen_seconds)
+
+    def _oldest_gen(self) -> int:
+        # 一代内最早写入的记录也不会超过 TTL
+        return int((time.time() - self.ttl) // self.gen_seconds) + 1
+
+    def contains(self, act_id: int) -> bool:
+        block, bit = divmod(int(act_id), self.BLOCK_BITS)
+        with self._lock:
+            for gen in range(self._oldest_gen(), self._current_gen() + 1):
+                bits = self._blocks.get((gen, block))
+                if bits is not None and bits[bit >> 3] & (1 << (bit & 7)):
+                    return True
+        return False
+
+    def add(self, act_id: int):
+        block, bit = divmod(int(act_id), self.BLOCK_BITS)
+        key = (self._current_gen(), block)
+        with self._lock:
+            bits = self._blocks.get(key)
+            if bits is None:
+                bits = self._blocks[key] = bytearray(self.BLOCK_BITS // 8)
+            bits[bit >> 3] |= 1 << (bit & 7)
+            self._dirty.add(key)
+            self._schedule_flush()
+
+    def discard(self, act_id: int):
+        """act_id 已存在时从所有代中移除。"""
+        block, bit = divmod(int(act_id), self.BLOCK_BITS)
+        with self._lock:
+            for key, bits in self._blocks.items():
+                if key[1] == block and bits[bit >> 3] & (1 << (bit & 7)):
+                    bits[bit >> 3] &= ~(1 << (bit & 7)) & 0xFF
+                    self._dirty.add(key)
+            if self._dirty:
+                self._schedule_flush()
+
+    def _schedule_flush(self):
+        """调用方需持有 _lock。变化的块攒够 FLUSH_BLOCKS 时立即在后台写回，否则最多延迟 FLUSH_INTERVAL。"""
+        urgent = len(self._dirty) >= self.FLUSH_BLOCKS
+        timer = self._flush_timer
+        if timer is not None:
+            if not urgent or timer.interval == 0:
+                return
+            timer.cancel()
+        self._flush_timer = threading.Timer(0 if urgent else self.FLUSH_INTERVAL, self.flush)
+        self._flush_timer.daemon = True
+        self._flush_timer.start()
+
+    def flush(self):
+        """写回变化的块，并删除过期的代。"""
+        with self._db_lock:
+            with self._lock:
+                if self._flush_timer is not None:
+                    self._flush_timer.cancel()
+                    self._flush_timer = None
+                oldest = self._oldest_gen()
+                for key in [key for key in self._blocks if key[0] < oldest]:
+                    del self._blocks[key]
+                rows = [(gen, block, bytes(self._blocks[(gen, block)]))
+                        for gen, block in self._dirty if (gen, block) in self._blocks]
+                self._dirty.clear()
+            try:
+                self._conn.executemany("INSERT OR REPLACE INTO blocks (gen, block, bits) VALUES (?, ?, ?)", rows)
+                self._conn.execute("DELETE FROM blocks WHERE gen < ?", (oldest,))
+                self._conn.commit()
+            except sqlite3.Error:
+                LOGGER.warning("写入 act_id 不存在缓存失败", exc_info=True)
+
+    def clear(self):
+        with self._db_lock:
+            with self._lock:
+                self._blocks.clear()
+                self._dirty.clear()
+            self._conn.execute("DELETE FROM blocks")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            oldest = self._oldest_gen()
+            live = {}
+            for (gen, block), bits in self._blocks.items():
+                if gen >= oldest:
+                    merged = live.get(block, 0)
+                    live[block] = merged | int.from_bytes(bits, "little")
+            return {
+                "ttl": self.ttl,
+                "generation_seconds": self.gen_seconds,
+                "count": sum(bin(bits).count("1") for bits in live.values()),
+                "blocks": len(self._blocks),
+                "bytes": len(self._blocks) * self.BLOCK_BITS // 8,
+            }
+
+
+def _negative_cache_path():
+    logs_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+    os.makedirs(logs_dir, exist_ok=True)
+    return os.path.join(logs_dir, "negative_act_ids.db")
+
+
+_negative_act_ids = NegativeIdCache(_negative_cache_path(), NEGATIVE_CACHE_TTL)
+atexit.register(_negative_act_ids.flush)
+
+
+def _is_refresh_requested() -> bool:
+    """请求参数 refresh=1 时跳过缓存，强制向 B站重新查询（结果仍会写回缓存）。"""
+    return request.args.get("refresh", "").strip().lower() in ("1", "true", "yes")
+
+
+def _get_act_info(act_id: str, refresh: bool = False) -> dict:
+    """
+    获取 act/basic 信息（带缓存）。缓存未命中时经 act_basic 令牌桶限速后请求，
+    并发的相同 act_id 请求只会向 B站发出一次。
+    ResponseCodeException / NetworkException 原样抛出，错误结果不写入缓存。
+    """
+    key = f"act:{act_id}"
+    if not refresh:
+        cached = _metadata_cache.get(key)
+        if cached is not None:
+            return cached
+    return _single_flight.do(key, lambda: _request_act_info(act_id))
+
+
+def _request_act_info(act_id: str) -> dict:
+    _bili_rate_limit("act_basic")
+    try:
+        info = _run_async(DLC(int(act_id)).get_info())
+    except ResponseCodeException:
+        _bili_report("act_basic")
+        raise
+    except NetworkException as e:
+        if _is_412_error(e):
+            _bili_report("act_basic", throttled=True)
+        raise
+    _bili_report("act_basic")
+    _metadata_cache.set(f"act:{act_id}", info, ttl=METADATA_CACHE_ACT_TTL)
+    return info
+
+
+def _get_lottery_detail(act_id: str, lottery_id: str, refresh: bool = False) -> dict:
+    """获取收藏集分组详情（带缓存），异常处理约定同 _get_act_info。"""
+    key = f"detail:{act_id}:{lottery_id}"
+    if not refresh:
+        cached = _metadata_cache.get(key)
+        if cached is not None:
+            return cached
+    return _single_flight.do(key, lambda: _request_lottery_detail(act_id, lottery_id))
+
+
+def _request_lottery_detail(act_id: str, lottery_id: str) -> dict:
+    _bili_rate_limit("garb_detail")
+    api = _GARB_API["dlc"]["detail"]
+    try:
+        data = _run_async(
+            Api(**api).update_params(act_id=int(act_id), lottery_id=int(lottery_id)).result
+        )
+    except NetworkException as e:
+        if _is_412_error(e):
+            _bili_report("garb_detail", throttled=True)
+        raise
+    _bili_report("garb_detail")
+    _metadata_cache.set(f"detail:{act_id}:{lottery_id}", data)
+    return data
+
+
 # ====== 通过 bilibili-api 库查询收藏集分组参数 ======
 
-def get_lottery_params_by_act_id(act_id):
+def get_lottery_params_by_act_id(act_id, refresh=False):
     """
     调用 bilibili-api 库的 DLC.get_info()，根据 act_id 获取该活动下所有分组的 lottery_id。
-    使用 /x/vas/dlc_act/act/basic 接口，无需凭据或浏览器依赖。
+    使用 /x/vas/dlc_act/act/basic 接口，无需凭据或浏览器依赖；结果带缓存，refresh=True 时强制重新查询。
     返回: (params_list, error_message)
       - 成功: ([{"act_id": ..., "lottery_id": ...}, ...], None)
       - 失败: (None, "错误说明")
     """
     try:
-        # 限速：bilibili_api 内部也有自己的网络层，加延迟减少 412
-        _bili_rate_limit()
         LOGGER.info(f"正在查询收藏集信息: act_id={act_id}")
-        dlc = DLC(int(act_id))
-        info = sync(dlc.get_info())
+        info = _get_act_info(str(act_id), refresh=refresh)
 
         lottery_list = info.get("lottery_list") or []
         if not lottery_list:
@@ -360,18 +1748,36 @@ _BILI_FETCH_HEADERS = {
 }
 
 
-def _fetch_suit_components(item_id: int) -> list:
+def _fetch_suit_components(item_id: int, refresh: bool = False) -> list:
     """
-    调用 B 站装扮组件接口查询表情包等附加资源。
+    调用 B 站装扮组件接口查询表情包等附加资源（带缓存，请求失败的结果不缓存）。
     https://api.bilibili.com/x/garb/v2/user/suit/benefit?item_id={id}&part=emoji_package
     返回: [{"type": "emoji", "name": ..., "images": {"static": ..., "gif": ...}}, ...]
     """
+    key = f"suit:{item_id}"
+    if not refresh:
+        cached = _metadata_cache.get(key)
+        if cached is not None:
+            return cached
+    items = _single_flight.do(key, lambda: _request_suit_components(item_id))
+    if items is None:
+        return []
+    _metadata_cache.set(key, items)
+    return items
+
+
+def _request_suit_components(item_id: int):
+    """请求装扮组件接口，返回表情包列表；网络错误或风控时返回 None。"""
     try:
-        _bili_rate_limit()
+        _bili_rate_limit("suit_benefit")
         url = f"https://api.bilibili.com/x/garb/v2/user/suit/benefit?item_id={item_id}&part=emoji_package"
         resp = _bili_session.get(url, timeout=10)
+        if _is_412_response(resp):
+            _bili_report("suit_benefit", throttled=True)
+            return None
+        _bili_report("suit_benefit")
         if resp.status_code != 200:
-            return []
+            return None
         data = resp.json()
         if data.get("code") != 0 or not data.get("data"):
             return []
@@ -410,7 +1816,7 @@ def _fetch_suit_components(item_id: int) -> list:
         return items
     except Exception:
         LOGGER.warning(f"获取表情包失败: item_id={item_id}", exc_info=True)
-        return []
+        return None
 
 
 @app.route("/")
@@ -433,20 +1839,17 @@ def fetch():
         LOGGER.warning(f"参数格式错误: act_id={act_id!r}, lottery_id={lottery_id!r}")
         return jsonify({"code": -1, "message": "act_id 和 lottery_id 必须为数字"}), 400
 
+    refresh = _is_refresh_requested()
     try:
-        # 限速
-        _bili_rate_limit()
         LOGGER.info(f"通过 bilibili-api 获取收藏集详情: act_id={act_id}, lottery_id={lottery_id}")
-        api = _GARB_API["dlc"]["detail"]
-        data = sync(
-            Api(**api).update_params(act_id=int(act_id), lottery_id=int(lottery_id)).result
-        )
+        # 复制一份再附加表情包，避免修改缓存中的对象
+        data = dict(_get_lottery_detail(act_id, lottery_id, refresh=refresh))
         LOGGER.info(f"收藏集详情获取成功: act_id={act_id}, lottery_id={lottery_id}")
 
         # 如果提供了 goods_id，尝试获取表情包等附加资源
         if goods_id and goods_id.isdigit():
             try:
-                emoji_items = _fetch_suit_components(int(goods_id))
+                emoji_items = _fetch_suit_components(int(goods_id), refresh=refresh)
                 if emoji_items:
                     data["_emoji_packages"] = emoji_items
                     LOGGER.info(f"获取到 {len(emoji_items)} 个表情包: act_id={act_id}")
@@ -470,7 +1873,8 @@ def get_params():
     """
     根据 act_id 通过 bilibili-api 库查询收藏集基本信息，返回所有分组的 lottery_id。
     参数:
-      act_id — 活动 ID（必填）
+      act_id  — 活动 ID（必填）
+      refresh — 为 1 时跳过缓存（可选）
     使用 /x/vas/dlc_act/act/basic 接口，无需凭据或浏览器依赖。
     """
     act_id = request.args.get("act_id", "").strip()
@@ -485,7 +1889,7 @@ def get_params():
         LOGGER.warning(f"/api/get_params act_id 格式错误: {act_id!r}")
         return jsonify({"code": -1, "message": "act_id 必须为数字"}), 400
 
-    params_list, error = get_lottery_params_by_act_id(act_id)
+    params_list, error = get_lottery_params_by_act_id(act_id, refresh=_is_refresh_requested())
     if error:
         LOGGER.error(f"获取 lottery 列表失败: {error}")
         return jsonify({"code": -1, "message": error}), 500
@@ -514,7 +1918,7 @@ def search_collections():
         "https://api.bilibili.com/x/garb/v2/mall/home/search"
         f"?key_word={quote(key_word)}&pn={page}"
     )
-    raw, error = bili_request(url, timeout=12, max_retry=3)
+    raw, error = bili_request(url, timeout=12, max_retry=3, rate_class="search")
     if error:
         LOGGER.error(f"搜索收藏集失败: {error}")
         return jsonify({"code": -1, "message": error}), 502
@@ -559,56 +1963,164 @@ def search_collections():
     return jsonify({"code": 0, "data": result_list})
 
 
-def _available_act_ids_path():
-    logs_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
-    os.makedirs(logs_dir, exist_ok=True)
-    return os.path.join(logs_dir, "available_act_ids.json")
+class ActIdStore:
+    """
+    可用 act_id 记录（SQLite + WAL），act_id 为主键，单条 upsert 为 O(log n)。
+    首次启动时自动导入旧版 logs/available_act_ids.json。
+    """
 
+    PAGE_SIZE_MAX = 5000
+
+    def __init__(self, db_path: str, legacy_json_path: str = ""):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # act_ids 表结构与写入方法在 act_ids.py 中，与 check_exist.py 共用
+        self._conn.executescript(ACT_IDS_DDL + """
+            CREATE TABLE IF NOT EXISTS meta (
+                key   TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+        self._conn.commit()
+        if legacy_json_path:
+            self._import_legacy_json(legacy_json_path)
+
+    def _import_legacy_json(self, path: str):
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = 'json_imported'").fetchone():
+                return
+            items = []
+            if os.path.exists(path):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                    items = [item for item in data if isinstance(item, dict)] if isinstance(data, list) else []
+                except Exception:
+                    LOGGER.warning("读取旧版可用 act_id 记录失败", exc_info=True)
+            count = self.bulk_upsert(items)
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_imported', ?)", (path,))
+            self._conn.commit()
+        if count:
+            LOGGER.info(f"已从 {path} 导入 {count} 条可用 act_id 记录")
+
+    def bulk_upsert(self, items) -> int:
+        """
+        批量写入 [{"act_id", "name", "created_at"?, "updated_at"?}, ...]，单个事务提交。
+        已存在的记录只更新时间，name 非空时同时更新名称。返回有效条目数。
+        """
+        with self._lock:
+            count = upsert_act_ids(self._conn, items)
+            self._conn.commit()
+        return count
+
+    def upsert(self, act_id: str, name: str = "") -> int:
+        return self.bulk_upsert([{"act_id": act_id, "name": name}])
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM act_ids").fetchone()[0]
+
+    def query(self, name: str = "", start=None, end=None, since: str = "", until: str = "",
+              offset: int = 0, limit: int = 500):
+        """
+        分页查询，按 act_id 升序。
+        name — 名称包含的关键字；start/end — act_id 区间；since/until — 按 updated_at 过滤的日期。
+        返回 (items, total)。
+        """
+        where, args = [], []
+        if name:
+            where.append("name LIKE ? ESCAPE '\\'")
+            args.append("%" + re.sub(r"([%_\\])", r"\\\1", name) + "%")
+        if start is not None:
+            where.append("act_id >= ?")
+            args.append(start)
+        if end is not None:
+            where.append("act_id <= ?")
+            args.append(end)
+        if since:
+            where.append("updated_at >= ?")
+            args.append(since)
+        if until:
+            # 只给出日期时包含当天全部记录
+            where.append("updated_at <= ?")
+            args.append(until + " 23:59:59" if len(until) == 10 else until)
+        clause = ("WHERE " + " AND ".join(where)) if where else ""
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM act_ids {clause}", args).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT act_id, name, created_at, updated_at FROM act_ids {clause} "
+                f"ORDER BY act_id LIMIT ? OFFSET ?",
+                (*args, limit, offset),
+            ).fetchall()
+        items = [
+            {"act_id": str(row[0]), "name": row[1], "created_at": row[2], "updated_at": row[3]}
+            for row in rows
+        ]
+        return items, total
+
+
+_act_id_store = None
+_act_id_store_lock = threading.Lock()
+
+
+def _get_act_id_store() -> ActIdStore:
+    global _act_id_store
+    with _act_id_store_lock:
+        if _act_id_store is None:
+            logs_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+            os.makedirs(logs_dir, exist_ok=True)
+            _act_id_store = ActIdStore(
+                os.path.join(logs_dir, "available_act_ids.db"),
+                legacy_json_path=os.path.join(logs_dir, "available_act_ids.json"),
+            )
+        return _act_id_store
 
-def _read_available_act_ids():
-    path = _available_act_ids_path()
-    if not os.path.exists(path):
-        return []
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        if isinstance(data, list):
-            return [item for item in data if isinstance(item, dict) and str(item.get("act_id", "")).isdigit()]
-    except Exception:
-        LOGGER.warning("读取可用 act_id 记录失败", exc_info=True)
-    return []
+
+def _int_arg(name: str):
+    value = request.args.get(name, "").strip()
+    return int(value) if value.isdigit() else None
 
 
 @app.route("/api/available_act_ids", methods=["GET", "POST"])
 def available_act_ids():
-    """读取或追加扫描确认可用的 act_id。"""
+    """
+    GET  — 分页查询可用 act_id
+      name       — 名称关键字（可选）
+      start/end  — act_id 区间（可选）
+      since/until — 最近确认日期区间，格式 YYYY-MM-DD（可选）
+      page       — 页码，从 1 开始（默认 1）
+      page_size  — 每页条数（默认 500，最大 5000）
+    POST — 追加或更新，JSON: {"act_id": ..., "name": ...} 或批量 {"items": [{"act_id", "name"}, ...]}
+    """
+    store = _get_act_id_store()
     if request.method == "GET":
-        return jsonify({"code": 0, "data": _read_available_act_ids()})
+        page = max(_int_arg("page") or 1, 1)
+        page_size = min(max(_int_arg("page_size") or 500, 1), ActIdStore.PAGE_SIZE_MAX)
+        items, total = store.query(
+            name=request.args.get("name", "").strip(),
+            start=_int_arg("start"),
+            end=_int_arg("end"),
+            since=request.args.get("since", "").strip(),
+            until=request.args.get("until", "").strip(),
+            offset=(page - 1) * page_size,
+            limit=page_size,
+        )
+        return jsonify({"code": 0, "data": items, "total": total, "page": page, "page_size": page_size})
 
     payload = request.get_json(silent=True) or {}
+    if isinstance(payload.get("items"), list):
+        written = store.bulk_upsert(item for item in payload["items"] if isinstance(item, dict))
+        return jsonify({"code": 0, "data": {"written": written, "count": store.count()}})
+
     act_id = str(payload.get("act_id") or "").strip()
     name = str(payload.get("name") or "").strip()
     if not act_id.isdigit() or act_id == "0":
         return jsonify({"code": -1, "message": "act_id 必须为正整数"}), 400
 
-    items = _read_available_act_ids()
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    found = False
-    for item in items:
-        if str(item.get("act_id")) == act_id:
-            if name:
-                item["name"] = name
-            item["updated_at"] = now
-            found = True
-            break
-    if not found:
-        items.append({"act_id": act_id, "name": name or act_id, "created_at": now, "updated_at": now})
-
-    items.sort(key=lambda item: int(item.get("act_id") or 0))
-    with open(_available_act_ids_path(), "w", encoding="utf-8") as f:
-        json.dump(items, f, ensure_ascii=False, indent=2)
-
-    return jsonify({"code": 0, "data": {"act_id": act_id, "count": len(items)}})
+    store.upsert(act_id, name)
+    return jsonify({"code": 0, "data": {"act_id": act_id, "count": store.count()}})
 
 
 _RESOLVE_HEADERS = {
@@ -631,13 +2143,150 @@ def check_login():
     return jsonify({"code": 0, "data": {"logged_in": logged_in}})
 
 
+@app.route("/api/rate_limits")
+def rate_limits():
+    """返回各类接口令牌桶的当前速率，便于观察风控退避情况。"""
+    return jsonify({"code": 0, "data": {name: limiter.snapshot() for name, limiter in _RATE_LIMITERS.items()}})
+
+
+def _check_act_id(act_id: str, refresh: bool = False) -> dict:
+    """
+    通过 DLC.get_info() 检查单个 act_id 是否存在，返回 {"act_id", "exists", "name"}。
+    B站返回错误码视为不存在；412 风控和网络错误以 NetworkException 抛出，由调用方处理。
+    已确认不存在的 act_id 在 NEGATIVE_CACHE_TTL 内直接返回，refresh=True 时重新查询。
+    """
+    if not refresh and _negative_act_ids.contains(int(act_id)):
+        return {"act_id": act_id, "exists": False, "name": "", "cached": True}
+    cached = None if refresh else _metadata_cache.get(f"act:{act_id}")
+    if cached is not None:
+        return _act_check_result(act_id, cached, fresh=False)
+    try:
+        # 上面已查过缓存，这里直接向 B站请求（仍经过 single flight 合并）
+        info = _get_act_info(act_id, refresh=True)
+    except ResponseCodeException as e:
+        LOGGER.warning(f"act_id={act_id} 不存在: code={e.code}, msg={e.msg}")
+        _negative_act_ids.add(int(act_id))
+        return {"act_id": act_id, "exists": False, "name": ""}
+    return _act_check_result(act_id, info)
+
+
+def _act_check_result(act_id: str, info: dict, fresh: bool = True) -> dict:
+    """
+    根据 act/basic 信息生成检查结果。
+    只有刚从 B站查询到的结果（fresh）才记录日志并更新不存在缓存，缓存命中不重复记录；
+    日志行格式见 act_ids.check_log_message，check_exist.py 据此解析。
+    """
+    lottery_list = info.get("lottery_list") or []
+    name = info.get("name") or info.get("title") or ""
+    exists = len(lottery_list) > 0
+    if fresh:
+        LOGGER.info(check_log_message(act_id, exists, name))
+        if exists:
+            _negative_act_ids.discard(int(act_id))
+        else:
+            _negative_act_ids.add(int(act_id))
+    return {"act_id": act_id, "exists": exists, "name": name if exists else ""}
+
+
+# 单次批量检查的最大 ID 数，以及每批同时向 B站发起的请求数
+CHECK_BULK_MAX = 100
+CHECK_BULK_CONCURRENCY = int(os.environ.get("BILI_CHECK_CONCURRENCY", "4"))
+
+
+async def _async_check_act_id(act_id: str, sem: asyncio.Semaphore, cache_metadata: bool = True) -> dict:
+    """
+    协程版 act_id 检查：拿到并发名额后再向 act_basic 令牌桶预约，避免提前积压大量预约。
+    412 风控和网络错误不抛出，以 {"act_id", "error"} 返回。
+    只有存在的收藏集才写入元数据缓存（不存在的由 _negative_act_ids 记录），cache_metadata=False 时都不写。
+    """
+    async with sem:
+        await asyncio.sleep(_RATE_LIMITERS["act_basic"].reserve())
+        try:
+            info = await DLC(int(act_id)).get_info()
+        except ResponseCodeException as e:
+            _bili_report("act_basic")
+            LOGGER.warning(f"act_id={act_id} 不存在: code={e.code}, msg={e.msg}")
+            _negative_act_ids.add(int(act_id))
+            return {"act_id": act_id, "exists": False, "name": ""}
+        except NetworkException as e:
+            if _is_412_error(e):
+                _bili_report("act_basic", throttled=True)
+                return {"act_id": act_id, "error": "B站风控拦截(412)", "throttled": True}
+            LOGGER.warning(f"检查 act_id={act_id} 网络错误: {e}")
+            return {"act_id": act_id, "error": "请求超时或网络错误"}
+        except Exception as e:
+            LOGGER.error(f"检查 act_id={act_id} 失败: {e}", exc_info=True)
+            return {"act_id": act_id, "error": "查询时发生错误"}
+    _bili_report("act_basic")
+    result = _act_check_result(act_id, info)
+    if cache_metadata and result["exists"]:
+        _metadata_cache.set(f"act:{act_id}", info, ttl=METADATA_CACHE_ACT_TTL)
+    return result
+
+
+def _check_act_ids(act_ids: list, refresh: bool = False, cache_metadata: bool = True) -> list:
+    """
+    批量检查 act_id，按输入顺序返回结果列表。
+    缓存命中（含已知不存在，结果带 "cached": true）的直接返回，
+    其余在常驻事件循环中并发查询，共用 act_basic 令牌桶。
+    区间扫描传入 cache_metadata=False，避免大量扫描结果挤掉元数据缓存中的合集/详情条目。
+    """
+    act_ids = list(dict.fromkeys(str(act_id) for act_id in act_ids))
+    results = {}
+    misses = []
+    for act_id in act_ids:
+        if not refresh and _negative_act_ids.contains(int(act_id)):
+            results[act_id] = {"act_id": act_id, "exists": False, "name": "", "cached": True}
+            continue
+        cached = None if refresh else _metadata_cache.get(f"act:{act_id}")
+        if cached is not None:
+            results[act_id] = _act_check_result(act_id, cached, fresh=False)
+        else:
+            misses.append(act_id)
+
+    if misses:
+        async def _gather():
+            sem = asyncio.Semaphore(CHECK_BULK_CONCURRENCY)
+            return await asyncio.gather(*[_async_check_act_id(act_id, sem, cache_metadata) for act_id in misses])
+
+        # 最坏情况下令牌桶降到最低速率，超时时间按此放宽
+        timeout = _ASYNC_CALL_TIMEOUT + len(misses) / _RATE_LIMITERS["act_basic"].min_rate
+        try:
+            for one in _run_async(_gather(), timeout=timeout):
+                results[one["act_id"]] = one
+        except NetworkException:
+            LOGGER.error(f"批量检查 act_id 超时: {len(misses)} 个")
+        for act_id in misses:
+            results.setdefault(act_id, {"act_id": act_id, "error": "请求超时"})
+    return [results[act_id] for act_id in act_ids]
+
+
+@app.route("/api/metadata_cache", methods=["GET", "DELETE"])
+def metadata_cache():
+    """GET 返回元数据缓存命中统计；DELETE 清空缓存。"""
+    if request.method == "DELETE":
+        _metadata_cache.clear()
+        LOGGER.info("元数据缓存已清空")
+    return jsonify({"code": 0, "data": _metadata_cache.stats()})
+
+
+@app.route("/api/negative_cache", methods=["GET", "DELETE"])
+def negative_cache():
+    """GET 返回“act_id 不存在”缓存统计；DELETE 清空该缓存。"""
+    if request.method == "DELETE":
+        _negative_act_ids.clear()
+        LOGGER.info("act_id 不存在缓存已清空")
+    return jsonify({"code": 0, "data": _negative_act_ids.stats()})
+
+
 @app.route("/api/check_act_id")
 def check_act_id():
     """
     快速检查单个 act_id 是否存在。
     使用 requests.Session + Cookie + 完整请求头 + 重试机制，避免 412 风控。
     参数:
-      act_id — 活动 ID（必填）
+      act_id  — 活动 ID（必填）
+      refresh — 为 1 时跳过缓存（可选）
     返回:
       {"code": 0, "data": {"act_id": "...", "exists": true/false, "name": "..."}}
       或 {"code": -1, "message": "..."}
@@ -650,30 +2299,9 @@ def check_act_id():
 
     # 使用 bilibili_api 的 DLC.get_info()（已内置必要请求头），配合限速防风控
     try:
-        _bili_rate_limit()
-        dlc = DLC(int(act_id))
-        info = sync(dlc.get_info())
-        lottery_list = info.get("lottery_list") or []
-        name = info.get("name") or info.get("title") or ""
-        exists = len(lottery_list) > 0
-        LOGGER.info(f"检查 act_id={act_id}: exists={exists}, name={name!r}")
-        return jsonify({
-            "code": 0,
-            "data": {
-                "act_id": act_id,
-                "exists": exists,
-                "name": name if exists else "",
-            }
-        })
-    except ResponseCodeException as e:
-        LOGGER.warning(f"act_id={act_id} 不存在: code={e.code}, msg={e.msg}")
-        return jsonify({
-            "code": 0,
-            "data": {"act_id": act_id, "exists": False, "name": ""}
-        })
+        return jsonify({"code": 0, "data": _check_act_id(act_id, refresh=_is_refresh_requested())})
     except NetworkException as e:
-        err_str = str(e)
-        if "412" in err_str or "状态码：412" in err_str:
+        if _is_412_error(e):
             LOGGER.error(f"B站风控拦截 (act_id={act_id}): 触发了 412 安全策略")
             return jsonify({"code": -1, "message": "B站风控拦截(412)，请求过于频繁，请稍后重试"}), 412
         LOGGER.error(f"网络请求失败 (act_id={act_id}): {e}")
@@ -683,6 +2311,316 @@ def check_act_id():
         return jsonify({"code": -1, "message": "查询时发生错误"}), 502
 
 
+def _bulk_act_id_args(source: dict):
+    """
+    从请求参数中解析待检查的 act_id 列表，支持:
+      act_ids / ids — 列表或逗号分隔的字符串
+      start + end 或 start + count — 连续区间
+    返回 (act_ids, error_message)。
+    """
+    raw = source.get("act_ids") or source.get("ids")
+    if raw:
+        values = raw.split(",") if isinstance(raw, str) else raw
+        if not isinstance(values, list):
+            return None, "act_ids 必须为数组"
+        act_ids = [str(value).strip() for value in values if str(value).strip()]
+        if not all(act_id.isdigit() for act_id in act_ids):
+            return None, "act_id 必须为数字"
+    else:
+        start = str(source.get("start") or "").strip()
+        end = str(source.get("end") or "").strip()
+        count = str(source.get("count") or "").strip()
+        if not start.isdigit() or not (end.isdigit() or count.isdigit()):
+            return None, "缺少参数 act_ids，或 start + end / start + count"
+        last = int(end) if end.isdigit() else int(start) + int(count) - 1
+        if last < int(start):
+            return None, "结束 act_id 不能小于起始 act_id"
+        if last - int(start) + 1 > CHECK_BULK_MAX:
+            return None, f"单次最多检查 {CHECK_BULK_MAX} 个 act_id"
+        act_ids = [str(act_id) for act_id in range(int(start), last + 1)]
+    if not act_ids:
+        return None, "act_id 列表为空"
+    if len(act_ids) > CHECK_BULK_MAX:
+        return None, f"单次最多检查 {CHECK_BULK_MAX} 个 act_id"
+    return act_ids, None
+
+
+@app.route("/api/check_act_ids", methods=["GET", "POST"])
+def check_act_ids():
+    """
+    批量检查 act_id 是否存在，单次最多 CHECK_BULK_MAX 个。
+    参数（GET 查询参数或 POST JSON）:
+      act_ids — ID 列表（GET 时为逗号分隔）；或 start + end / start + count 指定区间
+      refresh — 为 1/true 时跳过缓存（可选）
+    返回:
+      {"code": 0, "data": [{"act_id", "exists", "name"} | {"act_id", "error"}, ...], "found": 存在的数量}
+    存在的 act_id 会写入可用 act_id 记录。
+    """
+    source = request.args.to_dict() if request.method == "GET" else (request.get_json(silent=True) or {})
+    act_ids, error = _bulk_act_id_args(source)
+    if error:
+        return jsonify({"code": -1, "message": error}), 400
+
+    refresh = _is_refresh_requested() or str(source.get("refresh", "")).lower() in ("1", "true")
+    results = _check_act_ids(act_ids, refresh=refresh)
+    found = [one for one in results if one.get("exists")]
+    if found:
+        try:
+            _get_act_id_store().bulk_upsert(found)
+        except Exception:
+            LOGGER.warning(f"写入可用 act_id 失败: {len(found)} 条", exc_info=True)
+    return jsonify({"code": 0, "data": results, "found": len(found)})
+
+
+# ====== 服务端 act_id 批量扫描任务 ======
+
+SCAN_WORKERS = int(os.environ.get("BILI_SCAN_WORKERS", "4"))
+SCAN_MAX_RANGE = 100000
+_SCAN_MAX_RETRY = 3
+# 非 412 的网络错误重试前等待 1s、2s、4s…（412 已由令牌桶退避）
+_SCAN_RETRY_BACKOFF = 1.0
+# 每个扫描分片包含的 act_id 数，分片内通过 _check_act_ids 并发查询
+_SCAN_PAGE_SIZE = 20
+# 命中结果攒够一批再写入 act_id 记录
+_SCAN_SAVE_BATCH = 20
+
+# 所有扫描任务共用一个线程池，实际速率由 act_basic 令牌桶决定
+_scan_executor = ThreadPoolExecutor(max_workers=SCAN_WORKERS, thread_name_prefix="scan")
+
+# 已结束的扫描/整合集下载任务在内存中保留的时间，过期后查询返回 404
+JOB_RETENTION_SECONDS = int(os.environ.get("BILI_JOB_RETENTION", "3600"))
+
+
+def _prune_finished_jobs(jobs: dict, lock):
+    """移除结束超过 JOB_RETENTION_SECONDS 的任务，在创建或列出任务时调用。"""
+    deadline = time.time() - JOB_RETENTION_SECONDS
+    with lock:
+        for job_id in [job_id for job_id, job in jobs.items() if job.finished_ts and job.finished_ts < deadline]:
+            del jobs[job_id]
+
+
+class ScanJob:
+    """
+    服务端 act_id 区间扫描任务。
+    在后台线程中把区间内的 ID 分发到共享线程池，命中结果直接写入可用 act_id 记录，
+    浏览器关闭后任务仍继续执行，前端可随时轮询进度。
+    found / errors 只追加，snapshot 可以只返回某个下标之后新增的部分。
+    """
+
+    def __init__(self, start: int, end: int, refresh: bool = False):
+        self.id = uuid.uuid4().hex[:12]
+        self.start = start
+        self.end = end
+        self.refresh = refresh
+        self.total = end - start + 1
+        self.status = "running"
+        self.checked = 0
+        self.cached_negative = 0
+        self.found = []
+        self.not_found = []
+        self.errors = []
+        self.created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.finished_at = ""
+        self.finished_ts = 0.0
+        self.meter = ProgressMeter()
+        self._unsaved = []
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _record(self, act_id: int, result=None):
+        self.meter.item_done()
+        flush = False
+        with self._lock:
+            self.checked += 1
+            if result and result.get("cached"):
+                self.cached_negative += 1
+            if result is None:
+                self.errors.append(act_id)
+            elif result["exists"]:
+                self.found.append({"act_id": act_id, "name": result["name"]})
+                self._unsaved.append({"act_id": act_id, "name": result["name"]})
+                flush = len(self._unsaved) >= _SCAN_SAVE_BATCH
+            else:
+                self.not_found.append(act_id)
+        if flush:
+            self._flush_found()
+
+    def _flush_found(self):
+        """把命中结果批量写入可用 act_id 记录。"""
+        with self._lock:
+            items, self._unsaved = self._unsaved, []
+        if not items:
+            return
+        try:
+            _get_act_id_store().bulk_upsert(items)
+        except Exception:
+            LOGGER.warning(f"[scan {self.id}] 写入可用 act_id 失败: {len(items)} 条", exc_info=True)
+
+    def _check_page(self, act_ids: list):
+        """批量检查一页 act_id，失败的 ID 最多重试 _SCAN_MAX_RETRY 次。"""
+        pending = act_ids
+        for attempt in range(_SCAN_MAX_RETRY):
+            if self._cancel.is_set():
+                return
+            try:
+                results = _check_act_ids(pending, refresh=self.refresh, cache_metadata=False)
+            except Exception as e:
+                LOGGER.error(f"[scan {self.id}] 检查 act_id={pending[0]}~{pending[-1]} 失败: {e}", exc_info=True)
+                break
+            retry = []
+            network_error = False
+            for one in results:
+                if "error" in one:
+                    retry.append(int(one["act_id"]))
+                    network_error = network_error or not one.get("throttled")
+                else:
+                    self._record(int(one["act_id"]), one)
+            pending = retry
+            if not pending:
+                return
+            LOGGER.warning(f"[scan {self.id}] [retry {attempt + 1}/{_SCAN_MAX_RETRY}] {len(pending)} 个 act_id 查询失败")
+            # 412 已由令牌桶退避；其他网络错误等待一段时间再重试，避免连续打满失败请求
+            if network_error and attempt < _SCAN_MAX_RETRY - 1:
+                self._cancel.wait(_SCAN_RETRY_BACKOFF * (2 ** attempt))
+        for act_id in pending:
+            self._record(act_id)
+
+    def run(self):
+        # 限制同时排队的分片数量，避免一次性为整个区间创建 Future
+        max_in_flight = SCAN_WORKERS * 2
+        in_flight = threading.BoundedSemaphore(max_in_flight)
+        try:
+            for page_start in range(self.start, self.end + 1, _SCAN_PAGE_SIZE):
+                if self._cancel.is_set():
+                    break
+                page = list(range(page_start, min(page_start + _SCAN_PAGE_SIZE, self.end + 1)))
+                in_flight.acquire()
+                future = _scan_executor.submit(self._check_page, page)
+                future.add_done_callback(lambda _f: in_flight.release())
+            for _ in range(max_in_flight):
+                in_flight.acquire()
+            self._flush_found()
+            self.status = "cancelled" if self._cancel.is_set() else "done"
+        except Exception as e:
+            LOGGER.error(f"[scan {self.id}] 扫描任务异常终止: {e}", exc_info=True)
+            self._flush_found()
+            self.status = "failed"
+        self.finished_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.finished_ts = time.time()
+        LOGGER.info(
+            f"[scan {self.id}] 扫描结束: status={self.status}, checked={self.checked}/{self.total}, "
+            f"found={len(self.found)}, errors={len(self.errors)}"
+        )
+
+    def snapshot(self, found_since: int = 0, errors_since: int = 0) -> dict:
+        """
+        任务快照。found / errors 只包含下标 found_since / errors_since 之后新增的条目（按发现顺序），
+        found_count / error_count 为总数，客户端可用它们作为下一次请求的起点。
+        """
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "start": self.start,
+                "end": self.end,
+                "total": self.total,
+                "status": self.status,
+                "checked": self.checked,
+                "found": self.found[found_since:],
+                "found_since": found_since,
+                "found_count": len(self.found),
+                "not_found": sorted(self.not_found)[:50],
+                "not_found_count": len(self.not_found),
+                "cached_negative": self.cached_negative,
+                "errors": self.errors[errors_since:],
+                "errors_since": errors_since,
+                "error_count": len(self.errors),
+                "progress": self.meter.snapshot(self.total - self.checked),
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+            }
+
+
+_scan_jobs = {}
+_scan_jobs_lock = threading.Lock()
+
+
+@app.route("/api/scan_jobs", methods=["GET", "POST"])
+def scan_jobs():
+    """
+    GET  — 列出所有扫描任务
+    POST — 创建扫描任务，JSON: {"start": 起始 act_id, "end": 结束 act_id, "refresh": false}
+    已知不存在的 act_id 默认跳过查询，refresh 为 true 时全部重新检查。
+    返回任务快照，其中 job_id 用于查询进度或取消。
+    """
+    _prune_finished_jobs(_scan_jobs, _scan_jobs_lock)
+    if request.method == "GET":
+        with _scan_jobs_lock:
+            jobs = list(_scan_jobs.values())
+        return jsonify({"code": 0, "data": [job.snapshot() for job in jobs]})
+
+    payload = request.get_json(silent=True) or {}
+    start = str(payload.get("start") or "").strip()
+    end = str(payload.get("end") or "").strip()
+    if not start.isdigit() or not end.isdigit() or int(start) < 1 or int(end) < int(start):
+        return jsonify({"code": -1, "message": "请输入有效的 act_id 范围（起始 ≤ 结束，且均为正整数）"}), 400
+    if int(end) - int(start) + 1 > SCAN_MAX_RANGE:
+        return jsonify({"code": -1, "message": f"单次扫描最多 {SCAN_MAX_RANGE} 个 act_id"}), 400
+
+    job = ScanJob(int(start), int(end), refresh=bool(payload.get("refresh")))
+    with _scan_jobs_lock:
+        _scan_jobs[job.id] = job
+    threading.Thread(target=job.run, name=f"scan-{job.id}", daemon=True).start()
+    LOGGER.info(f"[scan {job.id}] 创建扫描任务: {start} ~ {end}")
+    return jsonify({"code": 0, "data": job.snapshot()})
+
+
+@app.route("/api/scan_jobs/<job_id>")
+def scan_job_detail(job_id):
+    """
+    查询扫描任务进度。
+    参数 found_since / errors_since（可选）：只返回该下标之后新增的 found / errors，用于增量轮询。
+    """
+    job = _scan_jobs.get(job_id)
+    if not job:
+        return jsonify({"code": -1, "message": "扫描任务不存在"}), 404
+    return jsonify({"code": 0, "data": job.snapshot(
+        found_since=_int_arg("found_since") or 0,
+        errors_since=_int_arg("errors_since") or 0,
+    )})
+
+
+@app.route("/api/scan_jobs/<job_id>/events")
+def scan_job_events(job_id):
+    """
+    以 SSE 推送扫描进度，扫描结束时发送 end 事件。
+    每个事件的 found / errors 只包含上一个事件之后新增的条目，客户端需自行累加。
+    """
+    job = _scan_jobs.get(job_id)
+    if not job:
+        return jsonify({"code": -1, "message": "扫描任务不存在"}), 404
+    cursor = {"found": 0, "errors": 0}
+
+    def _delta_snapshot():
+        data = job.snapshot(found_since=cursor["found"], errors_since=cursor["errors"])
+        cursor["found"], cursor["errors"] = data["found_count"], data["error_count"]
+        return data
+
+    return _sse_response(_delta_snapshot, lambda data: data["status"] != "running")
+
+
+@app.route("/api/scan_jobs/<job_id>/cancel", methods=["POST"])
+def cancel_scan_job(job_id):
+    """取消扫描任务，已提交的检查完成后任务结束。"""
+    job = _scan_jobs.get(job_id)
+    if not job:
+        return jsonify({"code": -1, "message": "扫描任务不存在"}), 404
+    job.cancel()
+    return jsonify({"code": 0, "data": job.snapshot()})
+
+
 @app.route("/api/resolve_url")
 def resolve_url():
     """
@@ -702,7 +2640,7 @@ def resolve_url():
         return jsonify({"code": -1, "message": "url 必须以 http:// 或 https:// 开头"}), 400
 
     try:
-        resp = req_lib.head(
+        resp = _bili_session.head(
             url,
             allow_redirects=True,
             timeout=10,
@@ -719,31 +2657,86 @@ def resolve_url():
         return jsonify({"code": -1, "message": "URL 解析失败"}), 502
 
 
+_UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def _downloads_dir() -> str:
+    save_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "downloads")
+    os.makedirs(save_dir, exist_ok=True)
+    return save_dir
+
+
+def _safe_zip_filename(filename) -> str:
+    # 安全化文件名
+    filename = re.sub(r'[<>:"/\\|?*]', '_', filename or "")
+    return filename.strip() or 'archive.zip'
+
+
+def _copy_request_stream(fh, hasher=None) -> int:
+    """按固定大小分块读取 request.stream 写入文件，返回写入的字节数。"""
+    written = 0
+    while True:
+        chunk = request.stream.read(_UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        fh.write(chunk)
+        if hasher is not None:
+            hasher.update(chunk)
+        written += len(chunk)
+    return written
+
+
+def _expected_sha256() -> str:
+    """客户端可通过 X-Content-SHA256 请求头或 sha256 参数提供文件哈希用于校验。"""
+    value = request.headers.get("X-Content-SHA256") or request.args.get("sha256") or ""
+    return value.strip().lower()
+
+
 @app.route("/api/save_zip", methods=["POST"])
 def save_zip():
     """
     接收前端上传的 ZIP 文件并保存到应用的 `downloads` 目录。
-    前端应提交 multipart/form-data，字段名为 `file`，可选 `filename`。
+    前端应提交 multipart/form-data，字段名为 `file`，可选 `filename`；
+    也可直接把文件作为请求体上传（文件名放在 filename 参数中），服务端分块写入，内存占用恒定。
+    提供 X-Content-SHA256 时会校验内容，不一致则删除文件并返回 400。
+    大文件建议使用 /api/save_zip/uploads 断点续传接口。
     返回 JSON: {code:0, path: saved_path}
     """
     try:
-        file = request.files.get("file")
-        filename = request.form.get("filename") or (file.filename if file else None) or "archive.zip"
-
-        # 安全化文件名
-        filename = re.sub(r'[<>:"/\\|?*]', '_', filename)
-        filename = filename.strip() or 'archive.zip'
+        expected_hash = _expected_sha256()
+        if request.mimetype == "multipart/form-data":
+            file = request.files.get("file")
+            if not file:
+                # multipart 请求体已被解析，不能再按原始请求体写入
+                return jsonify({"code": -1, "message": "缺少 file 字段"}), 400
+            filename = request.form.get("filename") or file.filename or "archive.zip"
+        else:
+            file = None
+            filename = request.args.get("filename") or "archive.zip"
 
-        save_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "downloads")
-        os.makedirs(save_dir, exist_ok=True)
-        save_path = os.path.join(save_dir, filename)
+        filename = _safe_zip_filename(filename)
+        save_path = os.path.join(_downloads_dir(), filename)
+        # 先写入临时文件再原子替换：同名文件可能是对象存储的硬链接视图，原地覆盖会改坏共享内容
+        tmp_path = os.path.join(_downloads_dir(), f".{filename}.{uuid.uuid4().hex[:8]}.tmp")
 
-        if file:
-            file.save(save_path)
-        else:
-            # 如果没有 multipart 文件，尝试写入原始请求体
-            with open(save_path, "wb") as fh:
-                fh.write(request.get_data())
+        try:
+            if file:
+                file.save(tmp_path)
+                content_hash = _sha256_file(tmp_path) if expected_hash else ""
+            else:
+                # 如果没有 multipart 文件，分块写入原始请求体
+                hasher = hashlib.sha256()
+                with open(tmp_path, "wb") as fh:
+                    _copy_request_stream(fh, hasher)
+                content_hash = hasher.hexdigest()
+
+            if expected_hash and content_hash != expected_hash:
+                LOGGER.warning(f"压缩包哈希校验失败: {filename}, expected={expected_hash}, actual={content_hash}")
+                return jsonify({"code": -1, "message": "文件哈希校验失败"}), 400
+            os.replace(tmp_path, save_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
 
         LOGGER.info(f"已保存压缩包: {save_path}")
         return jsonify({"code": 0, "path": save_path})
@@ -752,6 +2745,171 @@ def save_zip():
         return jsonify({"code": -1, "message": "保存失败"}), 500
 
 
+# ====== 断点续传上传（upload id + offset + finalize）======
+
+# 上传会话超过该时间没有新数据即视为放弃，创建新会话时清理
+UPLOAD_EXPIRE_SECONDS = int(os.environ.get("BILI_UPLOAD_EXPIRE", str(24 * 3600)))
+
+
+def _uploads_dir() -> str:
+    path = os.path.join(_downloads_dir(), ".uploads")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _upload_paths(upload_id: str):
+    base = os.path.join(_uploads_dir(), upload_id)
+    return base + ".part", base + ".json"
+
+
+def _load_upload(upload_id: str):
+    if not re.fullmatch(r"[0-9a-f]{32}", upload_id or ""):
+        return None
+    part_path, meta_path = _upload_paths(upload_id)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    meta["offset"] = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    return meta
+
+
+_upload_locks = KeyedLock()
+
+
+def _upload_lock(upload_id: str):
+    """同一上传会话的写入与 finalize 串行执行。"""
+    return _upload_locks.hold(upload_id)
+
+
+def _prune_expired_uploads():
+    """删除超过 UPLOAD_EXPIRE_SECONDS 没有写入的上传会话（.part 与 .json）。"""
+    deadline = time.time() - UPLOAD_EXPIRE_SECONDS
+    uploads_dir = _uploads_dir()
+    for name in os.listdir(uploads_dir):
+        upload_id, ext = os.path.splitext(name)
+        if ext != ".json" or not re.fullmatch(r"[0-9a-f]{32}", upload_id):
+            continue
+        part_path, meta_path = _upload_paths(upload_id)
+        with _upload_lock(upload_id):
+            try:
+                last_active = max(os.path.getmtime(path) for path in (part_path, meta_path) if os.path.exists(path))
+            except ValueError:
+                continue
+            if last_active >= deadline:
+                continue
+            for path in (part_path, meta_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        LOGGER.info(f"清理过期上传会话: {upload_id}")
+
+
+@app.route("/api/save_zip/uploads", methods=["POST"])
+def create_zip_upload():
+    """
+    创建断点续传上传会话。
+    JSON: {"filename": "...", "size": 总字节数（可选）, "sha256": "..."（可选，finalize 时校验）}
+    返回: {"code": 0, "data": {"upload_id": ..., "offset": 0, ...}}
+    之后用 PUT /api/save_zip/uploads/<upload_id>?offset=N 逐块上传，
+    中断后 GET 该地址获取已接收的 offset 继续，最后 POST .../finalize 完成。
+    """
+    try:
+        _prune_expired_uploads()
+    except OSError:
+        LOGGER.warning("清理过期上传会话失败", exc_info=True)
+
+    payload = request.get_json(silent=True) or {}
+    size = payload.get("size")
+    meta = {
+        "upload_id": uuid.uuid4().hex,
+        "filename": _safe_zip_filename(payload.get("filename")),
+        "size": int(size) if str(size or "").isdigit() else None,
+        "sha256": str(payload.get("sha256") or "").strip().lower(),
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    part_path, meta_path = _upload_paths(meta["upload_id"])
+    open(part_path, "wb").close()
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    LOGGER.info(f"创建上传会话: {meta['upload_id']} -> {meta['filename']}")
+    return jsonify({"code": 0, "data": {**meta, "offset": 0}})
+
+
+@app.route("/api/save_zip/uploads/<upload_id>", methods=["GET", "PUT"])
+def zip_upload_chunk(upload_id):
+    """
+    GET — 查询上传会话当前已接收的字节数（offset）
+    PUT — 上传一块数据，offset 参数必须等于服务端当前已接收的字节数，否则返回 409 和正确的 offset
+    """
+    meta = _load_upload(upload_id)
+    if not meta:
+        return jsonify({"code": -1, "message": "上传会话不存在"}), 404
+    if request.method == "GET":
+        return jsonify({"code": 0, "data": meta})
+
+    offset = request.args.get("offset", "").strip()
+    if not offset.isdigit():
+        return jsonify({"code": -1, "message": "缺少 offset 参数"}), 400
+
+    part_path, _meta_path = _upload_paths(upload_id)
+    with _upload_lock(upload_id):
+        # 等锁期间会话可能已被 finalize 或清理
+        meta = _load_upload(upload_id)
+        if not meta:
+            return jsonify({"code": -1, "message": "上传会话不存在"}), 404
+        current = meta["offset"]
+        if int(offset) != current:
+            return jsonify({"code": -1, "message": "offset 不匹配", "data": {"offset": current}}), 409
+        remaining = None if meta["size"] is None else meta["size"] - current
+        oversize = jsonify({"code": -1, "message": "上传数据超过声明的大小", "data": {"offset": current}}), 400
+        if remaining is not None and request.content_length is not None and request.content_length > remaining:
+            return oversize
+        with open(part_path, "ab") as fh:
+            written = _copy_request_stream(fh)
+        if remaining is not None and written > remaining:
+            # 没有 Content-Length（分块传输）时事后发现超长：截回本块之前，会话仍可继续
+            with open(part_path, "r+b") as fh:
+                fh.truncate(current)
+            return oversize
+        current += written
+    return jsonify({"code": 0, "data": {"upload_id": upload_id, "offset": current}})
+
+
+@app.route("/api/save_zip/uploads/<upload_id>/finalize", methods=["POST"])
+def finalize_zip_upload(upload_id):
+    """
+    完成上传：校验大小与 sha256（创建会话或本次请求中提供），通过后移动到 downloads 目录。
+    返回 JSON: {code:0, path: saved_path}
+    """
+    payload = request.get_json(silent=True) or {}
+    part_path, meta_path = _upload_paths(upload_id)
+    with _upload_lock(upload_id):
+        # 在锁内读取会话，大小/offset 检查不会被并发的 PUT 改得过时
+        meta = _load_upload(upload_id)
+        if not meta:
+            return jsonify({"code": -1, "message": "上传会话不存在"}), 404
+        expected_hash = str(payload.get("sha256") or "").strip().lower() or meta["sha256"]
+        if meta["size"] is not None and meta["offset"] != meta["size"]:
+            return jsonify({
+                "code": -1,
+                "message": "上传尚未完成",
+                "data": {"offset": meta["offset"], "size": meta["size"]},
+            }), 409
+
+        content_hash = _sha256_file(part_path)
+        if expected_hash and content_hash != expected_hash:
+            LOGGER.warning(f"上传哈希校验失败: {upload_id}, expected={expected_hash}, actual={content_hash}")
+            return jsonify({"code": -1, "message": "文件哈希校验失败", "data": {"sha256": content_hash}}), 400
+
+        save_path = os.path.join(_downloads_dir(), meta["filename"])
+        os.replace(part_path, save_path)
+        os.remove(meta_path)
+
+    LOGGER.info(f"已保存压缩包: {save_path}")
+    return jsonify({"code": 0, "path": save_path, "sha256": content_hash})
+
+
 def _sanitize_name(name: str, default_name: str) -> str:
     value = (name or "").strip()
     value = re.sub(r'[<>:"/\\|?*]', '_', value)
@@ -759,6 +2917,11 @@ def _sanitize_name(name: str, default_name: str) -> str:
     return value or default_name
 
 
+# 并发下载时，文件名分配与去重判断都需要串行化，避免两个线程抢到同一路径或互相删除
+_file_path_lock = threading.Lock()
+_dedupe_lock = threading.Lock()
+
+
 def _unique_file_path(dir_path: str, filename: str) -> str:
     name, ext = os.path.splitext(filename)
     candidate = os.path.join(dir_path, filename)
@@ -769,6 +2932,14 @@ def _unique_file_path(dir_path: str, filename: str) -> str:
     return candidate
 
 
+def _reserve_file_path(dir_path: str, filename: str) -> str:
+    """分配唯一路径并立即创建空文件占位，保证并发线程不会拿到同一个路径。"""
+    with _file_path_lock:
+        save_path = _unique_file_path(dir_path, filename)
+        open(save_path, "wb").close()
+    return save_path
+
+
 def _sha256_file(file_path: str) -> str:
     hasher = hashlib.sha256()
     with open(file_path, "rb") as fh:
@@ -778,29 +2949,892 @@ def _sha256_file(file_path: str) -> str:
     return hasher.hexdigest()
 
 
-def _find_duplicate_by_hash(dir_path: str, file_hash: str, exclude_path: str = "") -> str:
-    exclude_abs = os.path.abspath(exclude_path) if exclude_path else ""
-    for name in os.listdir(dir_path):
-        candidate = os.path.join(dir_path, name)
-        if not os.path.isfile(candidate):
-            continue
-        if exclude_abs and os.path.abspath(candidate) == exclude_abs:
-            continue
+# ====== 持久化内容哈希索引 ======
+
+class HashIndex:
+    """
+    下载根目录下的持久化哈希索引（SQLite），记录 相对路径 → sha256/size/mtime。
+    去重时按 (sha256, size) 直接查表，不再重新读取目录中的每个文件；
+    命中记录会用 mtime/size 校验，文件被手动修改或删除时自动修正。
+    """
+
+    DB_NAME = ".hash_index.db"
+
+    def __init__(self, root_dir: str):
+        self.root_dir = os.path.abspath(root_dir)
+        self.db_path = os.path.join(self.root_dir, self.DB_NAME)
+        self._lock = threading.RLock()
+        os.makedirs(self.root_dir, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                path   TEXT PRIMARY KEY,
+                dir    TEXT NOT NULL,
+                sha256 TEXT NOT NULL,
+                size   INTEGER NOT NULL,
+                mtime  REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_files_hash ON files (sha256, size);
+            CREATE INDEX IF NOT EXISTS idx_files_dir ON files (dir);
+            CREATE TABLE IF NOT EXISTS scanned_dirs (
+                dir TEXT PRIMARY KEY
+            );
+            CREATE TABLE IF NOT EXISTS sources (
+                url           TEXT NOT NULL,
+                dir           TEXT NOT NULL,
+                path          TEXT NOT NULL,
+                etag          TEXT NOT NULL DEFAULT '',
+                last_modified TEXT NOT NULL DEFAULT '',
+                size          INTEGER NOT NULL,
+                sha256        TEXT NOT NULL,
+                PRIMARY KEY (url, dir)
+            );
+            CREATE TABLE IF NOT EXISTS partials (
+                path          TEXT PRIMARY KEY,
+                url           TEXT NOT NULL,
+                etag          TEXT NOT NULL DEFAULT '',
+                last_modified TEXT NOT NULL DEFAULT ''
+            );
+        """)
+        self._conn.commit()
+
+    def _rel(self, path: str) -> str:
+        rel = os.path.relpath(os.path.abspath(path), self.root_dir).replace(os.sep, "/")
+        # 根目录本身记为 ""，与根目录下文件的 dir 字段（os.path.dirname）一致
+        return "" if rel == "." else rel
+
+    def _abs(self, rel_path: str) -> str:
+        return os.path.join(self.root_dir, *rel_path.split("/"))
+
+    def add(self, path: str, file_hash: str = "", stat=None):
+        """登记（或更新）单个文件；未提供 hash 时现场计算。"""
+        stat = stat or os.stat(path)
+        file_hash = file_hash or _sha256_file(path)
+        rel = self._rel(path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, dir, sha256, size, mtime) VALUES (?, ?, ?, ?, ?)",
+                (rel, os.path.dirname(rel), file_hash, stat.st_size, stat.st_mtime),
+            )
+            self._conn.commit()
+        return file_hash
+
+    def remove(self, path: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM files WHERE path = ?", (self._rel(path),))
+            self._conn.commit()
+
+    def _is_fresh(self, rel_path: str, size: int, mtime: float) -> bool:
+        """校验索引记录与磁盘文件是否一致，不一致时重新计算或删除记录。"""
+        path = self._abs(rel_path)
         try:
-            if _sha256_file(candidate) == file_hash:
-                return candidate
-        except Exception:
-            continue
-    return ""
+            stat = os.stat(path)
+        except OSError:
+            self.remove(path)
+            return False
+        if stat.st_size == size and stat.st_mtime == mtime:
+            return True
+        try:
+            self.add(path, stat=stat)
+        except OSError:
+            self.remove(path)
+        return False
+
+    def _scan_dir(self, dir_path: str, force: bool = False) -> int:
+        """把目录中尚未登记（或已变化）的文件补录进索引，返回新计算 hash 的文件数。"""
+        rel_dir = self._rel(dir_path)
+        with self._lock:
+            known = {
+                row[0]: (row[1], row[2])
+                for row in self._conn.execute("SELECT path, size, mtime FROM files WHERE dir = ?", (rel_dir,))
+            }
+        hashed = 0
+        seen = set()
+        for name in os.listdir(dir_path):
+            candidate = os.path.join(dir_path, name)
+            if name.startswith(".") or name.endswith(".part") or not os.path.isfile(candidate):
+                continue
+            rel = self._rel(candidate)
+            seen.add(rel)
+            try:
+                stat = os.stat(candidate)
+                if not force and known.get(rel) == (stat.st_size, stat.st_mtime):
+                    continue
+                self.add(candidate, stat=stat)
+                hashed += 1
+            except OSError:
+                continue
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM files WHERE path = ?",
+                [(rel,) for rel in known if rel not in seen],
+            )
+            self._conn.execute("INSERT OR IGNORE INTO scanned_dirs (dir) VALUES (?)", (rel_dir,))
+            self._conn.commit()
+        return hashed
+
+    def ensure_dir_indexed(self, dir_path: str):
+        """
+        目录第一次参与去重时做一次全量登记，之后只做增量更新。
+        全量登记会读取目录中的每个文件，调用方应在持有 _dedupe_lock 之前先调用一次。
+        """
+        rel_dir = self._rel(dir_path)
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM scanned_dirs WHERE dir = ?", (rel_dir,)).fetchone()
+        if not row:
+            self._scan_dir(dir_path)
+
+    def find_duplicate(self, dir_path: str, file_hash: str, size: int, exclude_path: str = "") -> str:
+        """在 dir_path 中查找内容相同的已有文件，返回其绝对路径，没有则返回空字符串。"""
+        self.ensure_dir_indexed(dir_path)
+        exclude_rel = self._rel(exclude_path) if exclude_path else ""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, size, mtime FROM files WHERE sha256 = ? AND size = ? AND dir = ?",
+                (file_hash, size, self._rel(dir_path)),
+            ).fetchall()
+        for rel, row_size, row_mtime in rows:
+            if rel == exclude_rel:
+                continue
+            if self._is_fresh(rel, row_size, row_mtime):
+                return self._abs(rel)
+        return ""
+
+    def lookup_source(self, url: str, dir_path: str):
+        """
+        查询某个源 URL 此前保存到 dir_path 的记录（下载清单）。
+        对应文件已不存在或大小变化时返回 None，并删除该记录。
+        """
+        rel_dir = self._rel(dir_path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path, etag, last_modified, size, sha256 FROM sources WHERE url = ? AND dir = ?",
+                (url, rel_dir),
+            ).fetchone()
+        if not row:
+            return None
+        rel, etag, last_modified, size, file_hash = row
+        path = self._abs(rel)
+        try:
+            if os.path.getsize(path) == size:
+                return {"path": path, "etag": etag, "last_modified": last_modified,
+                        "size": size, "hash": file_hash}
+        except OSError:
+            pass
+        with self._lock:
+            self._conn.execute("DELETE FROM sources WHERE url = ? AND dir = ?", (url, rel_dir))
+            self._conn.commit()
+        return None
 
+    def record_source(self, url: str, path: str, etag: str, last_modified: str, size: int, file_hash: str):
+        """记录源 URL 与本地文件的对应关系及远端校验信息（ETag / Last-Modified / 大小）。"""
+        rel = self._rel(path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sources (url, dir, path, etag, last_modified, size, sha256) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, os.path.dirname(rel), rel, etag or "", last_modified or "", size, file_hash),
+            )
+            self._conn.commit()
+
+    def lookup_source_any(self, url: str):
+        """查询某个源 URL 在任意目录下最近一次的下载记录（只返回 hash 等远端校验信息）。"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, size, sha256 FROM sources WHERE url = ? ORDER BY rowid DESC LIMIT 1",
+                (url,),
+            ).fetchone()
+        if not row:
+            return None
+        etag, last_modified, size, file_hash = row
+        return {"etag": etag, "last_modified": last_modified, "size": size, "hash": file_hash}
+
+    def iter_files(self) -> list:
+        """返回索引中的全部文件 [(绝对路径, sha256, size), ...]。"""
+        with self._lock:
+            rows = self._conn.execute("SELECT path, sha256, size FROM files").fetchall()
+        return [(self._abs(rel), file_hash, size) for rel, file_hash, size in rows]
+
+    def lookup_partial(self, part_path: str):
+        """查询 .part 文件开始下载时记录的远端校验信息，用于续传时的 If-Range。"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT url, etag, last_modified FROM partials WHERE path = ?", (self._rel(part_path),)
+            ).fetchone()
+        if not row:
+            return None
+        return {"url": row[0], "etag": row[1], "last_modified": row[2]}
+
+    def record_partial(self, part_path: str, url: str, etag: str, last_modified: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO partials (path, url, etag, last_modified) VALUES (?, ?, ?, ?)",
+                (self._rel(part_path), url, etag or "", last_modified or ""),
+            )
+            self._conn.commit()
+
+    def remove_partial(self, part_path: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM partials WHERE path = ?", (self._rel(part_path),))
+            self._conn.commit()
+
+    def rebuild(self, force: bool = False) -> dict:
+        """
+        重建索引：遍历整个下载根目录，补录新增/变化的文件，清理已删除文件的记录。
+        force=True 时忽略 mtime/size 校验，全部重新计算 hash。
+        """
+        walked_dirs = set()
+        hashed = 0
+        for current, subdirs, _files in os.walk(self.root_dir):
+            subdirs[:] = [d for d in subdirs if not d.startswith(".")]
+            walked_dirs.add(self._rel(current))
+            hashed += self._scan_dir(current, force=force)
+        with self._lock:
+            stale = [
+                (row[0],) for row in self._conn.execute("SELECT DISTINCT dir FROM files")
+                if row[0] not in walked_dirs
+            ]
+            self._conn.executemany("DELETE FROM files WHERE dir = ?", stale)
+            self._conn.executemany("DELETE FROM scanned_dirs WHERE dir = ?", stale)
+            self._conn.commit()
+            total = self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        LOGGER.info(f"哈希索引重建完成: root={self.root_dir}, dirs={len(walked_dirs)}, hashed={hashed}, total={total}")
+        return {"dirs": len(walked_dirs), "hashed": hashed, "total": total}
+
+
+_hash_indexes = {}
+_hash_indexes_lock = threading.Lock()
+
+
+def _get_hash_index(root_dir: str) -> HashIndex:
+    key = os.path.abspath(root_dir)
+    with _hash_indexes_lock:
+        index = _hash_indexes.get(key)
+        if index is None:
+            index = HashIndex(key)
+            _hash_indexes[key] = index
+        return index
+
+
+# ====== 内容寻址对象存储 ======
+
+OBJECT_STORE_ENABLED = os.environ.get("BILI_OBJECT_STORE", "1") != "0"
+# Linux FICLONE ioctl：btrfs / xfs 等文件系统上的 reflink（写时复制）
+_FICLONE = 0x40049409
+# 只有这些错误表示文件系统不支持 reflink，其余错误（源对象缺失、目标目录不存在等）照常抛出
+_REFLINK_UNSUPPORTED_ERRNOS = {errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY}
+
+
+class ObjectStore:
+    """
+    下载根目录下按 sha256 寻址的内容存储（.objects/<前两位>/<sha256>），相同内容在整个下载库中只存一份。
+    合集目录中的文件都是对象的视图：优先 reflink（写时复制，修改互不影响），
+    其次硬链接（修改任一视图会影响同内容的所有视图），都不支持时退回复制。
+    文件系统不支持硬链接时（如 FAT32/exFAT）存储不启用，下载行为与之前一致。
+    """
+
+    DIR_NAME = ".objects"
+
+    def __init__(self, root_dir: str):
+        self.root_dir = os.path.abspath(root_dir)
+        self.objects_dir = os.path.join(self.root_dir, self.DIR_NAME)
+        self._lock = threading.Lock()
+        self._reflink_supported = fcntl is not None
+        self._hardlink_warned = False
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.enabled = self._probe_links()
+
+    def _probe_links(self) -> bool:
+        probe = os.path.join(self.objects_dir, f".probe.{uuid.uuid4().hex[:8]}")
+        try:
+            open(probe, "wb").close()
+            os.link(probe, probe + ".link")
+            os.remove(probe + ".link")
+            return True
+        except OSError as e:
+            LOGGER.warning(f"下载目录不支持硬链接，不启用对象存储: {self.root_dir} | {e}")
+            return False
+        finally:
+            try:
+                os.remove(probe)
+            except OSError:
+                pass
+
+    def path_for(self, file_hash: str) -> str:
+        return os.path.join(self.objects_dir, file_hash[:2], file_hash)
+
+    def has(self, file_hash: str, size: int = None) -> bool:
+        try:
+            stat = os.stat(self.path_for(file_hash))
+        except OSError:
+            return False
+        return size is None or stat.st_size == size
+
+    def ingest(self, src_path: str, file_hash: str) -> str:
+        """把下载完成的文件移入存储；内容已存在时直接删除 src_path。返回对象路径。"""
+        obj_path = self.path_for(file_hash)
+        with self._lock:
+            if os.path.exists(obj_path):
+                os.remove(src_path)
+            else:
+                os.makedirs(os.path.dirname(obj_path), exist_ok=True)
+                shutil.move(src_path, obj_path)
+        return obj_path
+
+    def _reflink(self, src_path: str, dst_path: str) -> bool:
+        if not self._reflink_supported:
+            return False
+        try:
+            with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+                fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+            return True
+        except OSError as e:
+            try:
+                os.remove(dst_path)
+            except OSError:
+                pass
+            if e.errno not in _REFLINK_UNSUPPORTED_ERRNOS:
+                raise
+            # 文件系统不支持，之后不再尝试
+            self._reflink_supported = False
+            return False
+
+    @property
+    def view_mode(self) -> str:
+        return "reflink" if self._reflink_supported else "hardlink"
+
+    def _warn_hardlink(self):
+        if not self._hardlink_warned:
+            self._hardlink_warned = True
+            LOGGER.warning(
+                f"下载目录不支持 reflink，合集中的文件以硬链接共享内容: {self.root_dir}。"
+                "请勿直接修改下载的文件，修改会同时改变其他合集中内容相同的文件；需要编辑时请先复制一份。"
+            )
+
+    def link(self, file_hash: str, dest_path: str):
+        """在 dest_path 创建指向对象的视图，已有文件会被原子替换。"""
+        obj_path = self.path_for(file_hash)
+        dir_path, name = os.path.split(dest_path)
+        # 以 . 开头，哈希索引扫描目录时会跳过
+        tmp_path = os.path.join(dir_path, f".{name}.{uuid.uuid4().hex[:8]}.link")
+        try:
+            if not self._reflink(obj_path, tmp_path):
+                try:
+                    os.link(obj_path, tmp_path)
+                    self._warn_hardlink()
+                except OSError:
+                    shutil.copyfile(obj_path, tmp_path)
+            os.replace(tmp_path, dest_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def adopt(self, path: str, file_hash: str) -> bool:
+        """
+        把下载库中已有的普通文件纳入存储：内容尚未入库时把该文件硬链接进存储，
+        已入库时把它替换为对象的视图。返回是否节省了一份空间。
+        file_hash 来自哈希索引，可能已过时（重建索引后文件被修改，或修改后大小与 mtime 都没变），
+        因此链接前按文件当前内容重新计算；内容不一致或计算期间文件被改动时不做任何处理。
+        """
+        obj_path = self.path_for(file_hash)
+        if os.path.exists(obj_path) and os.path.samefile(path, obj_path):
+            return False
+        before = os.stat(path)
+        if _sha256_file(path) != file_hash:
+            LOGGER.warning(f"文件内容与哈希索引不一致，跳过纳入对象存储: {path}")
+            return False
+        after = os.stat(path)
+        if (before.st_size, before.st_mtime_ns) != (after.st_size, after.st_mtime_ns):
+            LOGGER.warning(f"文件在校验期间被修改，跳过纳入对象存储: {path}")
+            return False
+        with self._lock:
+            if not os.path.exists(obj_path):
+                os.makedirs(os.path.dirname(obj_path), exist_ok=True)
+                if not self._reflink(path, obj_path):
+                    os.link(path, obj_path)
+                    self._warn_hardlink()
+                return False
+        self.link(file_hash, path)
+        return True
+
+    def prune(self, referenced: set) -> dict:
+        """删除不再被任何视图引用的对象，返回删除的数量与释放的字节数。"""
+        removed = freed = 0
+        for prefix in os.listdir(self.objects_dir):
+            prefix_dir = os.path.join(self.objects_dir, prefix)
+            if prefix.startswith(".") or not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                if name in referenced:
+                    continue
+                obj_path = os.path.join(prefix_dir, name)
+                try:
+                    size = os.path.getsize(obj_path)
+                    os.remove(obj_path)
+                except OSError:
+                    continue
+                removed += 1
+                freed += size
+        return {"removed": removed, "freed_bytes": freed}
+
+
+_object_stores = {}
+_object_stores_lock = threading.Lock()
+
+
+def _get_object_store(root_dir: str):
+    """返回下载根目录对应的对象存储；未启用或文件系统不支持时返回 None。"""
+    if not OBJECT_STORE_ENABLED:
+        return None
+    key = os.path.abspath(root_dir)
+    with _object_stores_lock:
+        store = _object_stores.get(key)
+        if store is None:
+            store = ObjectStore(key)
+            _object_stores[key] = store
+    return store if store.enabled else None
+
+
+def _sync_object_store(root_dir: str) -> dict:
+    """
+    把下载库中已有的文件纳入对象存储（相同内容合并为一份），并删除无引用的对象。
+    需在哈希索引重建之后调用，以索引中的文件作为引用依据。
+    """
+    store = _get_object_store(root_dir)
+    if store is None:
+        return {"enabled": False}
+    hash_index = _get_hash_index(root_dir)
+    adopted = merged = saved = 0
+    # 逐个文件加锁，迁移期间并发下载的收尾只需等待当前这一个文件
+    for path, file_hash, size in hash_index.iter_files():
+        with _dedupe_lock:
+            try:
+                if store.adopt(path, file_hash):
+                    merged += 1
+                    saved += size
+                    hash_index.add(path, file_hash)
+                adopted += 1
+            except OSError as e:
+                LOGGER.warning(f"文件纳入对象存储失败: {path} | {e}")
+    # 清理时持锁，避免删掉刚入库、尚未登记进索引的对象
+    with _dedupe_lock:
+        pruned = store.prune({file_hash for _path, file_hash, _size in hash_index.iter_files()})
+    LOGGER.info(f"对象存储同步完成: files={adopted}, merged={merged}, saved={saved}, pruned={pruned['removed']}")
+    return {"enabled": True, "view_mode": store.view_mode, "files": adopted, "merged": merged,
+            "saved_bytes": saved, **pruned}
+
+
+# ====== 感知哈希近似重复检测 ======
+
+PHASH_ENABLED = os.environ.get("BILI_PHASH", "1") != "0"
+# 入库时记录的最大汉明距离（64 位 pHash），查询时可再收紧
+PHASH_MAX_DISTANCE = min(12, int(os.environ.get("BILI_PHASH_MAX_DISTANCE", "8")))
+_PHASH_IMAGE_EXTS = {".png", ".jpg", ".jpeg", ".webp", ".bmp", ".gif"}
+_PHASH_CHUNKS = 4  # 多索引哈希：64 位拆成 4 段 16 位，各自建索引
+# 感知哈希使用独立的小线程池，补算整个下载库时不会占满预览缩略图/视频封面用的 _thumb_executor
+PHASH_WORKERS = max(1, int(os.environ.get("BILI_PHASH_WORKERS", str(min(2, os.cpu_count() or 1)))))
+_phash_executor = ThreadPoolExecutor(max_workers=PHASH_WORKERS, thread_name_prefix="phash")
+
+
+def _chunk_variants(radius: int) -> list:
+    """16 位内汉明距离不超过 radius 的全部异或掩码。"""
+    masks = [0]
+    for r in range(1, radius + 1):
+        for bits in itertools.combinations(range(16), r):
+            masks.append(sum(1 << b for b in bits))
+    return masks
+
+
+def _image_hashes(path: str):
+    """计算图片的 (pHash, dHash)，均为 64 位整数；无法解码时返回 None。"""
+    # np.fromfile + imdecode 兼容 Windows 下的中文路径
+    image = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if image is None:
+        return None
+    if image.dtype != np.uint8:
+        image = cv2.convertScaleAbs(image, alpha=255.0 / 65535.0)
+    if image.ndim == 3 and image.shape[2] == 4:
+        # 透明区域铺白底，避免同一张图因透明像素的底色不同而哈希不同
+        alpha = image[:, :, 3:4].astype(np.float32) / 255.0
+        image = (image[:, :, :3] * alpha + 255.0 * (1.0 - alpha)).astype(np.uint8)
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    # pHash：32x32 DCT 的左上 8x8 低频系数与中位数（不含直流分量）比较
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    phash_bits = low > np.median(low[1:])
+    # dHash：9x8 灰度图中相邻像素的明暗梯度
+    tiny = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    dhash_bits = (tiny[:, 1:] > tiny[:, :-1]).flatten()
+
+    return (int.from_bytes(np.packbits(phash_bits).tobytes(), "big"),
+            int.from_bytes(np.packbits(dhash_bits).tobytes(), "big"))
+
+
+class PerceptualIndex:
+    """
+    按内容 sha256 记录图片的 pHash / dHash，与哈希索引共用下载根目录下的 SQLite 数据库。
+    pHash 拆成 4 段 16 位分别建索引（多索引哈希）：距离不超过 r 的两张图至少有一段
+    距离不超过 r // 4，查询时只需按每段的少量变体做索引查找，不随图片数量线性增长。
+    入库时即查找近似图片并记录成对关系，聚类只需在这些关系上做并查集。
+    """
+
+    def __init__(self, db_path: str, max_distance: int = PHASH_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self._variants = _chunk_variants(max_distance // _PHASH_CHUNKS)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS phashes (
+                sha256 TEXT PRIMARY KEY,
+                phash  TEXT NOT NULL,
+                dhash  TEXT NOT NULL,
+                p0     INTEGER NOT NULL,
+                p1     INTEGER NOT NULL,
+                p2     INTEGER NOT NULL,
+                p3     INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_phashes_p0 ON phashes (p0);
+            CREATE INDEX IF NOT EXISTS idx_phashes_p1 ON phashes (p1);
+            CREATE INDEX IF NOT EXISTS idx_phashes_p2 ON phashes (p2);
+            CREATE INDEX IF NOT EXISTS idx_phashes_p3 ON phashes (p3);
+            CREATE TABLE IF NOT EXISTS phash_pairs (
+                a              TEXT NOT NULL,
+                b              TEXT NOT NULL,
+                distance       INTEGER NOT NULL,
+                dhash_distance INTEGER NOT NULL,
+                PRIMARY KEY (a, b)
+            );
+            CREATE INDEX IF NOT EXISTS idx_phash_pairs_distance ON phash_pairs (distance);
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def _chunks(value: int) -> list:
+        return [(value >> (16 * i)) & 0xFFFF for i in range(_PHASH_CHUNKS)]
+
+    def known_hashes(self) -> set:
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT sha256 FROM phashes")}
+
+    def has(self, file_hash: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM phashes WHERE sha256 = ?", (file_hash,)).fetchone() is not None
+
+    def neighbors(self, phash: int, max_distance: int = None) -> list:
+        """返回 pHash 距离不超过 max_distance 的 [(sha256, phash, dhash, 距离), ...]。"""
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        candidates = {}
+        with self._lock:
+            for i, chunk in enumerate(self._chunks(phash)):
+                values = [chunk ^ mask for mask in self._variants]
+                placeholders = ",".join("?" * len(values))
+                for sha, p_hex, d_hex in self._conn.execute(
+                    f"SELECT sha256, phash, dhash FROM phashes WHERE p{i} IN ({placeholders})", values
+                ):
+                    candidates[sha] = (int(p_hex, 16), int(d_hex, 16))
+        result = []
+        for sha, (p_value, d_value) in candidates.items():
+            distance = (p_value ^ phash).bit_count()
+            if distance <= max_distance:
+                result.append((sha, p_value, d_value, distance))
+        return result
+
+    def add(self, file_hash: str, phash: int, dhash: int) -> int:
+        """登记一张图片，并记录与已有图片的近似关系，返回新增的近似对数量。"""
+        with self._lock:
+            if self.has(file_hash):
+                return 0
+            pairs = [
+                (min(file_hash, sha), max(file_hash, sha), distance, (d_value ^ dhash).bit_count())
+                for sha, _p_value, d_value, distance in self.neighbors(phash)
+            ]
+            self._conn.execute(
+                "INSERT INTO phashes (sha256, phash, dhash, p0, p1, p2, p3) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (file_hash, f"{phash:016x}", f"{dhash:016x}", *self._chunks(phash)),
+            )
+            self._conn.executemany("INSERT OR IGNORE INTO phash_pairs VALUES (?, ?, ?, ?)", pairs)
+            self._conn.commit()
+        return len(pairs)
+
+    def clusters(self, max_distance: int, max_dhash_distance: int = None) -> list:
+        """
+        按近似关系聚类，返回 [{"hashes": [...], "max_distance": n}, ...]（按图片数量降序）。
+        只统计仍存在于哈希索引中的文件；max_dhash_distance 可用 dHash 再做一次确认。
+        """
+        sql = ("SELECT a, b, distance FROM phash_pairs WHERE distance <= ? "
+               "AND a IN (SELECT sha256 FROM files) AND b IN (SELECT sha256 FROM files)")
+        params = [max_distance]
+        if max_dhash_distance is not None:
+            sql += " AND dhash_distance <= ?"
+            params.append(max_dhash_distance)
+        with self._lock:
+            pairs = self._conn.execute(sql, params).fetchall()
+
+        parent = {}
+
+        def find(x):
+            parent.setdefault(x, x)
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for a, b, _distance in pairs:
+            root_a, root_b = find(a), find(b)
+            if root_a != root_b:
+                parent[root_a] = root_b
+        groups = {}
+        for a, _b, distance in pairs:
+            group = groups.setdefault(find(a), {"hashes": set(), "max_distance": 0})
+            group["max_distance"] = max(group["max_distance"], distance)
+        for sha in parent:
+            groups[find(sha)]["hashes"].add(sha)
+        clusters = [{"hashes": sorted(g["hashes"]), "max_distance": g["max_distance"]} for g in groups.values()]
+        clusters.sort(key=lambda c: (-len(c["hashes"]), c["max_distance"]))
+        return clusters
+
+
+_perceptual_indexes = {}
+_perceptual_indexes_lock = threading.Lock()
+
+
+def _get_perceptual_index(root_dir: str) -> PerceptualIndex:
+    key = os.path.abspath(root_dir)
+    with _perceptual_indexes_lock:
+        index = _perceptual_indexes.get(key)
+        if index is None:
+            index = PerceptualIndex(_get_hash_index(key).db_path)
+            _perceptual_indexes[key] = index
+        return index
+
+
+def _is_hashable_image(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in _PHASH_IMAGE_EXTS
+
+
+def _index_perceptual_hash(root_dir: str, path: str, file_hash: str):
+    """计算并登记单张图片的感知哈希（在感知哈希线程池中执行）。"""
+    try:
+        index = _get_perceptual_index(root_dir)
+        if index.has(file_hash):
+            return
+        hashes = _image_hashes(path)
+        if hashes is None:
+            return
+        pairs = index.add(file_hash, *hashes)
+        if pairs:
+            LOGGER.info(f"发现近似图片 {pairs} 张: {path}")
+    except Exception as e:
+        LOGGER.warning(f"感知哈希计算失败: {path} | {e}")
+
+
+def _backfill_perceptual_hashes(root_dir: str) -> dict:
+    """为下载库中尚未计算感知哈希的图片补算（按内容去重，每个 sha256 只算一次）。"""
+    hash_index = _get_hash_index(root_dir)
+    index = _get_perceptual_index(root_dir)
+    known = index.known_hashes()
+    pending = {}
+    for path, file_hash, _size in hash_index.iter_files():
+        if file_hash not in known and _is_hashable_image(path):
+            pending.setdefault(file_hash, path)
+
+    hashed = pairs = failed = 0
+    items = iter(pending.items())
+    in_flight = {}
+
+    def _submit_next():
+        item = next(items, None)
+        if item is not None:
+            in_flight[_phash_executor.submit(_image_hashes, item[1])] = item
+
+    # 只保持少量任务在途，不把整个库一次性排进线程池
+    for _ in range(PHASH_WORKERS * 2):
+        _submit_next()
+    while in_flight:
+        done, _pending = wait_futures(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            file_hash, path = in_flight.pop(future)
+            _submit_next()
+            try:
+                hashes = future.result()
+            except Exception as e:
+                # 索引里的文件可能已被删除或损坏，单张失败不影响整体补算
+                LOGGER.warning(f"感知哈希计算失败: {path} | {e}")
+                hashes = None
+            if hashes is None:
+                failed += 1
+                continue
+            pairs += index.add(file_hash, *hashes)
+            hashed += 1
+    LOGGER.info(f"感知哈希补算完成: hashed={hashed}, failed={failed}, pairs={pairs}")
+    return {"hashed": hashed, "failed": failed, "pairs": pairs, "total": len(known) + hashed}
 
-def _save_single_link(item: dict, root_dir: str) -> dict:
-    type_folder_map = {
-        "dl-a-img": "img",
-        "dl-a-vid": "video",
-        "dl-a-wm": "watermark_video",
-    }
 
+def _is_source_unchanged(resp, known: dict) -> bool:
+    """
+    根据条件请求的响应判断远端资源是否与清单记录一致。
+    304 直接视为未变化；200 时比较 ETag，没有 ETag 则比较 Last-Modified + Content-Length。
+    """
+    if resp.status_code == 304:
+        return True
+    if resp.status_code != 200:
+        return False
+    etag = resp.headers.get("ETag", "")
+    if etag and known["etag"]:
+        return etag == known["etag"]
+    last_modified = resp.headers.get("Last-Modified", "")
+    length = resp.headers.get("Content-Length", "")
+    return bool(
+        last_modified and last_modified == known["last_modified"]
+        and length.isdigit() and int(length) == known["size"]
+    )
+
+
+_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+_DOWNLOAD_MAX_ATTEMPTS = 3
+
+_part_locks = KeyedLock()
+
+
+class IncompleteDownloadError(Exception):
+    """连接提前结束，已写入的字节数少于远端声明的大小。"""
+
+
+# 当前下载线程对应的进度统计（ProgressMeter），由 DownloadEngine 在执行任务前设置
+_progress_local = threading.local()
+
+
+def _report_download_bytes(n: int):
+    meter = getattr(_progress_local, "meter", None)
+    if meter is not None:
+        meter.add_bytes(n)
+
+
+def _part_path_for(target_dir: str, file_name: str, url: str) -> str:
+    url_key = hashlib.sha1(url.encode("utf-8")).hexdigest()[:10]
+    return os.path.join(target_dir, f"{file_name}.{url_key}.part")
+
+
+def _part_lock(part_path: str):
+    """同一个 .part 文件同一时间只允许一个线程写入。"""
+    return _part_locks.hold(part_path)
+
+
+def _parse_content_range(value: str):
+    """解析 Content-Range: bytes start-end/total，返回 (start, total)，无法解析的部分为 None。"""
+    match = re.match(r"bytes\s+(\d+|\*)(?:-\d+)?/(\d+|\*)", value or "")
+    if not match:
+        return None, None
+    start, total = match.groups()
+    return (int(start) if start.isdigit() else None), (int(total) if total.isdigit() else None)
+
+
+def _download_to_part(url: str, part_path: str, headers: dict, hash_index, known=None):
+    """
+    把 url 下载到 part_path，已有 .part 时用 Range 续传，服务器不支持则从头下载。
+    连接中断会在同一次调用内自动续传重试，仍失败时保留 .part 供下次继续。
+    返回 {"hash", "size", "etag", "last_modified"}；清单记录表明远端未变化时返回 None。
+    """
+    for attempt in range(_DOWNLOAD_MAX_ATTEMPTS):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        partial = hash_index.lookup_partial(part_path) if offset else None
+        validator = partial and (partial["etag"] or partial["last_modified"])
+        if offset and not validator:
+            # 不知道 .part 来自远端哪个版本，不带 If-Range 续传可能拼接出两个版本的内容
+            LOGGER.info(f"没有 .part 的远端校验信息，丢弃后从头下载: {part_path}")
+            os.remove(part_path)
+            hash_index.remove_partial(part_path)
+            offset = 0
+        req_headers = dict(headers)
+        if offset:
+            req_headers["Range"] = f"bytes={offset}-"
+            req_headers["If-Range"] = validator
+        elif known:
+            if known["etag"]:
+                req_headers["If-None-Match"] = known["etag"]
+            if known["last_modified"]:
+                req_headers["If-Modified-Since"] = known["last_modified"]
+
+        try:
+            with _cdn_get(url, headers=req_headers, stream=True, timeout=(8, 30)) as resp:
+                if not offset and known and _is_source_unchanged(resp, known):
+                    return None
+
+                if offset and resp.status_code == 416:
+                    _, total = _parse_content_range(resp.headers.get("Content-Range", ""))
+                    if total == offset and partial:
+                        # 上次已经写完，只是没来得及重命名
+                        return {
+                            "hash": _sha256_file(part_path),
+                            "size": offset,
+                            "etag": partial["etag"],
+                            "last_modified": partial["last_modified"],
+                        }
+                    os.remove(part_path)
+                    continue
+
+                resp.raise_for_status()
+                etag = resp.headers.get("ETag", "")
+                last_modified = resp.headers.get("Last-Modified", "")
+
+                start, total = _parse_content_range(resp.headers.get("Content-Range", ""))
+                hasher = hashlib.sha256()
+                if resp.status_code == 206:
+                    if start != offset:
+                        # 返回的区间与断点对不上，不能当作续传数据或完整文件写入
+                        LOGGER.warning(f"服务器返回的区间起点 {start} 与请求的 {offset} 不一致，丢弃 .part 从头下载: {url}")
+                        if offset:
+                            os.remove(part_path)
+                            hash_index.remove_partial(part_path)
+                        continue
+                    mode = "ab"
+                    if offset:
+                        with open(part_path, "rb") as fh:
+                            for chunk in iter(lambda: fh.read(_DOWNLOAD_CHUNK_SIZE), b""):
+                                hasher.update(chunk)
+                else:
+                    # 服务器忽略了 Range 或资源已变化，从头开始
+                    mode = "wb"
+                    length = resp.headers.get("Content-Length", "")
+                    total = int(length) if length.isdigit() else None
+                hash_index.record_partial(part_path, url, etag, last_modified)
+
+                with open(part_path, mode) as fh:
+                    for chunk in resp.iter_content(chunk_size=_DOWNLOAD_CHUNK_SIZE):
+                        if chunk:
+                            fh.write(chunk)
+                            hasher.update(chunk)
+                            _report_download_bytes(len(chunk))
+
+                size = os.path.getsize(part_path)
+                if total is not None and size < total:
+                    raise IncompleteDownloadError(f"下载不完整: {size}/{total} bytes")
+                return {"hash": hasher.hexdigest(), "size": size, "etag": etag, "last_modified": last_modified}
+
+        except (req_lib.exceptions.ConnectionError, req_lib.exceptions.Timeout,
+                req_lib.exceptions.ChunkedEncodingError, IncompleteDownloadError) as e:
+            if attempt >= _DOWNLOAD_MAX_ATTEMPTS - 1:
+                raise
+            LOGGER.warning(f"[retry {attempt + 1}/{_DOWNLOAD_MAX_ATTEMPTS}] 下载中断，将从断点继续: {url} | {e}")
+            time.sleep(1.0)
+
+    raise IncompleteDownloadError(f"下载失败，已重试 {_DOWNLOAD_MAX_ATTEMPTS} 次: {url}")
+
+
+_TYPE_FOLDER_MAP = {
+    "dl-a-img": "img",
+    "dl-a-vid": "video",
+    "dl-a-wm": "watermark_video",
+}
+
+
+def _save_single_link(item: dict, root_dir: str) -> dict:
     if not isinstance(item, dict):
         raise ValueError("item 不是对象")
 
@@ -809,7 +3843,7 @@ def _save_single_link(item: dict, root_dir: str) -> dict:
         raise ValueError("url 无效")
 
     item_type = (item.get("type") or "").strip()
-    folder_name = type_folder_map.get(item_type, "other")
+    folder_name = _TYPE_FOLDER_MAP.get(item_type, "other")
 
     collection_name = _sanitize_name(item.get("collectionFolder") or "", "未知合集")
     target_dir = os.path.join(root_dir, collection_name, folder_name)
@@ -819,29 +3853,84 @@ def _save_single_link(item: dict, root_dir: str) -> dict:
     raw_basename = os.path.basename(parsed_url.path)
     fallback_name = unquote(raw_basename) if raw_basename else "resource.bin"
     file_name = _sanitize_name(item.get("filename") or "", fallback_name)
-    save_path = _unique_file_path(target_dir, file_name)
 
     headers = {
         "Referer": "https://www.bilibili.com/",
         "User-Agent": _RESOLVE_HEADERS["User-Agent"],
     }
 
-    with req_lib.get(raw_url, headers=headers, stream=True, timeout=(8, 30)) as resp:
-        resp.raise_for_status()
-        hasher = hashlib.sha256()
-        with open(save_path, "wb") as fh:
-            for chunk in resp.iter_content(chunk_size=8192):
-                if chunk:
-                    fh.write(chunk)
-                    hasher.update(chunk)
+    # 同一 URL 在同一目录下固定对应一个 .part 文件，中断后再次下载可从已有字节继续
+    hash_index = _get_hash_index(root_dir)
+    store = _get_object_store(root_dir)
+    part_path = _part_path_for(target_dir, file_name, raw_url)
+    with _part_lock(part_path):
+        known = hash_index.lookup_source(raw_url, target_dir)
+        shared = None
+        if known is None and store is not None:
+            # 其他合集/目录下载过同一 URL 且内容仍在对象存储中：远端未变化时直接创建视图
+            shared = hash_index.lookup_source_any(raw_url)
+            if shared and not store.has(shared["hash"], shared["size"]):
+                shared = None
+        downloaded = _download_to_part(raw_url, part_path, headers, hash_index, known or shared)
+        if downloaded is None and known:
+            LOGGER.info(f"远端资源未变化，跳过下载: {raw_url}")
+            return {
+                "code": 0,
+                "path": known["path"],
+                "filename": os.path.basename(known["path"]),
+                "hash": known["hash"],
+                "duplicate": True,
+                "skipped": True,
+            }
+        if downloaded is None:
+            LOGGER.info(f"远端资源未变化，从对象存储创建文件: {raw_url}")
+            downloaded = {**shared, "linked": True}
+
+        # 目录首次参与去重时要计算其中所有文件的 hash，放在锁外进行，避免阻塞其他下载的收尾
+        hash_index.ensure_dir_indexed(target_dir)
+        while True:
+            content_hash = downloaded["hash"]
+            file_size = downloaded["size"]
+            with _dedupe_lock:
+                duplicated_path = hash_index.find_duplicate(target_dir, content_hash, file_size)
+                if duplicated_path:
+                    try:
+                        os.remove(part_path)
+                    except Exception:
+                        pass
+                    break
+                # 下载期间对象可能已被清理（rebuild --objects），此时需要完整下载
+                if downloaded.get("linked") and not store.has(content_hash, file_size):
+                    save_path = ""
+                else:
+                    save_path = _reserve_file_path(target_dir, file_name)
+                    try:
+                        if store is not None:
+                            # 内容移入对象存储（已有相同内容时丢弃本次下载），目标路径为其视图
+                            if not downloaded.get("linked"):
+                                store.ingest(part_path, content_hash)
+                            store.link(content_hash, save_path)
+                        else:
+                            # 下载完成后原子重命名到最终文件名
+                            os.replace(part_path, save_path)
+                        hash_index.add(save_path, content_hash)
+                    except BaseException:
+                        # 不在合集目录中留下空的占位文件
+                        try:
+                            os.remove(save_path)
+                        except OSError:
+                            pass
+                        raise
+                    break
+            LOGGER.info(f"对象存储中的内容已被清理，重新下载: {raw_url}")
+            downloaded = _download_to_part(raw_url, part_path, headers, hash_index)
+        hash_index.remove_partial(part_path)
+        hash_index.record_source(
+            raw_url, duplicated_path or save_path, downloaded["etag"], downloaded["last_modified"],
+            file_size, content_hash,
+        )
 
-    content_hash = hasher.hexdigest()
-    duplicated_path = _find_duplicate_by_hash(target_dir, content_hash, save_path)
     if duplicated_path:
-        try:
-            os.remove(save_path)
-        except Exception:
-            pass
         return {
             "code": 0,
             "path": duplicated_path,
@@ -850,13 +3939,369 @@ def _save_single_link(item: dict, root_dir: str) -> dict:
             "duplicate": True,
         }
 
+    if PHASH_ENABLED and _is_hashable_image(save_path):
+        _phash_executor.submit(_index_perceptual_hash, root_dir, save_path, content_hash)
+
     return {
         "code": 0,
         "path": save_path,
         "filename": os.path.basename(save_path),
         "hash": content_hash,
         "duplicate": False,
+        "linked": bool(downloaded.get("linked")),
+    }
+
+
+# ====== 进度统计与 SSE 推送 ======
+
+class ProgressMeter:
+    """
+    任务进度统计：累计字节数、完成条目数、最近窗口内的吞吐量，以及按完成速率估算的剩余时间。
+    下载线程通过 add_bytes 上报字节，任务在每个条目结束时调用 item_done。
+    """
+
+    WINDOW = 5.0
+    BUCKET = 0.5
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.bytes = 0
+        self.items = 0
+        self._samples = deque()  # [(时间桶起点, 字节数)]
+        self._lock = threading.Lock()
+
+    def add_bytes(self, n: int):
+        now = time.monotonic()
+        with self._lock:
+            self.bytes += n
+            if self._samples and now - self._samples[-1][0] < self.BUCKET:
+                self._samples[-1][1] += n
+            else:
+                self._samples.append([now, n])
+
+    def item_done(self):
+        with self._lock:
+            self.items += 1
+
+    def snapshot(self, remaining: int) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            while self._samples and now - self._samples[0][0] > self.WINDOW:
+                self._samples.popleft()
+            window_bytes = sum(n for _, n in self._samples)
+            elapsed = max(now - self.started, 1e-6)
+            items_per_sec = self.items / elapsed
+            if remaining <= 0:
+                eta = 0
+            elif items_per_sec > 0:
+                eta = round(remaining / items_per_sec)
+            else:
+                eta = None
+            return {
+                "bytes": self.bytes,
+                "items": self.items,
+                "bytes_per_sec": int(window_bytes / min(self.WINDOW, elapsed)),
+                "items_per_sec": round(items_per_sec, 2),
+                "elapsed_seconds": round(elapsed),
+                "eta_seconds": eta,
+            }
+
+
+_SSE_INTERVAL = 0.5
+_SSE_HEARTBEAT = 15.0
+
+
+def _sse_response(snapshot_fn, finished_fn, event_fn=None):
+    """
+    以 Server-Sent Events 推送任务进度：数据变化时发送 progress 事件（event_fn 可按数据改用其他事件名），
+    任务结束后发送 end 事件并关闭连接；空闲时定期发送注释行保持连接。
+    """
+    def _format(event: str, data: dict) -> str:
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    def generate():
+        last_payload = None
+        last_sent = time.monotonic()
+        while True:
+            data = snapshot_fn()
+            if finished_fn(data):
+                yield _format("end", data)
+                return
+            payload = json.dumps(data, ensure_ascii=False, sort_keys=True)
+            if payload != last_payload:
+                yield _format(event_fn(data) if event_fn else "progress", data)
+                last_payload = payload
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent > _SSE_HEARTBEAT:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            time.sleep(_SSE_INTERVAL)
+
+    return Response(generate(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+
+# ====== 并发下载引擎 ======
+
+# 全局最大并发数 / 单个 host 最大并发数，可通过环境变量调整
+DOWNLOAD_MAX_WORKERS = int(os.environ.get("BILI_DOWNLOAD_WORKERS", "8"))
+DOWNLOAD_PER_HOST = int(os.environ.get("BILI_DOWNLOAD_PER_HOST", "4"))
+
+
+class DownloadEngine:
+    """
+    有界并发下载引擎。
+    共享线程池限制全局并发，每个 host 再用信号量限制并发，避免单个 CDN 节点被打满。
+    """
+
+    def __init__(self, max_workers=DOWNLOAD_MAX_WORKERS, per_host=DOWNLOAD_PER_HOST):
+        self.max_workers = max(1, max_workers)
+        self.per_host = max(1, per_host)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="download")
+        self._host_semaphores = {}
+        self._lock = threading.Lock()
+
+    def _host_semaphore(self, url: str) -> threading.BoundedSemaphore:
+        host = (urlparse(url).hostname or "").lower()
+        with self._lock:
+            sem = self._host_semaphores.get(host)
+            if sem is None:
+                sem = threading.BoundedSemaphore(self.per_host)
+                self._host_semaphores[host] = sem
+            return sem
+
+    def _run_one(self, index: int, item, root_dir: str, meter=None) -> dict:
+        _progress_local.meter = meter
+        try:
+            url = (item.get("url") or "") if isinstance(item, dict) else ""
+            with self._host_semaphore(url):
+                one = _save_single_link(item, root_dir)
+            return {"index": index, **one}
+        except Exception as e:
+            LOGGER.error(f"保存文件失败: index={index}, error={e}", exc_info=True)
+            return {"index": index, "code": -1, "message": str(e)}
+        finally:
+            _progress_local.meter = None
+            if meter is not None:
+                meter.item_done()
+
+    def submit_call(self, url: str, fn, *args):
+        """在下载线程池中执行 fn(*args)，同样受 url 所在 host 的并发上限约束。"""
+        def _run():
+            with self._host_semaphore(url):
+                return fn(*args)
+        return self._executor.submit(_run)
+
+    def submit(self, index: int, item, root_dir: str, meter=None):
+        """提交单个下载任务，返回 Future，结果格式与 save_links 中的单项一致；meter 用于统计进度。"""
+        return self._executor.submit(self._run_one, index, item, root_dir, meter)
+
+    def save_links(self, links: list, root_dir: str) -> list:
+        """并发下载一批链接，返回按 index 排序的结果列表。"""
+        futures = [self.submit(i, item, root_dir) for i, item in enumerate(links)]
+        return [future.result() for future in futures]
+
+
+_download_engine = DownloadEngine()
+
+
+# ====== 服务端流式 ZIP 导出 ======
+
+# 这些格式本身已压缩，直接存储（不压缩）即可
+_ZIP_STORED_EXTS = {".mp4", ".png", ".jpg", ".jpeg", ".gif", ".webp", ".zip"}
+# 流式导出时同时进行的成员下载数
+ZIP_EXPORT_WINDOW = max(1, int(os.environ.get("BILI_ZIP_WINDOW", "4")))
+
+
+class _ZipStreamSink:
+    """
+    供 zipfile 写入的只追加缓冲区（有 tell 无 seek，zipfile 会改用数据描述符）。
+    生成器每写入一块数据就 drain() 取走已产生的字节，内存占用与文件大小无关。
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._pos = 0
+
+    def write(self, data) -> int:
+        self._buf += data
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = bytes(self._buf)
+        self._buf.clear()
+        return data
+
+
+class ZipExportCancelled(Exception):
+    """客户端已断开，ZIP 导出取消，尚未完成的成员下载随之中止。"""
+
+
+def _download_to_temp(url: str, tmp_dir: str, cancelled=None) -> str:
+    """把 url 下载到 tmp_dir 下的临时文件，返回文件路径；cancelled（threading.Event）被设置时中止。"""
+    if cancelled is not None and cancelled.is_set():
+        raise ZipExportCancelled(url)
+    headers = {
+        "Referer": "https://www.bilibili.com/",
+        "User-Agent": _RESOLVE_HEADERS["User-Agent"],
     }
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, "wb") as fh, _cdn_get(url, headers=headers, stream=True, timeout=(8, 30)) as resp:
+            resp.raise_for_status()
+            for chunk in resp.iter_content(chunk_size=_DOWNLOAD_CHUNK_SIZE):
+                if cancelled is not None and cancelled.is_set():
+                    raise ZipExportCancelled(url)
+                if chunk:
+                    fh.write(chunk)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return tmp_path
+
+
+def _zip_entries(links: list) -> list:
+    """把前端链接列表转换为 [(arcname, url), ...]，路径规则与 downloads 目录一致，重名自动加序号。"""
+    entries = []
+    used = set()
+    for item in links:
+        if not isinstance(item, dict):
+            continue
+        url = (item.get("url") or "").strip()
+        if not (url.startswith("http://") or url.startswith("https://")):
+            continue
+        zip_path = str(item.get("zipPath") or "").replace("\\", "/")
+        parts = [_sanitize_name(part, "") for part in zip_path.split("/")]
+        parts = [part for part in parts if part and part != ".."]
+        if not parts:
+            raw_basename = unquote(os.path.basename(urlparse(url).path)) or "resource.bin"
+            parts = [
+                _sanitize_name(item.get("collectionFolder") or "", "未知合集"),
+                _TYPE_FOLDER_MAP.get((item.get("type") or "").strip(), "other"),
+                _sanitize_name(item.get("filename") or "", raw_basename),
+            ]
+        dir_part = "/".join(parts[:-1])
+        name, ext = os.path.splitext(parts[-1])
+        arcname = "/".join(parts)
+        index = 1
+        while arcname in used:
+            arcname = f"{dir_part}/{name}({index}){ext}" if dir_part else f"{name}({index}){ext}"
+            index += 1
+        used.add(arcname)
+        entries.append((arcname, url))
+    return entries
+
+
+def _stream_zip(entries: list):
+    """
+    并发下载成员，按完成顺序逐个写入 ZIP 并分块产出。
+    同时进行中的下载不超过 ZIP_EXPORT_WINDOW 个，写出一个再补充一个，
+    临时文件占用的磁盘空间与客户端读取速度挂钩，也不会长时间占满共享下载线程池。
+    下载失败的文件记录在压缩包内的「下载失败.txt」中。
+    """
+    tmp_dir = tempfile.mkdtemp(prefix="bili_zip_")
+    sink = _ZipStreamSink()
+    cancelled = threading.Event()
+    remaining = iter(entries)
+    pending = {}
+    failed = []
+
+    def _submit_next():
+        entry = next(remaining, None)
+        if entry is not None:
+            arcname, url = entry
+            pending[_download_engine.submit_call(url, _download_to_temp, url, tmp_dir, cancelled)] = entry
+
+    try:
+        for _ in range(ZIP_EXPORT_WINDOW):
+            _submit_next()
+
+        with zipfile.ZipFile(sink, "w", allowZip64=True) as zf:
+            while pending:
+                done, _not_done = wait_futures(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    arcname, url = pending.pop(future)
+                    _submit_next()
+                    try:
+                        tmp_path = future.result()
+                    except Exception as e:
+                        LOGGER.error(f"ZIP 成员下载失败: {url} | {e}")
+                        failed.append(f"{arcname}\t{url}\t{e}")
+                        continue
+
+                    zinfo = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+                    ext = os.path.splitext(arcname)[1].lower()
+                    zinfo.compress_type = zipfile.ZIP_STORED if ext in _ZIP_STORED_EXTS else zipfile.ZIP_DEFLATED
+                    # 预先填入大小，zipfile 据此决定是否使用 zip64
+                    zinfo.file_size = os.path.getsize(tmp_path)
+                    with open(tmp_path, "rb") as src, zf.open(zinfo, "w") as dest:
+                        for chunk in iter(lambda: src.read(_DOWNLOAD_CHUNK_SIZE), b""):
+                            dest.write(chunk)
+                            data = sink.drain()
+                            if data:
+                                yield data
+                    os.remove(tmp_path)
+                    yield sink.drain()
+
+            if failed:
+                zf.writestr("下载失败.txt", "\n".join(failed))
+        # 中央目录
+        yield sink.drain()
+        LOGGER.info(f"ZIP 导出完成: total={len(entries)}, failed={len(failed)}")
+    finally:
+        # 客户端断开时：未开始的任务直接取消，进行中的下载在下一个数据块时发现标志并删除临时文件
+        cancelled.set()
+        for future in pending:
+            future.cancel()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+@app.route("/api/export_zip", methods=["POST"])
+def export_zip():
+    """
+    在服务端打包整个收藏集并以流式 ZIP 返回，边下载成员边输出，浏览器无需在内存中组装压缩包。
+    请求体：JSON {"links": [...], "filename": "xxx.zip"}，
+    或表单字段 payload（同结构的 JSON 字符串，便于浏览器直接提交表单触发下载）。
+    links 中每项与 /api/save_files 相同，可额外携带 zipPath 指定压缩包内路径。
+    """
+    payload = request.get_json(silent=True)
+    if payload is None and request.form.get("payload"):
+        try:
+            payload = json.loads(request.form["payload"])
+        except ValueError:
+            payload = None
+    payload = payload or {}
+
+    links = payload.get("links") or []
+    if not isinstance(links, list) or not links:
+        return jsonify({"code": -1, "message": "缺少 links 参数"}), 400
+
+    entries = _zip_entries(links)
+    if not entries:
+        return jsonify({"code": -1, "message": "links 中没有有效的 url"}), 400
+
+    filename = _sanitize_name(str(payload.get("filename") or ""), "archive.zip")
+    if not filename.lower().endswith(".zip"):
+        filename += ".zip"
+
+    LOGGER.info(f"/api/export_zip 开始打包: {filename}, {len(entries)} 个文件")
+    return Response(
+        _stream_zip(entries),
+        mimetype="application/zip",
+        headers={"Content-Disposition": _content_disposition(filename, "attachment")},
+    )
 
 
 @app.route("/api/save_file", methods=["POST"])
@@ -883,6 +4328,8 @@ def save_files():
     """
     应用模式批量下载并按目录保存文件。
     目录结构：downloads/<合集名>/<类型目录>/<文件名>
+    下载由 DownloadEngine 并发执行，results 仍按 index 顺序返回。
+    本接口在请求内同步完成；需要暂停/继续或重启后续跑的批次请使用 /api/download_jobs。
     """
     payload = request.get_json(silent=True) or {}
     links = payload.get("links") or []
@@ -890,32 +4337,12 @@ def save_files():
     if not isinstance(links, list) or not links:
         return jsonify({"code": -1, "message": "缺少 links 参数"}), 400
 
-    root_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "downloads")
-    os.makedirs(root_dir, exist_ok=True)
-
-    saved_count = 0
-    failed_count = 0
-    duplicate_count = 0
-    results = []
-
-    for i, item in enumerate(links):
-        try:
-            one = _save_single_link(item, root_dir)
-            saved_count += 1
-            if one.get("duplicate"):
-                duplicate_count += 1
-            results.append({
-                "index": i,
-                **one,
-            })
-        except Exception as e:
-            failed_count += 1
-            LOGGER.error(f"保存文件失败: index={i}, error={e}", exc_info=True)
-            results.append({
-                "index": i,
-                "code": -1,
-                "message": str(e),
-            })
+    root_dir = _downloads_dir()
+    results = _download_engine.save_links(links, root_dir)
+    saved_count = sum(1 for one in results if one.get("code") == 0)
+    failed_count = len(results) - saved_count
+    duplicate_count = sum(1 for one in results if one.get("duplicate"))
+    skipped_count = sum(1 for one in results if one.get("skipped"))
 
     code = 0 if saved_count > 0 else -1
     message = "完成" if failed_count == 0 else f"部分失败: {failed_count}"
@@ -927,11 +4354,749 @@ def save_files():
         "saved_count": saved_count,
         "failed_count": failed_count,
         "duplicate_count": duplicate_count,
+        "skipped_count": skipped_count,
         "results": results,
     })
 
 
+# ====== 持久化下载任务队列（进程重启后自动续跑）======
+
+class DownloadJobStore:
+    """
+    下载任务的持久化存储（SQLite），记录每个任务及其中每条链接的状态：
+    pending / in_flight / done / failed。进程异常退出后，in_flight 的条目在启动时回退为 pending。
+    """
+
+    DB_NAME = ".download_jobs.db"
+
+    def __init__(self, root_dir: str):
+        self.root_dir = os.path.abspath(root_dir)
+        self.db_path = os.path.join(self.root_dir, self.DB_NAME)
+        self._lock = threading.RLock()
+        os.makedirs(self.root_dir, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id         TEXT PRIMARY KEY,
+                status     TEXT NOT NULL,
+                total      INTEGER NOT NULL,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS job_items (
+                job_id  TEXT NOT NULL,
+                idx     INTEGER NOT NULL,
+                item    TEXT NOT NULL,
+                state   TEXT NOT NULL DEFAULT 'pending',
+                sha256  TEXT NOT NULL DEFAULT '',
+                result  TEXT NOT NULL DEFAULT '',
+                PRIMARY KEY (job_id, idx)
+            );
+            CREATE INDEX IF NOT EXISTS idx_job_items_state ON job_items (job_id, state);
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def create_job(self, links: list) -> str:
+        job_id = uuid.uuid4().hex[:12]
+        now = self._now()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, total, created_at, updated_at) VALUES (?, 'running', ?, ?, ?)",
+                (job_id, len(links), now, now),
+            )
+            self._conn.executemany(
+                "INSERT INTO job_items (job_id, idx, item) VALUES (?, ?, ?)",
+                [(job_id, i, json.dumps(item, ensure_ascii=False)) for i, item in enumerate(links)],
+            )
+            self._conn.commit()
+        return job_id
+
+    def get_status(self, job_id: str):
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def set_status(self, job_id: str, status: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?", (status, self._now(), job_id),
+            )
+            self._conn.commit()
+
+    def claim(self, job_id: str, limit: int) -> list:
+        """
+        取出至多 limit 个 pending 条目并标记为 in_flight，返回 [(idx, item), ...]。
+        状态检查与取出在同一把锁内完成，任务已暂停/取消时返回空列表。
+        """
+        with self._lock:
+            if self.get_status(job_id) != "running":
+                return []
+            rows = self._conn.execute(
+                "SELECT idx, item FROM job_items WHERE job_id = ? AND state = 'pending' ORDER BY idx LIMIT ?",
+                (job_id, limit),
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE job_items SET state = 'in_flight' WHERE job_id = ? AND idx = ?",
+                [(job_id, idx) for idx, _ in rows],
+            )
+            self._conn.commit()
+        return [(idx, json.loads(item)) for idx, item in rows]
+
+    def finish_item(self, job_id: str, idx: int, result: dict):
+        state = "done" if result.get("code") == 0 else "failed"
+        with self._lock:
+            self._conn.execute(
+                "UPDATE job_items SET state = ?, sha256 = ?, result = ? WHERE job_id = ? AND idx = ?",
+                (state, result.get("hash") or "", json.dumps(result, ensure_ascii=False), job_id, idx),
+            )
+            self._conn.commit()
+
+    def requeue(self, job_id: str, states=("in_flight",)) -> int:
+        """把指定状态的条目重新置为 pending，返回条目数。"""
+        marks = ",".join("?" for _ in states)
+        with self._lock:
+            cur = self._conn.execute(
+                f"UPDATE job_items SET state = 'pending', result = '' WHERE job_id = ? AND state IN ({marks})",
+                (job_id, *states),
+            )
+            self._conn.commit()
+        return cur.rowcount
+
+    def requeue_stopped(self) -> dict:
+        """
+        把已暂停/取消/完成的任务中遗留的 in_flight 条目置回 pending，返回 {job_id: 条目数}。
+        只在启动时调用：这些条目是上次进程退出时尚未下载完的，不会再有执行线程处理它们。
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT i.job_id, COUNT(*) FROM job_items i JOIN jobs j ON j.id = i.job_id "
+                "WHERE i.state = 'in_flight' AND j.status != 'running' GROUP BY i.job_id"
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE job_items SET state = 'pending', result = '' WHERE job_id = ? AND state = 'in_flight'",
+                [(job_id,) for job_id, _ in rows],
+            )
+            self._conn.commit()
+        return dict(rows)
+
+    def unfinished_jobs(self) -> list:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT id FROM jobs WHERE status = 'running'")]
+
+    def summary(self, job_id: str, with_results: bool = False):
+        with self._lock:
+            job = self._conn.execute(
+                "SELECT id, status, total, created_at, updated_at FROM jobs WHERE id = ?", (job_id,),
+            ).fetchone()
+            if not job:
+                return None
+            counts = dict(self._conn.execute(
+                "SELECT state, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY state", (job_id,),
+            ).fetchall())
+            rows = self._conn.execute(
+                "SELECT result FROM job_items WHERE job_id = ? AND state IN ('done', 'failed') ORDER BY idx",
+                (job_id,),
+            ).fetchall() if with_results else []
+        data = {
+            "job_id": job[0],
+            "status": job[1],
+            "total": job[2],
+            "created_at": job[3],
+            "updated_at": job[4],
+            "pending": counts.get("pending", 0),
+            "in_flight": counts.get("in_flight", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+        }
+        if with_results:
+            data["results"] = [json.loads(row[0]) for row in rows]
+        return data
+
+    def list_jobs(self) -> list:
+        with self._lock:
+            ids = [row[0] for row in self._conn.execute("SELECT id FROM jobs ORDER BY created_at DESC")]
+        return [self.summary(job_id) for job_id in ids]
+
+
+_download_job_store = None
+_download_job_store_lock = threading.Lock()
+_download_job_threads = {}
+_download_job_meters = {}
+
+
+def _get_download_job_store() -> DownloadJobStore:
+    global _download_job_store
+    with _download_job_store_lock:
+        if _download_job_store is None:
+            _download_job_store = DownloadJobStore(_downloads_dir())
+        return _download_job_store
+
+
+def _run_download_job(job_id: str):
+    """任务执行线程：按窗口从存储中取 pending 条目交给下载引擎，直到完成、暂停或取消。"""
+    store = _get_download_job_store()
+    root_dir = _downloads_dir()
+    window = _download_engine.max_workers * 2
+    in_flight = threading.BoundedSemaphore(window)
+    meter = _download_job_meters[job_id] = ProgressMeter()
+
+    def _on_done(future, idx):
+        try:
+            store.finish_item(job_id, idx, future.result())
+        finally:
+            in_flight.release()
+
+    while True:
+        while store.get_status(job_id) == "running":
+            in_flight.acquire()
+            claimed = store.claim(job_id, 1)
+            if not claimed:
+                in_flight.release()
+                break
+            idx, item = claimed[0]
+            future = _download_engine.submit(idx, item, root_dir, meter)
+            future.add_done_callback(lambda f, i=idx: _on_done(f, i))
+
+        for _ in range(window):
+            in_flight.acquire()
+        for _ in range(window):
+            in_flight.release()
+
+        with _download_job_store_lock:
+            summary = store.summary(job_id)
+            # 等待收尾期间任务可能被重新 resume，此时继续执行而不是退出
+            if summary["status"] == "running" and summary["pending"] > 0:
+                continue
+            if summary["status"] == "running":
+                store.set_status(job_id, "done")
+            _download_job_threads.pop(job_id, None)
+            _download_job_meters.pop(job_id, None)
+            break
+
+    LOGGER.info(
+        f"[download {job_id}] 执行结束: status={store.get_status(job_id)}, "
+        f"done={summary['done']}/{summary['total']}, failed={summary['failed']}"
+    )
+
+
+def _start_download_job(job_id: str) -> threading.Thread:
+    """启动任务执行线程；同一任务只会有一个执行线程。"""
+    with _download_job_store_lock:
+        thread = _download_job_threads.get(job_id)
+        if thread is None or not thread.is_alive():
+            thread = threading.Thread(target=_run_download_job, args=(job_id,), name=f"download-{job_id}", daemon=True)
+            _download_job_threads[job_id] = thread
+            thread.start()
+        return thread
+
+
+def _download_job_snapshot(job_id: str, with_results: bool = False):
+    """任务摘要附带本次执行的字节数、吞吐量和预计剩余时间。"""
+    summary = _get_download_job_store().summary(job_id, with_results=with_results)
+    if summary is None:
+        return None
+    meter = _download_job_meters.get(job_id)
+    remaining = summary["pending"] + summary["in_flight"]
+    summary["progress"] = meter.snapshot(remaining) if meter else ProgressMeter().snapshot(remaining)
+    return summary
+
+
+_download_jobs_resumed = False
+
+
+def resume_download_jobs():
+    """
+    启动时恢复上次未完成的任务：回退 in_flight 条目并重新开始执行。
+    由启动入口（server.py / run_web.py / app.py）调用，import server 本身不会发起下载；重复调用只执行一次。
+    """
+    global _download_jobs_resumed
+    with _download_job_store_lock:
+        if _download_jobs_resumed:
+            return
+        _download_jobs_resumed = True
+    try:
+        store = _get_download_job_store()
+        for job_id, requeued in store.requeue_stopped().items():
+            LOGGER.info(f"[download {job_id}] 回退 {requeued} 个上次退出时执行中的条目")
+        for job_id in store.unfinished_jobs():
+            requeued = store.requeue(job_id)
+            LOGGER.info(f"[download {job_id}] 恢复未完成的下载任务，回退 {requeued} 个执行中条目")
+            _start_download_job(job_id)
+    except Exception:
+        LOGGER.error("恢复下载任务失败", exc_info=True)
+
+
+@app.route("/api/download_jobs", methods=["GET", "POST"])
+def download_jobs():
+    """
+    GET  — 列出所有持久化下载任务
+    POST — 创建任务，JSON: {"links": [...]}，条目格式与 /api/save_files 相同
+    任务状态保存在 downloads/.download_jobs.db，服务重启后自动继续。
+    """
+    store = _get_download_job_store()
+    if request.method == "GET":
+        return jsonify({"code": 0, "data": store.list_jobs()})
+
+    payload = request.get_json(silent=True) or {}
+    links = payload.get("links") or []
+    if not isinstance(links, list) or not links:
+        return jsonify({"code": -1, "message": "缺少 links 参数"}), 400
+
+    job_id = store.create_job(links)
+    _start_download_job(job_id)
+    LOGGER.info(f"[download {job_id}] 创建下载任务: {len(links)} 个文件")
+    return jsonify({"code": 0, "root_dir": _downloads_dir(), "data": _download_job_snapshot(job_id)})
+
+
+@app.route("/api/download_jobs/<job_id>")
+def download_job_detail(job_id):
+    """查询下载任务进度；results=1 时附带已完成条目的结果。"""
+    summary = _download_job_snapshot(job_id, with_results=request.args.get("results") == "1")
+    if not summary:
+        return jsonify({"code": -1, "message": "下载任务不存在"}), 404
+    return jsonify({"code": 0, "root_dir": _downloads_dir(), "data": summary})
+
+
+@app.route("/api/download_jobs/<job_id>/events")
+def download_job_events(job_id):
+    """
+    以 SSE 推送下载任务进度。暂停时发送 paused 事件并保持连接（resume 后继续推送 progress），
+    任务完成或取消且没有执行中的文件时发送 end 事件。
+    """
+    if not _download_job_snapshot(job_id):
+        return jsonify({"code": -1, "message": "下载任务不存在"}), 404
+    return _sse_response(
+        lambda: _download_job_snapshot(job_id),
+        lambda data: data["status"] not in ("running", "paused") and data["in_flight"] == 0,
+        lambda data: "paused" if data["status"] == "paused" else "progress",
+    )
+
+
+@app.route("/api/download_jobs/<job_id>/<action>", methods=["POST"])
+def control_download_job(job_id, action):
+    """
+    控制下载任务:
+      pause  — 暂停，执行中的文件下载完成后停止
+      resume — 继续；JSON {"retry_failed": true} 时同时重试失败条目
+      cancel — 取消，未开始的条目不再下载
+    """
+    store = _get_download_job_store()
+    status = store.get_status(job_id)
+    if status is None:
+        return jsonify({"code": -1, "message": "下载任务不存在"}), 404
+    if action not in ("pause", "resume", "cancel"):
+        return jsonify({"code": -1, "message": f"不支持的操作: {action}"}), 400
+
+    if action == "pause":
+        if status == "running":
+            store.set_status(job_id, "paused")
+    elif action == "cancel":
+        if status in ("running", "paused"):
+            store.set_status(job_id, "cancelled")
+    else:
+        payload = request.get_json(silent=True) or {}
+        if payload.get("retry_failed"):
+            store.requeue(job_id, ("failed",))
+        # 暂停期间执行线程可能已退出，in_flight 条目需要回退后重新执行
+        with _download_job_store_lock:
+            thread = _download_job_threads.get(job_id)
+        if thread is None or not thread.is_alive():
+            store.requeue(job_id)
+        store.set_status(job_id, "running")
+        _start_download_job(job_id)
+    LOGGER.info(f"[download {job_id}] {action}")
+    return jsonify({"code": 0, "data": _download_job_snapshot(job_id)})
+
+
+# ====== 服务端整合集下载流水线（act_id → 磁盘文件）======
+
+# 与前端 safeName 保持一致：空白字符也替换为下划线
+_JS_UNSAFE_NAME_RE = re.compile(r'[<>:"/\\|?*\s]')
+
+
+def _js_safe_name(name: str) -> str:
+    return _JS_UNSAFE_NAME_RE.sub("_", name or "")
+
+
+def _extract_collection_links(data: dict, opts: dict) -> dict:
+    """
+    从收藏集详情中提取下载链接（static/app.js 中 parseData 的服务端实现）。
+    opts: {"img": bool, "vid": bool, "wm": bool}
+    返回: {"name": 收藏集名, "cards": [{"card_name": ..., "links": [{"url", "type", "ext"}, ...]}, ...]}
+    """
+    cards = OrderedDict()
+
+    def _entry(card_name):
+        return cards.setdefault(card_name, {"card_name": card_name, "links": []})
+
+    def _add(card_name, url, link_type, ext):
+        _entry(card_name)["links"].append({"url": url, "type": link_type, "ext": ext})
+
+    def _first(values):
+        return values[0] if isinstance(values, list) and values else None
+
+    for item in data.get("item_list") or []:
+        card = (item or {}).get("card_info")
+        if not card:
+            continue
+        cn = card.get("card_name") or "unnamed"
+        _entry(cn)
+        if opts.get("img") and card.get("card_img"):
+            _add(cn, card["card_img"], "dl-a-img", "png")
+        if opts.get("vid") and _first(card.get("video_list")):
+            _add(cn, card["video_list"][0], "dl-a-vid", "mp4")
+        if opts.get("wm") and _first(card.get("video_list_download")):
+            _add(cn, card["video_list_download"][0], "dl-a-wm", "mp4")
+
+    collect_list = data.get("collect_list")
+    if isinstance(collect_list, list):
+        collect_infos = collect_list
+    elif isinstance(collect_list, dict):
+        collect_infos = collect_list.get("collect_infos") or []
+    else:
+        collect_infos = []
+
+    for c in collect_infos:
+        if not c:
+            continue
+        # card_type_info 的结构与 card_info 不同：name/overview_image/content.animation/watermark_animations
+        cti = (c.get("card_item") or {}).get("card_type_info")
+        if cti:
+            cn = cti.get("name") or "unnamed"
+            _entry(cn)
+            animation = (cti.get("content") or {}).get("animation") or {}
+            img = cti.get("overview_image") or animation.get("animation_first_frame")
+            vid = _first(animation.get("animation_video_urls"))
+            wm = (_first(cti.get("watermark_animations")) or {}).get("watermark_animation")
+            if opts.get("img") and img:
+                _add(cn, img, "dl-a-img", "png")
+            if opts.get("vid") and vid:
+                _add(cn, vid, "dl-a-vid", "mp4")
+            if opts.get("wm") and wm:
+                _add(cn, wm, "dl-a-wm", "mp4")
+
+        # 奖励图片，使用单独的 key 前缀避免与卡片重名
+        reward_name = c.get("redeem_item_name") or "奖励"
+        img_url = c.get("redeem_item_image") or c.get("redeem_detail_image") or ""
+        detail_url = c.get("redeem_detail_image") or ""
+        if opts.get("img") and img_url:
+            _add("🎁 " + reward_name, img_url, "dl-a-img", "png")
+        if opts.get("img") and detail_url and detail_url != img_url:
+            _add("🎁 " + reward_name + " (详情)", detail_url, "dl-a-img", "png")
+
+    for emo in data.get("_emoji_packages") or []:
+        if not emo or not emo.get("name"):
+            continue
+        key = "😊 " + emo["name"]
+        _entry(key)
+        images = emo.get("images") or {}
+        if opts.get("img"):
+            for field, ext in (("static", "png"), ("gif", "gif"), ("webp", "webp")):
+                if images.get(field):
+                    _add(key, images[field], "dl-a-img", ext)
+
+    return {"name": data.get("name") or "未知收藏集", "cards": list(cards.values())}
+
+
+def _collection_download_items(parsed: dict) -> list:
+    """把提取结果转换为 _save_single_link 使用的条目，命名规则与前端“下载全部”一致。"""
+    folder = _js_safe_name(parsed.get("name") or "未知合集")
+    items = []
+    for card in parsed["cards"]:
+        for link in card["links"]:
+            filename = _js_safe_name(card["card_name"])
+            if link["type"] == "dl-a-wm":
+                filename += "-水印"
+            items.append({
+                "url": link["url"],
+                "filename": f"{filename}.{link['ext']}",
+                "type": link["type"],
+                "collectionFolder": folder,
+            })
+    return items
+
+
+class CollectionJob:
+    """
+    整合集下载任务：act_id → 分组列表 → 逐个分组取详情并提取链接 → 下载引擎 → 写盘。
+    生产者线程只负责取元数据和提交下载，下载在 DownloadEngine 线程池中进行，
+    因此下一个分组的元数据请求与当前分组的下载是重叠执行的。
+    """
+
+    def __init__(self, act_id: str, opts: dict, root_dir: str, refresh: bool = False):
+        self.id = uuid.uuid4().hex[:12]
+        self.act_id = act_id
+        self.opts = opts
+        self.root_dir = root_dir
+        self.refresh = refresh
+        self.status = "running"
+        self.message = ""
+        self.lottery_total = 0
+        self.lottery_done = 0
+        self.collections = []
+        self.total = 0
+        self.done = 0
+        self.saved = 0
+        self.duplicate = 0
+        self.skipped = 0
+        self.failed = []
+        self.created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.finished_at = ""
+        self.finished_ts = 0.0
+        self.meter = ProgressMeter()
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        # 每个下载项在本任务内的序号，作为 DownloadEngine 结果中的 index
+        self._next_index = 0
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _fetch_lottery(self, param: dict) -> dict:
+        data = dict(_get_lottery_detail(param["act_id"], param["lottery_id"], refresh=self.refresh))
+        goods_id = param.get("goods_id") or ""
+        if goods_id.isdigit():
+            emoji_items = _fetch_suit_components(int(goods_id), refresh=self.refresh)
+            if emoji_items:
+                data["_emoji_packages"] = emoji_items
+        return data
+
+    def _on_saved(self, future, item: dict, in_flight):
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {"code": -1, "message": str(e)}
+        with self._lock:
+            self.done += 1
+            if result.get("code") == 0:
+                self.saved += 1
+                self.duplicate += 1 if result.get("duplicate") else 0
+                self.skipped += 1 if result.get("skipped") else 0
+            else:
+                self.failed.append({"index": result.get("index"), "url": item["url"],
+                                    "message": result.get("message", "")})
+        in_flight.release()
+
+    def run(self):
+        # 限制已提交但未完成的下载数量，避免大合集一次性堆满线程池队列
+        max_in_flight = _download_engine.max_workers * 2
+        in_flight = threading.BoundedSemaphore(max_in_flight)
+        try:
+            params, error = get_lottery_params_by_act_id(self.act_id, refresh=self.refresh)
+            if error:
+                raise RuntimeError(error)
+            self.lottery_total = len(params)
+
+            for param in params:
+                if self._cancel.is_set():
+                    break
+                try:
+                    parsed = _extract_collection_links(self._fetch_lottery(param), self.opts)
+                except Exception as e:
+                    LOGGER.error(f"[collection {self.id}] 获取分组失败: lottery_id={param['lottery_id']}, {e}")
+                    with self._lock:
+                        self.failed.append({"lottery_id": param["lottery_id"], "message": str(e)})
+                        self.lottery_done += 1
+                    continue
+
+                items = _collection_download_items(parsed)
+                with self._lock:
+                    self.collections.append({"lottery_id": param["lottery_id"], "name": parsed["name"],
+                                             "links": len(items)})
+                    self.total += len(items)
+                for item in items:
+                    if self._cancel.is_set():
+                        break
+                    in_flight.acquire()
+                    with self._lock:
+                        index = self._next_index
+                        self._next_index += 1
+                    future = _download_engine.submit(index, item, self.root_dir, self.meter)
+                    future.add_done_callback(lambda f, it=item: self._on_saved(f, it, in_flight))
+                with self._lock:
+                    self.lottery_done += 1
+
+            for _ in range(max_in_flight):
+                in_flight.acquire()
+            self.status = "cancelled" if self._cancel.is_set() else "done"
+        except Exception as e:
+            LOGGER.error(f"[collection {self.id}] 任务异常终止: {e}", exc_info=True)
+            self.status = "failed"
+            self.message = str(e)
+        self.finished_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.finished_ts = time.time()
+        LOGGER.info(
+            f"[collection {self.id}] 下载结束: act_id={self.act_id}, status={self.status}, "
+            f"saved={self.saved}/{self.total}, failed={len(self.failed)}"
+        )
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "act_id": self.act_id,
+                "status": self.status,
+                "message": self.message,
+                "root_dir": self.root_dir,
+                "lottery_total": self.lottery_total,
+                "lottery_done": self.lottery_done,
+                "collections": list(self.collections),
+                "total": self.total,
+                "done": self.done,
+                "saved_count": self.saved,
+                "duplicate_count": self.duplicate,
+                "skipped_count": self.skipped,
+                "failed_count": len(self.failed),
+                "failed": self.failed[:50],
+                "progress": self.meter.snapshot(self.total - self.done),
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+            }
+
+
+_collection_jobs = {}
+_collection_jobs_lock = threading.Lock()
+
+
+@app.route("/api/collection_jobs", methods=["GET", "POST"])
+def collection_jobs():
+    """
+    GET  — 列出所有整合集下载任务
+    POST — 创建任务，JSON: {"act_id": ..., "types": ["img", "vid", "wm"], "refresh": false}
+    文件保存到 downloads/<合集名>/<类型目录>/，目录结构与 /api/save_files 相同。
+    """
+    _prune_finished_jobs(_collection_jobs, _collection_jobs_lock)
+    if request.method == "GET":
+        with _collection_jobs_lock:
+            jobs = list(_collection_jobs.values())
+        return jsonify({"code": 0, "data": [job.snapshot() for job in jobs]})
+
+    payload = request.get_json(silent=True) or {}
+    act_id = str(payload.get("act_id") or "").strip()
+    if not act_id.isdigit():
+        return jsonify({"code": -1, "message": "act_id 必须为数字"}), 400
+    types = payload.get("types") or ["img", "vid", "wm"]
+    if not isinstance(types, list):
+        return jsonify({"code": -1, "message": "types 必须为数组"}), 400
+    opts = {name: name in types for name in ("img", "vid", "wm")}
+    if not any(opts.values()):
+        return jsonify({"code": -1, "message": "请至少选择一种下载类型"}), 400
+
+    root_dir = _downloads_dir()
+    job = CollectionJob(act_id, opts, root_dir, refresh=bool(payload.get("refresh")))
+    with _collection_jobs_lock:
+        _collection_jobs[job.id] = job
+    threading.Thread(target=job.run, name=f"collection-{job.id}", daemon=True).start()
+    LOGGER.info(f"[collection {job.id}] 创建整合集下载任务: act_id={act_id}, opts={opts}")
+    return jsonify({"code": 0, "data": job.snapshot()})
+
+
+@app.route("/api/collection_jobs/<job_id>")
+def collection_job_detail(job_id):
+    """查询整合集下载任务进度。"""
+    job = _collection_jobs.get(job_id)
+    if not job:
+        return jsonify({"code": -1, "message": "下载任务不存在"}), 404
+    return jsonify({"code": 0, "data": job.snapshot()})
+
+
+@app.route("/api/collection_jobs/<job_id>/events")
+def collection_job_events(job_id):
+    """以 SSE 推送整合集下载进度，任务结束时发送 end 事件。"""
+    job = _collection_jobs.get(job_id)
+    if not job:
+        return jsonify({"code": -1, "message": "下载任务不存在"}), 404
+    return _sse_response(job.snapshot, lambda data: data["status"] != "running")
+
+
+@app.route("/api/collection_jobs/<job_id>/cancel", methods=["POST"])
+def cancel_collection_job(job_id):
+    """取消整合集下载任务，已提交的下载完成后任务结束。"""
+    job = _collection_jobs.get(job_id)
+    if not job:
+        return jsonify({"code": -1, "message": "下载任务不存在"}), 404
+    job.cancel()
+    return jsonify({"code": 0, "data": job.snapshot()})
+
+
+@app.route("/api/hash_index/rebuild", methods=["POST"])
+def rebuild_hash_index():
+    """
+    重建 downloads 目录的哈希索引，用于手动增删改过文件之后。
+    参数（JSON，可选）:
+      force   — 为 true 时忽略 mtime/size 校验，全部重新计算 hash
+      objects — 为 true 时同时把已有文件纳入对象存储（跨合集合并相同内容）并清理无引用的对象
+      phash   — 为 true 时为尚未计算感知哈希的图片补算
+    """
+    payload = request.get_json(silent=True) or {}
+    root_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "downloads")
+    try:
+        stats = _get_hash_index(root_dir).rebuild(force=bool(payload.get("force")))
+        if payload.get("objects"):
+            stats["objects"] = _sync_object_store(root_dir)
+        if payload.get("phash"):
+            stats["phash"] = _backfill_perceptual_hashes(root_dir)
+        return jsonify({"code": 0, "root_dir": root_dir, "data": stats})
+    except Exception as e:
+        LOGGER.error(f"重建哈希索引失败: {e}", exc_info=True)
+        return jsonify({"code": -1, "message": "重建哈希索引失败"}), 500
+
+
+@app.route("/api/near_duplicates")
+def near_duplicates():
+    """
+    下载库中的近似重复图片（按感知哈希聚类）。
+    参数:
+      max_distance — pHash 最大汉明距离（默认 BILI_PHASH_MAX_DISTANCE，不能超过该值）
+      max_dhash    — 同时要求 dHash 距离不超过该值（可选，用于减少误判）
+      limit        — 最多返回的分组数（默认 100）
+    """
+    root_dir = _downloads_dir()
+    max_distance = _int_arg("max_distance")
+    max_distance = PHASH_MAX_DISTANCE if max_distance is None else min(max_distance, PHASH_MAX_DISTANCE)
+    limit = _int_arg("limit") or 100
+    try:
+        clusters = _get_perceptual_index(root_dir).clusters(max_distance, _int_arg("max_dhash"))
+        files_by_hash = {}
+        for path, file_hash, size in _get_hash_index(root_dir).iter_files():
+            files_by_hash.setdefault(file_hash, []).append({
+                "path": os.path.relpath(path, root_dir).replace(os.sep, "/"),
+                "size": size,
+            })
+        data = [
+            {
+                "count": len(cluster["hashes"]),
+                "max_distance": cluster["max_distance"],
+                "items": [
+                    {"sha256": file_hash, "files": files_by_hash.get(file_hash, [])}
+                    for file_hash in cluster["hashes"]
+                ],
+            }
+            for cluster in clusters[:limit]
+        ]
+        return jsonify({"code": 0, "total": len(clusters), "max_distance": max_distance, "data": data})
+    except Exception as e:
+        LOGGER.error(f"查询近似重复图片失败: {e}", exc_info=True)
+        return jsonify({"code": -1, "message": "查询近似重复图片失败"}), 500
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "rebuild-hash-index":
+        # python server.py rebuild-hash-index [--force] [--objects] [--phash]
+        downloads_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "downloads")
+        print(_get_hash_index(downloads_dir).rebuild(force="--force" in sys.argv))
+        if "--objects" in sys.argv:
+            print(_sync_object_store(downloads_dir))
+        if "--phash" in sys.argv:
+            print(_backfill_perceptual_hashes(downloads_dir))
+        sys.exit(0)
+
+    resume_download_jobs()
     import socket
     hostname = socket.gethostname()
     local_ip = socket.gethostbyname(hostname)
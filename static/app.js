@@ -500,7 +500,7 @@ function renderSearchResults(items, append) {
         coverWrap.className = "search-cover";
         if (item.cover) {
             var img = document.createElement("img");
-            img.src = API_BASE + "/api/proxy_img?url=" + encodeURIComponent(item.cover);
+            img.src = proxyImgUrl(item.cover, 120);
             img.alt = item.name || item.act_id;
             coverWrap.appendChild(img);
         } else {
@@ -909,8 +909,8 @@ function renderResults(collections) {
 
                     if (activeType === "img" && dl.cls === "dl-a-img") {
                         const img = document.createElement("img");
-                        // 使用后端代理加载图片，避免浏览器长按保存为 HTML（代理需返回正确的 image/* Content-Type）
-                        img.src = `${API_BASE}/api/proxy_img?url=${encodeURIComponent(dl.url)}`;
+                        // 使用后端代理加载缩略图，避免浏览器长按保存为 HTML（代理需返回正确的 image/* Content-Type）
+                        img.src = proxyImgUrl(dl.url, 360);
                         img.alt = "图片预览";
                         img.loading = "lazy";
                         img.referrerPolicy = "no-referrer";
@@ -919,6 +919,7 @@ function renderResults(collections) {
                     } else if (activeType === "vid" && dl.cls === "dl-a-vid") {
                         const video = document.createElement("video");
                         video.src = dl.url;
+                        video.poster = videoPosterUrl(dl.url, 360);
                         video.controls = true;
                         video.preload = "none";
                         preview.appendChild(video);
@@ -926,6 +927,7 @@ function renderResults(collections) {
                     } else if (activeType === "wm" && dl.cls === "dl-a-wm") {
                         const video = document.createElement("video");
                         video.src = dl.url;
+                        video.poster = videoPosterUrl(dl.url, 360);
                         video.controls = true;
                         video.preload = "none";
                         preview.appendChild(video);
@@ -1317,7 +1319,7 @@ function appendSingleBlock(container, coll) {
                     seen.add(key);
                     if (activeType === "img" && dl.cls === "dl-a-img") {
                         const img = document.createElement("img");
-                        img.src = `${API_BASE}/api/proxy_img?url=${encodeURIComponent(dl.url)}`;
+                        img.src = proxyImgUrl(dl.url, 360);
                         img.alt = "图片预览";
                         img.loading = "lazy";
                         img.referrerPolicy = "no-referrer";
@@ -1326,6 +1328,7 @@ function appendSingleBlock(container, coll) {
                     } else if (activeType === "vid" && dl.cls === "dl-a-vid") {
                         const video = document.createElement("video");
                         video.src = dl.url;
+                        video.poster = videoPosterUrl(dl.url, 360);
                         video.controls = true;
                         video.preload = "none";
                         preview.appendChild(video);
@@ -1333,6 +1336,7 @@ function appendSingleBlock(container, coll) {
                     } else if (activeType === "wm" && dl.cls === "dl-a-wm") {
                         const video = document.createElement("video");
                         video.src = dl.url;
+                        video.poster = videoPosterUrl(dl.url, 360);
                         video.controls = true;
                         video.preload = "none";
                         preview.appendChild(video);
@@ -1774,40 +1778,37 @@ async function downloadAll() {
         // 应用模式下优先走后端按目录落盘
         if (isAppMode()) {
             try {
-                let savedCount = 0;
-                let failedCount = 0;
-                let duplicateCount = 0;
-                let rootDir = "";
-
-                for (let i = 0; i < links.length; i++) {
-                    const link = links[i];
-                    setZipProgress(`正在保存 ${i + 1}/${links.length}：${link.filename}`);
-
-                    try {
-                        const resp = await fetch(`${API_BASE}/api/save_file`, {
-                            method: "POST",
-                            headers: { "Content-Type": "application/json" },
-                            body: JSON.stringify({ item: link }),
-                        });
-                        const j = await resp.json();
-
-                        if (j && j.code === 0) {
-                            savedCount += 1;
-                            if (j.duplicate) {
-                                duplicateCount += 1;
-                            }
-                            if (j.root_dir) {
-                                rootDir = j.root_dir;
-                            }
-                        } else {
-                            failedCount += 1;
-                            console.error("保存单文件失败:", j, link);
-                        }
-                    } catch (err) {
-                        failedCount += 1;
-                        console.error("保存单文件异常:", err, link);
-                    }
+                // 提交为服务端持久化任务，窗口关闭后重新打开服务也会继续下载
+                const createResp = await fetch(`${API_BASE}/api/download_jobs`, {
+                    method: "POST",
+                    headers: { "Content-Type": "application/json" },
+                    body: JSON.stringify({ links: links }),
+                });
+                const created = await createResp.json();
+                if (!createResp.ok || created.code !== 0) {
+                    throw new Error(created.message || ("HTTP " + createResp.status));
                 }
+                const jobId = created.data.job_id;
+                const rootDir = created.root_dir || "";
+
+                await subscribeProgress(`${API_BASE}/api/download_jobs/${encodeURIComponent(jobId)}/events`, (job) => {
+                    if (job.status === "paused") {
+                        setZipProgress(`已暂停：已保存 ${job.done + job.failed}/${job.total}，继续后将接着下载`);
+                        return;
+                    }
+                    const extra = formatProgress(job.progress);
+                    setZipProgress(`正在保存 ${job.done + job.failed}/${job.total}（下载中 ${job.in_flight}）${extra ? "，" + extra : ""}`);
+                });
+
+                const finalResp = await fetch(`${API_BASE}/api/download_jobs/${encodeURIComponent(jobId)}?results=1`);
+                const finalJson = await finalResp.json();
+                const results = (finalJson.data && finalJson.data.results) || [];
+                const savedCount = results.filter((one) => one.code === 0).length;
+                const failedCount = results.length - savedCount;
+                const duplicateCount = results.filter((one) => one.duplicate).length;
+                results.filter((one) => one.code !== 0).forEach((one) => {
+                    console.error("保存单文件失败:", one, links[one.index]);
+                });
 
                 if (savedCount > 0) {
                     if (failedCount > 0) {
@@ -1828,77 +1829,6 @@ async function downloadAll() {
             }
         }
 
-        // =========================
-        // 创建 ZIP
-        // =========================
-
-        const zip = new JSZip();
-
-        let done = 0;
-
-        const CONCURRENT = 5;
-
-        let index = 0;
-
-        async function worker() {
-            while (true) {
-                const current = index++;
-
-                if (current >= links.length) {
-                    return;
-                }
-
-                const link = links[current];
-
-                try {
-                    setZipProgress(
-                        `正在下载 ${done}/${links.length}：${link.filename}`,
-                    );
-                    let fetchUrl = link.url;
-
-                    // 图片走代理
-                    if (link.type === "dl-a-img") {
-                        fetchUrl = `${API_BASE}/api/proxy_img?url=${encodeURIComponent(link.url)}`;
-                    }
-
-                    const resp = await fetch(fetchUrl);
-
-                    if (!resp.ok) {
-                        throw new Error(`HTTP ${resp.status}`);
-                    }
-
-                    const blob = await resp.blob();
-
-                    zip.file(link.zipPath || link.filename, blob);
-
-                    done++;
-
-                    console.log(`已添加 ${done}/${links.length}: ${link.filename}`);
-                } catch (err) {
-                    console.error("下载失败:", link.filename, err);
-                }
-            }
-        }
-
-        // 并发下载
-        await Promise.all(Array.from({ length: CONCURRENT }, () => worker()));
-
-        // =========================
-        // 生成 ZIP
-        // =========================
-
-        setZipProgress("正在生成压缩包...");
-
-        const zipBlob = await zip.generateAsync(
-            {
-                type: "blob",
-                compression: 'STORE', // 不压缩，直接打包，提升生成速度
-            },
-            (metadata) => {
-                setZipProgress(`正在生成压缩包：${metadata.percent.toFixed(1)}%`);
-            },
-        );
-
         // =========================
         // ZIP 名字
         // =========================
@@ -1934,9 +1864,35 @@ async function downloadAll() {
         const safeZipName = zipName.replace(/[<>:"/\\|?*]/g, "_").trim();
 
         const finalZipName = `${safeZipName}_${typeSuffix}.zip`;
-        saveAs(zipBlob, finalZipName);
 
-        setZipProgress("下载完成（ZIP）");
+        // =========================
+        // 服务端打包 ZIP，浏览器通过表单提交直接流式下载，不在内存中组装
+        // =========================
+
+        const form = document.createElement("form");
+        form.method = "POST";
+        form.action = `${API_BASE}/api/export_zip`;
+        form.style.display = "none";
+
+        const payloadInput = document.createElement("input");
+        payloadInput.type = "hidden";
+        payloadInput.name = "payload";
+        payloadInput.value = JSON.stringify({
+            filename: finalZipName,
+            links: links.map((link) => ({
+                url: link.url,
+                type: link.type,
+                collectionFolder: link.collectionFolder,
+                filename: link.filename,
+                zipPath: link.zipPath,
+            })),
+        });
+        form.appendChild(payloadInput);
+        document.body.appendChild(form);
+        form.submit();
+        form.remove();
+
+        setZipProgress("服务端正在打包，浏览器将直接下载 ZIP");
     } catch (e) {
         console.error("下载出错", e);
         setZipProgress("下载出错: " + (e.message || e), true);
@@ -1974,112 +1930,23 @@ function clearAll() {
     updateActionButtons();
 }
 /* ============================================================
-   Emoji sheet splitting
+   Emoji sheet splitting (server side: /api/emoji_tiles)
    ============================================================ */
-function splitEmojiSheet(imgUrl) {
-    return new Promise(function (resolve, reject) {
-        var img = new Image();
-        img.crossOrigin = "anonymous";
-        img.onload = function () {
-            var cvs = document.createElement("canvas");
-            cvs.width = img.width;
-            cvs.height = img.height;
-            var ctx = cvs.getContext("2d");
-            ctx.drawImage(img, 0, 0);
-            var imageData = ctx.getImageData(0, 0, cvs.width, cvs.height);
-            var data = imageData.data;
-
-            // 逐行扫描，找到有非透明像素的行区间
-            var rows = [];
-            for (var y = 0; y < cvs.height; y++) {
-                var hasPixel = false;
-                for (var x = 0; x < cvs.width; x++) {
-                    if (data[(y * cvs.width + x) * 4 + 3] > 30) { // alpha > 30
-                        hasPixel = true;
-                        break;
-                    }
-                }
-                rows.push(hasPixel);
-            }
-
-            // 合并行区间
-            var rowRanges = [];
-            var inRow = false;
-            var rowStart = 0;
-            for (var y = 0; y < rows.length; y++) {
-                if (rows[y] && !inRow) { rowStart = y; inRow = true; }
-                if (!rows[y] && inRow) {
-                    rowRanges.push({ start: rowStart, end: y - 1 });
-                    inRow = false;
-                }
-            }
-            if (inRow) rowRanges.push({ start: rowStart, end: rows.length - 1 });
-
-            var results = [];
-
-            for (var ri = 0; ri < rowRanges.length; ri++) {
-                var rr = rowRanges[ri];
-                // 在该行区间内逐列扫描
-                var colHasPixel = [];
-                for (var x = 0; x < cvs.width; x++) {
-                    var hasP = false;
-                    for (var y = rr.start; y <= rr.end; y++) {
-                        if (data[(y * cvs.width + x) * 4 + 3] > 30) {
-                            hasP = true;
-                            break;
-                        }
-                    }
-                    colHasPixel.push(hasP);
-                }
-
-                // 合并列区间
-                var inCol = false;
-                var colStart = 0;
-                for (var x = 0; x < colHasPixel.length; x++) {
-                    if (colHasPixel[x] && !inCol) { colStart = x; inCol = true; }
-                    if (!colHasPixel[x] && inCol) {
-                        // 裁剪该区域
-                        var emojiCvs = document.createElement("canvas");
-                        var ew = x - colStart + 1;
-                        var eh = rr.end - rr.start + 1;
-                        // 加 2px 内边距避免边缘裁切
-                        var pad = 1;
-                        var cropX = Math.max(0, colStart - pad);
-                        var cropY = Math.max(0, rr.start - pad);
-                        var cropW = Math.min(cvs.width - cropX, ew + pad * 2);
-                        var cropH = Math.min(cvs.height - cropY, eh + pad * 2);
-                        emojiCvs.width = cropW;
-                        emojiCvs.height = cropH;
-                        emojiCvs.getContext("2d").drawImage(
-                            cvs, cropX, cropY, cropW, cropH, 0, 0, cropW, cropH
-                        );
-                        results.push({ canvas: emojiCvs, x: colStart, y: rr.start });
-                        inCol = false;
-                    }
-                }
-                if (inCol) {
-                    var emojiCvs = document.createElement("canvas");
-                    var ew = colHasPixel.length - colStart;
-                    var eh = rr.end - rr.start + 1;
-                    var pad = 1;
-                    var cropX = Math.max(0, colStart - pad);
-                    var cropY = Math.max(0, rr.start - pad);
-                    var cropW = Math.min(cvs.width - cropX, ew + pad * 2);
-                    var cropH = Math.min(cvs.height - cropY, eh + pad * 2);
-                    emojiCvs.width = cropW;
-                    emojiCvs.height = cropH;
-                    emojiCvs.getContext("2d").drawImage(
-                        cvs, cropX, cropY, cropW, cropH, 0, 0, cropW, cropH
-                    );
-                    results.push({ canvas: emojiCvs, x: colStart, y: rr.start });
-                }
-            }
+async function fetchEmojiTiles(imgUrl) {
+    var res = await fetch(API_BASE + "/api/emoji_tiles?url=" + encodeURIComponent(imgUrl));
+    var json = await res.json();
+    if (!res.ok || json.code !== 0) throw new Error(json.message || ("HTTP " + res.status));
+    return json.data;
+}
 
-            resolve(results);
-        };
-        img.onerror = function () { reject(new Error("图片加载失败")); };
-        img.src = imgUrl;
-    });
+function emojiThumb(emo, maxSize) {
+    var img = document.createElement("img");
+    var scale = Math.min(maxSize / emo.w, maxSize / emo.h, 1);
+    img.width = Math.round(emo.w * scale);
+    img.height = Math.round(emo.h * scale);
+    img.loading = "lazy";
+    img.src = API_BASE + emo.url;
+    return img;
 }
 
 /* ============================================================
@@ -2097,34 +1964,9 @@ async function loadEmojiCard(card, bodyEl, coll, collBlock, emojiWrap) {
         }
         if (!imgLink) throw new Error("无图片链接");
 
-        var proxyUrl = API_BASE + "/api/proxy_img?url=" + encodeURIComponent(imgLink);
-        var rawEmojis = await splitEmojiSheet(proxyUrl);
-        if (!rawEmojis || rawEmojis.length === 0) throw new Error("无透明区域");
-
-        // 筛选：去掉内部透明占比 > 70% 或只有白色+透明的表情
-        var emojis = [];
-        rawEmojis.forEach(function (e) {
-            var cvs = e.canvas;
-            var ctx = cvs.getContext("2d");
-            var imgData = ctx.getImageData(0, 0, cvs.width, cvs.height);
-            var px = imgData.data;
-            var total = cvs.width * cvs.height;
-            var transparent = 0;
-            var colored = 0; // 非白非透明的有色像素
-            for (var pi = 0; pi < px.length; pi += 4) {
-                var r = px[pi], g = px[pi + 1], b = px[pi + 2], a = px[pi + 3];
-                if (a < 30) {
-                    transparent++;
-                } else if (r > 240 && g > 240 && b > 240) {
-                    // 白色像素，不计入有色
-                } else {
-                    colored++;
-                }
-            }
-            if (transparent / total < 0.7 && colored > 0) {
-                emojis.push(e);
-            }
-        });
+        // 服务端已按透明区域切分，并去掉透明占比 > 70% 或只有白色+透明的块
+        var sheet = await fetchEmojiTiles(imgLink);
+        var emojis = sheet.tiles || [];
         if (emojis.length < 3) throw new Error("有效表情不足");
 
         // 成功！隐藏表情包卡片，改为在收藏集块上添加徽标
@@ -2134,12 +1976,7 @@ async function loadEmojiCard(card, bodyEl, coll, collBlock, emojiWrap) {
         var emojiBadge = document.createElement("div");
         emojiBadge.className = "emoji-badge";
 
-        var firstCvs = emojis[0].canvas;
-        var badgeThumb = document.createElement("canvas");
-        var bScale = Math.min(32 / firstCvs.width, 32 / firstCvs.height, 1);
-        badgeThumb.width = Math.round(firstCvs.width * bScale);
-        badgeThumb.height = Math.round(firstCvs.height * bScale);
-        badgeThumb.getContext("2d").drawImage(firstCvs, 0, 0, badgeThumb.width, badgeThumb.height);
+        var badgeThumb = emojiThumb(emojis[0], 32);
         badgeThumb.style.cssText = "border-radius:3px;border:1px solid #e3e5e7;flex-shrink:0;";
 
         var badgeInfo = document.createElement("span");
@@ -2150,7 +1987,7 @@ async function loadEmojiCard(card, bodyEl, coll, collBlock, emojiWrap) {
         badgeBtn.className = "btn btn-primary";
         badgeBtn.style.cssText = "font-size:11px;padding:3px 10px;flex-shrink:0;";
         badgeBtn.textContent = "查看";
-        var emojiData = { card_name: card.card_name, emojis: emojis, coll_name: coll.name };
+        var emojiData = { card_name: card.card_name, emojis: emojis, zip: sheet.zip, coll_name: coll.name };
         badgeBtn.onclick = function (e) { e.stopPropagation(); openEmojiPopup(emojiData); };
 
         emojiBadge.appendChild(badgeThumb);
@@ -2196,22 +2033,13 @@ function openEmojiPopup(data) {
             wrapper.className = "emoji-popup-item";
             wrapper.title = "点击下载";
 
-            var cvs = emo.canvas;
-            var thumb = document.createElement("canvas");
-            var maxSize = 72;
-            var scale = Math.min(maxSize / cvs.width, maxSize / cvs.height, 1);
-            thumb.width = Math.round(cvs.width * scale);
-            thumb.height = Math.round(cvs.height * scale);
-            thumb.getContext("2d").drawImage(cvs, 0, 0, thumb.width, thumb.height);
+            var thumb = emojiThumb(emo, 72);
 
             wrapper.onclick = function () {
-                cvs.toBlob(function (blob) {
-                    var a = document.createElement("a");
-                    a.href = URL.createObjectURL(blob);
-                    a.download = (data.card_name + "_" + (idx + 1)) + ".png";
-                    a.click();
-                    URL.revokeObjectURL(a.href);
-                });
+                var a = document.createElement("a");
+                a.href = API_BASE + emo.url;
+                a.download = (data.card_name + "_" + (idx + 1)) + ".png";
+                a.click();
             };
 
             wrapper.appendChild(thumb);
@@ -2252,38 +2080,11 @@ function closeEmojiPopup() {
 }
 
 function downloadEmojiZip(data) {
-    if (typeof JSZip === "undefined") {
-        showNotice("JSZip 未加载，暂不支持 ZIP 下载", "err");
-        return;
-    }
-    var zip = new JSZip();
-    var folder = zip.folder(data.card_name.replace(/[<>:"/\\|?*]/g, "_") + "_表情") || zip;
-    var done = 0;
-
-    data.emojis.forEach(function (emo, idx) {
-        var blob = dataURLToBlob(emo.canvas.toDataURL("image/png"));
-        var name = (idx + 1) + ".png";
-        folder.file(name, blob);
-    });
-
-    zip.generateAsync({ type: "blob" }).then(function (content) {
-        var a = document.createElement("a");
-        a.href = URL.createObjectURL(content);
-        a.download = (data.card_name || "表情包").replace(/[<>:"/\\|?*]/g, "_") + ".zip";
-        a.click();
-        URL.revokeObjectURL(a.href);
-        showNotice("✅ 表情包 ZIP 下载完成", "ok");
-    });
-}
-
-function dataURLToBlob(dataURL) {
-    var parts = dataURL.split(",");
-    var mime = parts[0].match(/:(.*?);/)[1];
-    var bytes = atob(parts[1]);
-    var buf = new ArrayBuffer(bytes.length);
-    var view = new Uint8Array(buf);
-    for (var i = 0; i < bytes.length; i++) view[i] = bytes.charCodeAt(i);
-    return new Blob([buf], { type: mime });
+    var a = document.createElement("a");
+    a.href = API_BASE + data.zip + "?name=" + encodeURIComponent(data.card_name || "表情包");
+    a.download = "";
+    a.click();
+    showNotice("✅ 已开始下载表情包 ZIP", "ok");
 }
 
 function fallbackEmojiCard(card, bodyEl, coll) {
@@ -2297,7 +2098,7 @@ function fallbackEmojiCard(card, bodyEl, coll) {
         var el;
         if (dl.cls === "dl-a-img") {
             el = document.createElement("img");
-            el.src = API_BASE + "/api/proxy_img?url=" + encodeURIComponent(url);
+            el.src = proxyImgUrl(url);
             el.alt = card.card_name + " 图片";
             el.style.cssText = "max-width:100%;border-radius:6px;display:block;";
         } else if (dl.cls === "dl-a-vid") {
@@ -2432,11 +2233,12 @@ function onReady(fn) {
 onReady(function () {
     autoStartFromUrl();
     renderHistory();
+    resumeBatchScan();
 });
 
 /* ============================================================
    Batch Scan: check a range of act_ids for existence
-   — 顺序扫描 + 随机延迟，避免触发 B 站 412 风控
+   — 由服务端扫描任务执行，限速由服务端令牌桶统一控制
    ============================================================ */
 let batchScanAbort = false;
 
@@ -2447,6 +2249,54 @@ function randomDelay(min, max) {
     });
 }
 
+/** 图片代理地址；传入 width 时返回服务端生成的缩略图（WebP/JPEG） */
+function proxyImgUrl(url, width) {
+    var src = API_BASE + "/api/proxy_img?url=" + encodeURIComponent(url);
+    return width ? src + "&w=" + width : src;
+}
+
+/** 视频封面帧地址（服务端只取视频开头截帧），用于 preload="none" 的视频预览 */
+function videoPosterUrl(url, width) {
+    return API_BASE + "/api/video_poster?url=" + encodeURIComponent(url) + (width ? "&w=" + width : "");
+}
+
+/** 订阅服务端 SSE 进度流：每次 progress 事件调用 onData，end 事件时 resolve 最终数据 */
+function subscribeProgress(url, onData) {
+    return new Promise(function (resolve, reject) {
+        var source = new EventSource(url);
+        source.addEventListener("progress", function (e) {
+            onData(JSON.parse(e.data));
+        });
+        // 任务暂停时连接保持打开，恢复后继续收到 progress，直到 end
+        source.addEventListener("paused", function (e) {
+            onData(JSON.parse(e.data));
+        });
+        source.addEventListener("end", function (e) {
+            source.close();
+            resolve(JSON.parse(e.data));
+        });
+        source.onerror = function () {
+            source.close();
+            reject(new Error("进度连接已断开"));
+        };
+    });
+}
+
+/** 把服务端 progress 字段格式化为“速度，剩余时间”文本 */
+function formatProgress(progress) {
+    if (!progress) return "";
+    var parts = [];
+    if (progress.bytes_per_sec > 0) {
+        var rate = progress.bytes_per_sec;
+        parts.push(rate >= 1048576 ? (rate / 1048576).toFixed(1) + " MB/s" : Math.round(rate / 1024) + " KB/s");
+    }
+    if (progress.eta_seconds != null && progress.eta_seconds > 0) {
+        var eta = progress.eta_seconds;
+        parts.push("剩余约 " + (eta >= 60 ? Math.floor(eta / 60) + " 分 " + (eta % 60) + " 秒" : eta + " 秒"));
+    }
+    return parts.join("，");
+}
+
 async function startBatchScan() {
     var hintEl = document.getElementById("scan-hint");
 
@@ -2468,11 +2318,7 @@ async function startBatchScan() {
 
     var startEl = document.getElementById("scan-start");
     var endEl = document.getElementById("scan-end");
-    var btn = document.getElementById("btn-scan");
     var resultsEl = document.getElementById("scan-results");
-    var progressEl = document.getElementById("scan-progress");
-    var progBar = document.getElementById("scan-prog-bar");
-    var progText = document.getElementById("scan-prog-text");
 
     var start = parseInt(startEl.value, 10);
     var end = parseInt(endEl.value, 10);
@@ -2486,95 +2332,88 @@ async function startBatchScan() {
     hintEl.textContent = "正在扫描 " + start + " ~ " + end + "，共 " + (end - start + 1) + " 个 act_id…";
 
     batchScanAbort = false;
-    btn.disabled = true;
-    btn.textContent = "⏳ 扫描中…";
-    btn.style.display = "none";
-    document.getElementById("btn-scan-stop").style.display = "inline-flex";
-    progressEl.style.display = "block";
     resultsEl.innerHTML = "";
 
-    var ids = [];
-    for (var i = start; i <= end; i++) {
-        ids.push(i);
+    // ── 在服务端创建扫描任务，关闭页面后任务仍会继续 ──
+    try {
+        var res = await fetch(API_BASE + "/api/scan_jobs", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ start: start, end: end }),
+        });
+        var json = await res.json();
+        if (!res.ok || json.code !== 0) throw new Error(json.message || ("HTTP " + res.status));
+        localStorage.setItem("bili_scan_job", json.data.job_id);
+        await followScanJob(json.data.job_id);
+    } catch (err) {
+        hintEl.textContent = "⚠️ 创建扫描任务失败：" + (err.message || String(err));
+        hintEl.style.color = "#ff4d4f";
     }
-    var total = ids.length;
-    var found = [];
-    var notFound = [];
-    var errors = [];
-
-    // ── 顺序扫描，每两个请求之间随机延迟 0.5~1.5 秒 ──
-    for (var idx = 0; idx < total; idx++) {
-        if (batchScanAbort) break;
-
-        var actId = ids[idx];
-
-        // 请求之间加随机延迟（第一个不等）
-        if (idx > 0) {
-            await randomDelay(500, 1500);
-        }
+}
 
-        // 带指数退避的重试（最多 3 次）
-        var success = false;
-        for (var retry = 0; retry < 3 && !success; retry++) {
-            if (batchScanAbort) break;
-            if (retry > 0) {
-                await randomDelay(2000 * retry, 2000 * retry + 1000);
-            }
-            try {
-                var res = await fetch(
-                    API_BASE + "/api/check_act_id?act_id=" + encodeURIComponent(actId)
-                );
-                var json = await res.json();
-                if (json.code === 0 && json.data) {
-                    if (json.data.exists) {
-                        found.push({ act_id: actId, name: json.data.name });
-                        saveAvailableActId(actId, json.data.name);
-                    } else {
-                        notFound.push(actId);
-                    }
-                    success = true;
-                } else if (res.status >= 500) {
-                    // 服务端错误，可以重试
-                    continue;
-                } else {
-                    errors.push(actId);
-                    success = true; // 标记为已处理
-                }
-            } catch (err) {
-                if (err.name === "AbortError") { batchScanAbort = true; break; }
-                // 网络错误可能是 412，重试
-                continue;
-            }
-        }
-        if (!success) {
-            errors.push(actId);
-        }
+function setScanRunningUI(running) {
+    var btn = document.getElementById("btn-scan");
+    btn.disabled = running;
+    btn.textContent = running ? "⏳ 扫描中…" : "🚀 开始扫描";
+    btn.style.display = running ? "none" : "";
+    document.getElementById("btn-scan-stop").style.display = running ? "inline-flex" : "none";
+    if (running) document.getElementById("scan-progress").style.display = "block";
+}
 
-        // 更新进度
-        var pct = Math.round(((idx + 1) / total) * 100);
+/** 轮询服务端扫描任务进度并渲染，直到任务结束或页面主动停止跟踪 */
+async function followScanJob(jobId) {
+    var hintEl = document.getElementById("scan-hint");
+    var resultsEl = document.getElementById("scan-results");
+    var progBar = document.getElementById("scan-prog-bar");
+    var progText = document.getElementById("scan-prog-text");
+    var job = null;
+    var lastChecked = -1;
+    var foundSoFar = [];
+    var errorsSoFar = [];
+
+    window._batchScanJobId = jobId;
+    setScanRunningUI(true);
+
+    // 每个事件只带上次之后新增的 found / errors，在这里累加
+    function render(data) {
+        foundSoFar = foundSoFar.concat(data.found);
+        errorsSoFar = errorsSoFar.concat(data.errors);
+        job = data;
+        job.found = foundSoFar;
+        job.errors = errorsSoFar;
+        var pct = Math.round((job.checked / job.total) * 100);
+        var extra = formatProgress(job.progress);
         progBar.style.width = pct + "%";
-        progText.textContent = "已检查 " + (idx + 1) + "/" + total +
-            "，存在 " + found.length + " 个，不存在 " + notFound.length + " 个" +
-            (errors.length ? "，错误 " + errors.length + " 个" : "");
-
-        // 每 10 个或最后更新一次界面
-        if ((idx + 1) % 10 === 0 || idx + 1 === total) {
-            renderScanResults(resultsEl, found, notFound, errors, total);
+        progText.textContent = "已检查 " + job.checked + "/" + job.total +
+            "，存在 " + job.found.length + " 个，不存在 " + job.not_found_count + " 个" +
+            (job.errors.length ? "，错误 " + job.errors.length + " 个" : "") +
+            (job.cached_negative ? "（" + job.cached_negative + " 个已知不存在，未重复查询）" : "") +
+            (extra ? "，" + extra : "");
+        if (job.checked !== lastChecked) {
+            renderScanResults(resultsEl, job.found, job.not_found, job.errors, job.total, job.not_found_count);
+            lastChecked = job.checked;
         }
     }
 
-    // Final render
-    renderScanResults(resultsEl, found, notFound, errors, total);
+    try {
+        render(await subscribeProgress(API_BASE + "/api/scan_jobs/" + encodeURIComponent(jobId) + "/events", render));
+    } catch (err) {
+        hintEl.textContent = "⚠️ 获取扫描进度失败：" + (err.message || String(err));
+        hintEl.style.color = "#ff4d4f";
+    }
 
-    btn.disabled = false;
-    btn.textContent = "🚀 开始扫描";
-    btn.style.display = "";
-    document.getElementById("btn-scan-stop").style.display = "none";
-    hintEl.textContent = "扫描完成！共 " + total + " 个 act_id，存在 " + found.length + " 个。点击绿色标签可填入输入框并查询。";
+    // 已手动停止或期间开始了新的扫描，不再覆盖界面
+    if (window._batchScanJobId !== jobId) return;
+    setScanRunningUI(false);
+    if (!job || job.status === "running") return;
+    localStorage.removeItem("bili_scan_job");
+    hintEl.textContent = job.status === "cancelled"
+        ? "⏹ 已手动停止扫描。"
+        : "扫描完成！共 " + job.total + " 个 act_id，存在 " + job.found.length + " 个。点击绿色标签可填入输入框并查询。";
 
     // If some act_ids exist, offer to query them
+    var found = job.found;
     if (found.length > 0) {
-        var actIdList = found.map(function (f) { return f.act_id; }).join(", ");
         var fillBtn = document.createElement("div");
         fillBtn.style.cssText = "margin-top:8px;display:flex;gap:8px;flex-wrap:wrap;align-items:center;";
         fillBtn.innerHTML =
@@ -2586,27 +2425,48 @@ async function startBatchScan() {
     }
 }
 
-async function saveAvailableActId(actId, name) {
-    try {
-        await fetch(API_BASE + "/api/available_act_ids", {
-            method: "POST",
-            headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({ act_id: String(actId), name: name || "" }),
-        });
-    } catch (_) { }
+/** 页面重新打开时，继续跟踪上次未结束的服务端扫描任务 */
+function resumeBatchScan() {
+    var jobId = localStorage.getItem("bili_scan_job");
+    if (!jobId) return;
+    fetch(API_BASE + "/api/scan_jobs/" + encodeURIComponent(jobId))
+        .then(function (res) { return res.json(); })
+        .then(function (json) {
+            if (json.code !== 0) {
+                localStorage.removeItem("bili_scan_job");
+                return;
+            }
+            document.getElementById("scan-hint").textContent =
+                "正在继续跟踪扫描任务 " + json.data.start + " ~ " + json.data.end + "…";
+            batchScanAbort = false;
+            followScanJob(jobId);
+        })
+        .catch(function () { });
 }
 
 async function loadAvailableActIds() {
     var resultsEl = document.getElementById("scan-results");
     var hintEl = document.getElementById("scan-hint");
+    // 服务端分页返回，逐页加载直到取完全部记录
+    var items = [];
+    var total = 0;
+    var pageSize = 5000;
     try {
-        var res = await fetch(API_BASE + "/api/available_act_ids");
-        var json = await res.json();
-        if (!res.ok || json.code !== 0) throw new Error(json.message || ("HTTP " + res.status));
-        var items = json.data || [];
+        for (var page = 1; ; page++) {
+            var res = await fetch(API_BASE + "/api/available_act_ids?page=" + page + "&page_size=" + pageSize);
+            var json = await res.json();
+            if (!res.ok || json.code !== 0) throw new Error(json.message || ("HTTP " + res.status));
+            var pageItems = json.data || [];
+            items = items.concat(pageItems);
+            total = json.total || items.length;
+            if (items.length < total) hintEl.textContent = "正在加载本地记录 " + items.length + "/" + total + "...";
+            if (!pageItems.length || items.length >= total) break;
+        }
         window._batchFoundIds = items.map(function (item) { return String(item.act_id); });
         renderScanResults(resultsEl, items, [], [], items.length);
-        hintEl.textContent = items.length ? "已加载本地记录，可点击标签追加 act_id。" : "本地还没有可用 act_id 记录。";
+        hintEl.textContent = !items.length
+            ? "本地还没有可用 act_id 记录。"
+            : "已加载 " + items.length + " 条本地记录，可点击标签追加 act_id。";
     } catch (err) {
         hintEl.textContent = "加载记录失败：" + (err.message || String(err));
         hintEl.style.color = "#ff4d4f";
@@ -2640,27 +2500,38 @@ async function startPreviewScan() {
     var notFound = [];
     var errors = [];
 
-    for (var i = 0; i < count; i++) {
+    // 每页一次批量请求，限速由服务端令牌桶控制，存在的 act_id 由服务端写入本地记录
+    var pageSize = 20;
+    for (var i = 0; i < count; i += pageSize) {
         if (batchScanAbort) break;
-        var actId = start + i;
-        if (i > 0) await randomDelay(500, 1500);
+        var n = Math.min(pageSize, count - i);
         try {
-            var res = await fetch(API_BASE + "/api/check_act_id?act_id=" + encodeURIComponent(actId));
+            var res = await fetch(API_BASE + "/api/check_act_ids", {
+                method: "POST",
+                headers: { "Content-Type": "application/json" },
+                body: JSON.stringify({ start: start + i, count: n }),
+            });
             var json = await res.json();
-            if (json.code === 0 && json.data && json.data.exists) {
-                var item = { act_id: actId, name: json.data.name };
-                found.push(item);
-                saveAvailableActId(actId, json.data.name);
-                appendPreviewScanItem(resultsEl, item);
-            } else {
-                notFound.push(actId);
-            }
+            if (!res.ok || json.code !== 0) throw new Error(json.message || ("HTTP " + res.status));
+            json.data.forEach(function (one) {
+                var actId = Number(one.act_id);
+                if (one.error) {
+                    errors.push(actId);
+                } else if (one.exists) {
+                    var item = { act_id: actId, name: one.name };
+                    found.push(item);
+                    appendPreviewScanItem(resultsEl, item);
+                } else {
+                    notFound.push(actId);
+                }
+            });
         } catch (_) {
-            errors.push(actId);
+            for (var k = 0; k < n; k++) errors.push(start + i + k);
         }
-        var pct = Math.round(((i + 1) / count) * 100);
+        var done = i + n;
+        var pct = Math.round((done / count) * 100);
         progBar.style.width = pct + "%";
-        progText.textContent = "已扫描 " + (i + 1) + "/" + count + "，可用 " + found.length + " 个";
+        progText.textContent = "已扫描 " + done + "/" + count + "，可用 " + found.length + " 个";
     }
 
     btn.disabled = false;
@@ -2683,18 +2554,20 @@ function appendPreviewScanItem(container, item) {
 
 function stopBatchScan() {
     batchScanAbort = true;
-    var btn = document.getElementById("btn-scan");
-    var stopBtn = document.getElementById("btn-scan-stop");
-    var hintEl = document.getElementById("scan-hint");
-    btn.disabled = false;
-    btn.textContent = "🚀 开始扫描";
-    btn.style.display = "";
-    stopBtn.style.display = "none";
-    hintEl.textContent = "⏹ 已手动停止扫描。";
+    var jobId = window._batchScanJobId;
+    if (jobId) {
+        fetch(API_BASE + "/api/scan_jobs/" + encodeURIComponent(jobId) + "/cancel", { method: "POST" })
+            .catch(function () { });
+        localStorage.removeItem("bili_scan_job");
+        window._batchScanJobId = null;
+    }
+    setScanRunningUI(false);
+    document.getElementById("scan-hint").textContent = "⏹ 已手动停止扫描。";
 }
 
-function renderScanResults(container, found, notFound, errors, total) {
+function renderScanResults(container, found, notFound, errors, total, notFoundCount) {
     container.innerHTML = "";
+    if (notFoundCount == null) notFoundCount = notFound.length;
 
     // Stats
     var stats = document.createElement("div");
@@ -2702,7 +2575,7 @@ function renderScanResults(container, found, notFound, errors, total) {
     stats.innerHTML =
         '<span class="scan-stat-item scan-stat-total">📊 总计 <span class="scan-stat-num">' + total + '</span></span>' +
         '<span class="scan-stat-item scan-stat-ok">✅ 存在 <span class="scan-stat-num">' + found.length + '</span></span>' +
-        '<span class="scan-stat-item scan-stat-fail">❌ 不存在 <span class="scan-stat-num">' + notFound.length + '</span></span>' +
+        '<span class="scan-stat-item scan-stat-fail">❌ 不存在 <span class="scan-stat-num">' + notFoundCount + '</span></span>' +
         (errors.length ? '<span class="scan-stat-item" style="color:#fa8c16;">⚠️ 错误 <span class="scan-stat-num" style="color:#fa8c16;">' + errors.length + '</span></span>' : "");
     container.appendChild(stats);
 
@@ -2753,10 +2626,10 @@ function renderScanResults(container, found, notFound, errors, total) {
         badge2.textContent = showNotFound[j];
         container.appendChild(badge2);
     }
-    if (notFound.length > 50) {
+    if (notFoundCount > 50) {
         var more = document.createElement("span");
         more.className = "scan-badge scan-badge-skip";
-        more.textContent = "…还有 " + (notFound.length - 50) + " 个";
+        more.textContent = "…还有 " + (notFoundCount - 50) + " 个";
         container.appendChild(more);
     }
 }
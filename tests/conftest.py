@@ -0,0 +1,62 @@
+import http.server
+import os
+import re
+import sys
+import threading
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """按 server.files 返回内容，支持 Range / If-Range / If-None-Match；server.overrides 可改写某个路径的响应。"""
+
+    def do_GET(self):
+        self.server.requests.append({"path": self.path, **{k.lower(): v for k, v in self.headers.items()}})
+        override = self.server.overrides.get(self.path)
+        if override:
+            status, headers, body = override(self)
+            return self._send(status, headers, body)
+        body = self.server.files.get(self.path)
+        if body is None:
+            return self._send(404, {}, b"")
+        etag = '"%s"' % self.server.etags.get(self.path, "v1")
+        if self.headers.get("If-None-Match") == etag:
+            return self._send(304, {"ETag": etag}, b"")
+        match = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+        if_range = self.headers.get("If-Range")
+        if match and (if_range is None or if_range == etag):
+            start = int(match.group(1))
+            end = min(int(match.group(2)), len(body) - 1) if match.group(2) else len(body) - 1
+            if start >= len(body) or end < start:
+                return self._send(416, {"Content-Range": f"bytes */{len(body)}"}, b"")
+            return self._send(206, {"ETag": etag, "Content-Range": f"bytes {start}-{end}/{len(body)}"},
+                              body[start:end + 1])
+        return self._send(200, {"ETag": etag}, body)
+
+    def _send(self, status, headers, body):
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    """本地 HTTP 服务，测试中通过 files / etags / overrides 控制返回内容，requests 记录收到的请求。"""
+    srv = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    srv.files, srv.etags, srv.overrides, srv.requests = {}, {}, {}, []
+    srv.url = f"http://127.0.0.1:{srv.server_address[1]}"
+    thread = threading.Thread(target=srv.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
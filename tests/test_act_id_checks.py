@@ -0,0 +1,94 @@
+import logging
+
+import pytest
+from bilibili_api import NetworkException, ResponseCodeException
+
+import server
+
+
+class _FakeDLC:
+    """偶数 ID 存在；7 返回错误码（不存在）；13 触发 412；17 网络错误；其余奇数没有分组。"""
+
+    calls = []
+
+    def __init__(self, act_id):
+        self.act_id = act_id
+
+    async def get_info(self):
+        _FakeDLC.calls.append(self.act_id)
+        if self.act_id == 7:
+            raise ResponseCodeException(-404, "不存在")
+        if self.act_id == 13:
+            raise NetworkException(412, "风控")
+        if self.act_id == 17:
+            raise NetworkException(500, "超时")
+        if self.act_id % 2 == 0:
+            return {"name": f"合集{self.act_id}", "lottery_list": [{"lottery_id": 1}]}
+        return {"name": "", "lottery_list": []}
+
+
+@pytest.fixture
+def checks(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "DLC", _FakeDLC)
+    monkeypatch.setattr(server, "_metadata_cache", server.TTLCache(max_items=100, ttl=60))
+    monkeypatch.setattr(server, "_negative_act_ids", server.NegativeIdCache(str(tmp_path / "neg.db"), 3600))
+    monkeypatch.setattr(server, "_act_id_store", server.ActIdStore(str(tmp_path / "act_ids.db")))
+    limiter = server.AdaptiveTokenBucket("act_basic", rate=1000, burst=1000, jitter=0)
+    monkeypatch.setattr(server, "_RATE_LIMITERS", {**server._RATE_LIMITERS, "act_basic": limiter})
+    _FakeDLC.calls = []
+    return _FakeDLC
+
+
+def test_bulk_check_results_in_input_order(checks):
+    results = server._check_act_ids(["4", "7", "3", "13", "17", "4"])
+    assert [one["act_id"] for one in results] == ["4", "7", "3", "13", "17"]
+    assert results[0] == {"act_id": "4", "exists": True, "name": "合集4"}
+    assert results[1]["exists"] is False and results[2]["exists"] is False
+    assert results[3]["throttled"] is True
+    assert "error" in results[4] and "throttled" not in results[4]
+    # 重复的 ID 只查询一次
+    assert sorted(checks.calls) == [3, 4, 7, 13, 17]
+
+
+def test_bulk_check_uses_caches(checks):
+    server._check_act_ids(["2", "3", "7"])
+    checks.calls.clear()
+
+    results = server._check_act_ids(["2", "3", "7"])
+    assert checks.calls == []
+    assert results[0] == {"act_id": "2", "exists": True, "name": "合集2"}
+    assert results[1]["cached"] is True and results[2]["cached"] is True
+
+    server._check_act_ids(["2", "3"], refresh=True)
+    assert sorted(checks.calls) == [2, 3]
+
+
+def test_bulk_check_caches_only_existing_metadata(checks):
+    server._check_act_ids(["2", "3"])
+    assert server._metadata_cache.get("act:2") is not None
+    assert server._metadata_cache.get("act:3") is None
+
+    server._check_act_ids(["4"], cache_metadata=False)
+    assert server._metadata_cache.get("act:4") is None
+
+
+def test_check_log_written_only_for_fresh_results(checks, caplog):
+    with caplog.at_level(logging.INFO, logger=server.LOGGER.name):
+        server._check_act_ids(["2"])
+        server._check_act_ids(["2"])
+    lines = [r.getMessage() for r in caplog.records if r.getMessage().startswith("检查 act_id=2")]
+    assert lines == [server.check_log_message("2", True, "合集2")]
+
+
+def test_check_act_ids_endpoint(checks):
+    client = server.app.test_client()
+    data = client.post("/api/check_act_ids", json={"start": 1, "count": 6}).get_json()
+    assert [one["act_id"] for one in data["data"]] == ["1", "2", "3", "4", "5", "6"]
+    assert data["found"] == 3
+    assert server._act_id_store.count() == 3
+
+    data = client.get("/api/check_act_ids?act_ids=8,9").get_json()
+    assert [one.get("exists") for one in data["data"]] == [True, False]
+    assert client.post("/api/check_act_ids", json={"act_ids": ["x"]}).status_code == 400
+    too_many = {"start": 1, "count": server.CHECK_BULK_MAX + 1}
+    assert client.post("/api/check_act_ids", json=too_many).status_code == 400
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def store(tmp_path):
+    return server.ActIdStore(str(tmp_path / "act_ids.db"))
+
+
+def test_store_pages_in_act_id_order(store):
+    store.bulk_upsert({"act_id": str(i), "name": f"合集{i}"} for i in range(120, 0, -1))
+    pages = [store.query(offset=offset, limit=50) for offset in (0, 50, 100)]
+    assert [total for _items, total in pages] == [120, 120, 120]
+    ids = [int(item["act_id"]) for items, _total in pages for item in items]
+    assert ids == list(range(1, 121))
+
+
+def test_store_filters(store):
+    store.bulk_upsert([
+        {"act_id": "10", "name": "夏日_限定", "updated_at": "2026-01-05 10:00:00"},
+        {"act_id": "20", "name": "夏日限定", "updated_at": "2026-02-01 10:00:00"},
+        {"act_id": "30", "name": "冬日", "updated_at": "2026-02-01 23:00:00"},
+    ])
+    # 关键字中的 _ 按字面匹配
+    assert [i["act_id"] for i in store.query(name="_")[0]] == ["10"]
+    assert [i["act_id"] for i in store.query(name="夏日")[0]] == ["10", "20"]
+    assert [i["act_id"] for i in store.query(start=15, end=30)[0]] == ["20", "30"]
+    assert [i["act_id"] for i in store.query(since="2026-02-01", until="2026-02-01")[0]] == ["20", "30"]
+
+
+def test_upsert_keeps_name_and_created_at(store):
+    store.bulk_upsert([{"act_id": "5", "name": "旧名", "created_at": "2026-01-01 00:00:00",
+                        "updated_at": "2026-01-01 00:00:00"}])
+    store.upsert("5")
+    (item,), _total = store.query()
+    assert item["name"] == "旧名"
+    assert item["created_at"] == "2026-01-01 00:00:00"
+    assert item["updated_at"] > "2026-01-01 00:00:00"
+    assert store.count() == 1
+
+
+def test_legacy_json_imported_once(tmp_path):
+    legacy = tmp_path / "available_act_ids.json"
+    legacy.write_text(json.dumps([{"act_id": "7", "name": "旧记录"}, "invalid"]), encoding="utf-8")
+    db_path = str(tmp_path / "act_ids.db")
+    assert server.ActIdStore(db_path, legacy_json_path=str(legacy)).count() == 1
+
+    legacy.write_text(json.dumps([{"act_id": "8", "name": "新增"}]), encoding="utf-8")
+    assert server.ActIdStore(db_path, legacy_json_path=str(legacy)).count() == 1
+
+
+def test_available_act_ids_endpoint_pages(store, monkeypatch):
+    monkeypatch.setattr(server, "_act_id_store", store)
+    client = server.app.test_client()
+    resp = client.post("/api/available_act_ids", json={"items": [{"act_id": str(i)} for i in range(1, 8)]})
+    assert resp.get_json()["data"] == {"written": 7, "count": 7}
+
+    data = client.get("/api/available_act_ids?page=2&page_size=3").get_json()
+    assert (data["total"], data["page"], data["page_size"]) == (7, 2, 3)
+    assert [item["act_id"] for item in data["data"]] == ["4", "5", "6"]
+    assert client.post("/api/available_act_ids", json={"act_id": "0"}).status_code == 400
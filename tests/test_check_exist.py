@@ -0,0 +1,87 @@
+import sqlite3
+
+import pytest
+
+import check_exist
+import server
+from act_ids import CHECK_LINE_RE, check_log_message
+
+LOG_NAME = "biliCollectionDownloader_2026-06-10.log"
+
+
+def _line(ts: str, act_id: int, exists: bool, name: str = "") -> str:
+    return f"[2026-06-10 {ts}] [INFO] {check_log_message(act_id, exists, name)}\n"
+
+
+def _rows(db_path) -> dict:
+    with sqlite3.connect(db_path) as conn:
+        return {row[0]: row[1:] for row in conn.execute("SELECT act_id, name, created_at, updated_at FROM act_ids")}
+
+
+@pytest.fixture
+def logs(tmp_path):
+    log_dir = tmp_path / "logs"
+    log_dir.mkdir()
+    return log_dir, str(log_dir / "available_act_ids.db")
+
+
+def test_check_log_message_matches_miner_regex():
+    line = _line("12:00:00", 123, True, "名字 'quoted'").encode("utf-8")
+    match = CHECK_LINE_RE.search(line)
+    assert match.group(2) == b"123"
+    assert check_exist._parse_name(match.group(4)) == "名字 'quoted'"
+
+
+def test_mine_logs_is_incremental(logs):
+    log_dir, db_path = logs
+    log = log_dir / LOG_NAME
+    log.write_text(_line("10:00:00", 1, True, "一") + _line("10:00:01", 2, False) + "[半行", encoding="utf-8")
+    (log_dir / "biliCollectionDownloader_2026-06-10.error.log").write_text(_line("10:00:02", 9, True, "错误日志"),
+                                                                          encoding="utf-8")
+
+    stats = check_exist.mine_logs(str(log_dir), db_path, workers=1)
+    assert (stats["files"], stats["checked"], stats["exists"], stats["total"]) == (1, 2, [1], 1)
+
+    # 半行在补全后才处理，已处理的部分不再扫描
+    with open(log, "a", encoding="utf-8") as fh:
+        fh.write("\n" + _line("11:00:00", 3, True, "三"))
+    stats = check_exist.mine_logs(str(log_dir), db_path, workers=1)
+    assert (stats["checked"], stats["exists"], stats["total"]) == (1, [3], 2)
+    assert _rows(db_path)[3] == ("三", "2026-06-10 11:00:00", "2026-06-10 11:00:00")
+
+
+def test_mine_logs_removes_ids_last_seen_missing(logs):
+    log_dir, db_path = logs
+    log = log_dir / LOG_NAME
+    log.write_text(_line("10:00:00", 1, True, "一") + _line("10:00:00", 2, True, "二"), encoding="utf-8")
+    check_exist.mine_logs(str(log_dir), db_path, workers=1)
+
+    # 之后的检查显示 1 已不存在；2 在该次检查之后被服务端重新确认，保留
+    server.ActIdStore(db_path).bulk_upsert([{"act_id": "2", "updated_at": "2026-06-10 13:00:00"}])
+    with open(log, "a", encoding="utf-8") as fh:
+        fh.write(_line("12:00:00", 1, False) + _line("12:00:00", 2, False))
+    stats = check_exist.mine_logs(str(log_dir), db_path, workers=1)
+    assert stats["removed"] == 1
+    assert list(_rows(db_path)) == [2]
+
+
+def test_server_store_and_miner_share_schema(logs):
+    log_dir, db_path = logs
+    store = server.ActIdStore(db_path)
+    store.bulk_upsert([{"act_id": "5", "name": "服务端", "created_at": "2026-06-11 00:00:00",
+                        "updated_at": "2026-06-11 00:00:00"}])
+    (log_dir / LOG_NAME).write_text(_line("10:00:00", 5, True, "日志"), encoding="utf-8")
+    check_exist.mine_logs(str(log_dir), db_path, workers=1)
+
+    (item,), total = store.query()
+    assert (item["act_id"], item["name"], total) == ("5", "日志", 1)
+    # created_at 取两边较早的一次，updated_at 取较晚的一次
+    assert (item["created_at"], item["updated_at"]) == ("2026-06-10 10:00:00", "2026-06-11 00:00:00")
+
+
+def test_main_writes_output(logs, tmp_path):
+    log_dir, _db_path = logs
+    (log_dir / LOG_NAME).write_text(_line("10:00:00", 8, True, "八"), encoding="utf-8")
+    output = tmp_path / "ids.txt"
+    assert check_exist.main(["--log-dir", str(log_dir), "--workers", "1", "--output", str(output)]) == 0
+    assert output.read_text(encoding="utf-8") == "8\n"
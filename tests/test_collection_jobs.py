@@ -0,0 +1,61 @@
+import pytest
+
+import server
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    groups = {
+        "1": [f"https://i0.hdslb.com/bfs/a/{i}.png" for i in range(3)],
+        "2": [f"https://i0.hdslb.com/bfs/b/{i}.png" for i in range(4)],
+    }
+    saved = []
+
+    def fake_save(item, root_dir):
+        saved.append(item["url"])
+        if item["url"].endswith("/1.png"):
+            raise RuntimeError("boom")
+        return {"code": 0, "path": item["url"]}
+
+    monkeypatch.setattr(server, "get_lottery_params_by_act_id", lambda act_id, refresh=False: (
+        [{"act_id": act_id, "lottery_id": lid} for lid in groups], None))
+    monkeypatch.setattr(server.CollectionJob, "_fetch_lottery", lambda self, param: param)
+    monkeypatch.setattr(server, "_extract_collection_links", lambda data, opts: {
+        "name": f"合集{data['lottery_id']}",
+        "cards": [{"card_name": url.rsplit("/", 1)[-1], "links": [{"url": url, "type": "dl-a", "ext": "png"}]}
+                  for url in groups[data["lottery_id"]]],
+    })
+    monkeypatch.setattr(server, "_save_single_link", fake_save)
+    return groups, saved
+
+
+def test_collection_job_downloads_every_group(collection, tmp_path):
+    groups, saved = collection
+    job = server.CollectionJob("100", {"img": True}, str(tmp_path))
+    job.run()
+
+    data = job.snapshot()
+    assert data["status"] == "done"
+    assert data["lottery_done"] == data["lottery_total"] == 2
+    assert [c["links"] for c in data["collections"]] == [3, 4]
+    assert data["total"] == data["done"] == 7
+    assert data["saved_count"] == 5
+    assert sorted(saved) == sorted(url for urls in groups.values() for url in urls)
+
+
+def test_collection_job_results_carry_item_index(collection, tmp_path):
+    job = server.CollectionJob("100", {"img": True}, str(tmp_path))
+    job.run()
+
+    # 失败项的 index 是该项在整个任务中的提交序号，而不是提交时的累计总数
+    failed = sorted((f["index"], f["url"]) for f in job.snapshot()["failed"])
+    assert failed == [(1, "https://i0.hdslb.com/bfs/a/1.png"), (4, "https://i0.hdslb.com/bfs/b/1.png")]
+
+
+def test_collection_job_cancel_stops_submitting(collection, tmp_path):
+    _groups, saved = collection
+    job = server.CollectionJob("100", {"img": True}, str(tmp_path))
+    job.cancel()
+    job.run()
+    assert job.snapshot()["status"] == "cancelled"
+    assert saved == []
@@ -0,0 +1,77 @@
+import collections
+import random
+import threading
+import time
+
+import pytest
+
+import server
+
+
+class _Tracker:
+    """记录 _save_single_link 的并发情况：全局与每个 host 同时执行的最大数量。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.active = 0
+        self.active_by_host = collections.Counter()
+        self.max_active = 0
+        self.max_by_host = collections.Counter()
+
+    def __call__(self, item, root_dir):
+        host = item["url"].split("/")[2]
+        with self._lock:
+            self.active += 1
+            self.active_by_host[host] += 1
+            self.max_active = max(self.max_active, self.active)
+            self.max_by_host[host] = max(self.max_by_host[host], self.active_by_host[host])
+        time.sleep(random.uniform(0.005, 0.02))
+        with self._lock:
+            self.active -= 1
+            self.active_by_host[host] -= 1
+        if "bad" in item["url"]:
+            raise RuntimeError("下载失败")
+        return {"code": 0, "path": item["url"]}
+
+
+@pytest.fixture
+def tracker(monkeypatch):
+    tracker = _Tracker()
+    monkeypatch.setattr(server, "_save_single_link", tracker)
+    return tracker
+
+
+def _links(hosts, per_host):
+    return [{"url": f"https://{host}/{i}.png"} for i in range(per_host) for host in hosts]
+
+
+def test_engine_limits_concurrency_per_host(tracker):
+    engine = server.DownloadEngine(max_workers=8, per_host=2)
+    engine.save_links(_links(["a.hdslb.com", "b.hdslb.com"], 12), "")
+    assert tracker.max_by_host["a.hdslb.com"] == 2
+    assert tracker.max_by_host["b.hdslb.com"] == 2
+
+
+def test_engine_limits_global_concurrency(tracker):
+    engine = server.DownloadEngine(max_workers=3, per_host=4)
+    engine.save_links(_links([f"h{i}.hdslb.com" for i in range(6)], 4), "")
+    assert tracker.max_active == 3
+
+
+def test_engine_returns_results_in_input_order(tracker):
+    engine = server.DownloadEngine(max_workers=4, per_host=4)
+    links = _links(["a.hdslb.com", "b.hdslb.com"], 10)
+    links[5]["url"] = "https://a.hdslb.com/bad.png"
+    results = engine.save_links(links, "")
+    assert [one["index"] for one in results] == list(range(len(links)))
+    assert [one["path"] for one in results if one["code"] == 0] == [
+        link["url"] for i, link in enumerate(links) if i != 5
+    ]
+    # 单个失败不影响其他条目，错误信息保留在对应位置
+    assert results[5] == {"index": 5, "code": -1, "message": "下载失败"}
+
+
+def test_engine_reports_invalid_items():
+    engine = server.DownloadEngine(max_workers=2, per_host=1)
+    results = engine.save_links(["not a dict", {"url": "ftp://x"}], "")
+    assert [(one["index"], one["code"]) for one in results] == [(0, -1), (1, -1)]
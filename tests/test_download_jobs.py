@@ -0,0 +1,170 @@
+import threading
+import time
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def downloads(tmp_path, monkeypatch):
+    """把 downloads 目录和任务存储指向临时目录，_save_single_link 换成可控的假实现。"""
+    monkeypatch.setattr(server, "_downloads_dir", lambda: str(tmp_path))
+    monkeypatch.setattr(server, "_download_job_store", None)
+    monkeypatch.setattr(server, "_download_job_threads", {})
+    monkeypatch.setattr(server, "_download_job_meters", {})
+    gate = threading.Event()
+    gate.set()
+    calls = []
+
+    def fake_save(item, root_dir):
+        calls.append(item["url"])
+        gate.wait(5)
+        if "bad" in item["url"]:
+            raise RuntimeError("下载失败")
+        return {"code": 0, "hash": "h" + item["url"][-1], "path": item["url"]}
+
+    monkeypatch.setattr(server, "_save_single_link", fake_save)
+    return gate, calls
+
+
+def _links(n, bad=()):
+    return [{"url": f"https://i0.hdslb.com/{'bad' if i in bad else 'ok'}{i}"} for i in range(n)]
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return
+        time.sleep(0.01)
+    raise AssertionError("等待超时")
+
+
+def test_store_claims_pending_items_in_order(tmp_path):
+    store = server.DownloadJobStore(str(tmp_path))
+    job_id = store.create_job(_links(5))
+    assert [idx for idx, _ in store.claim(job_id, 2)] == [0, 1]
+    store.finish_item(job_id, 0, {"code": 0, "hash": "abc"})
+    store.finish_item(job_id, 1, {"code": -1, "message": "x"})
+    assert [idx for idx, _ in store.claim(job_id, 10)] == [2, 3, 4]
+
+    summary = store.summary(job_id, with_results=True)
+    assert (summary["pending"], summary["in_flight"], summary["done"], summary["failed"]) == (0, 3, 1, 1)
+    assert [one["code"] for one in summary["results"]] == [0, -1]
+
+    assert store.requeue(job_id, ("failed",)) == 1
+    assert store.requeue(job_id) == 3
+    assert store.summary(job_id)["pending"] == 4
+
+
+def test_store_claim_respects_paused_status(tmp_path):
+    store = server.DownloadJobStore(str(tmp_path))
+    job_id = store.create_job(_links(3))
+    store.set_status(job_id, "paused")
+    assert store.claim(job_id, 3) == []
+    store.set_status(job_id, "running")
+    assert len(store.claim(job_id, 3)) == 3
+
+
+def test_store_requeues_in_flight_items_of_stopped_jobs(tmp_path):
+    store = server.DownloadJobStore(str(tmp_path))
+    running = store.create_job(_links(2))
+    cancelled = store.create_job(_links(3))
+    store.claim(running, 2)
+    store.claim(cancelled, 3)
+    store.set_status(cancelled, "cancelled")
+
+    # 重新打开相当于进程重启；只回退已停止任务的条目，running 任务由恢复流程处理
+    store = server.DownloadJobStore(str(tmp_path))
+    assert store.requeue_stopped() == {cancelled: 3}
+    assert store.summary(cancelled)["in_flight"] == 0
+    assert store.summary(running)["in_flight"] == 2
+    assert store.unfinished_jobs() == [running]
+
+
+def test_run_download_job_completes_and_releases_meter(downloads):
+    _gate, calls = downloads
+    store = server._get_download_job_store()
+    job_id = store.create_job(_links(6, bad={2}))
+    server._start_download_job(job_id).join(5)
+
+    summary = store.summary(job_id, with_results=True)
+    assert summary["status"] == "done"
+    assert (summary["done"], summary["failed"]) == (5, 1)
+    assert [one["index"] for one in summary["results"]] == list(range(6))
+    assert len(calls) == 6
+    assert job_id not in server._download_job_threads
+    assert job_id not in server._download_job_meters
+
+
+def test_paused_job_claims_nothing_more(downloads):
+    gate, calls = downloads
+    gate.clear()
+    store = server._get_download_job_store()
+    total = server._download_engine.max_workers * 4
+    job_id = store.create_job(_links(total))
+    thread = server._start_download_job(job_id)
+
+    # 执行窗口填满后暂停，已取出的条目下载完成，其余保持 pending
+    window = server._download_engine.max_workers * 2
+    _wait_for(lambda: store.summary(job_id)["in_flight"] == window)
+    store.set_status(job_id, "paused")
+    gate.set()
+    thread.join(5)
+
+    summary = store.summary(job_id)
+    assert summary["status"] == "paused"
+    assert summary["in_flight"] == 0
+    assert summary["done"] == len(calls) == window
+    assert summary["pending"] == total - window
+
+
+def test_resume_download_jobs_restarts_interrupted_jobs(downloads, monkeypatch):
+    store = server._get_download_job_store()
+    running = store.create_job(_links(3))
+    store.claim(running, 2)
+    cancelled = store.create_job(_links(2))
+    store.claim(cancelled, 1)
+    store.set_status(cancelled, "cancelled")
+    monkeypatch.setattr(server, "_download_jobs_resumed", False)
+
+    server.resume_download_jobs()
+    server._download_job_threads[running].join(5)
+    assert store.summary(running)["status"] == "done"
+    assert store.summary(running)["done"] == 3
+    assert store.summary(cancelled)["in_flight"] == 0
+    assert store.summary(cancelled)["status"] == "cancelled"
+
+
+def test_download_job_endpoints_pause_resume_cancel(downloads):
+    gate, _calls = downloads
+    gate.clear()
+    client = server.app.test_client()
+    total = server._download_engine.max_workers * 3
+    job_id = client.post("/api/download_jobs", json={"links": _links(total)}).get_json()["data"]["job_id"]
+
+    assert client.post(f"/api/download_jobs/{job_id}/pause").get_json()["data"]["status"] == "paused"
+    gate.set()
+    _wait_for(lambda: client.get(f"/api/download_jobs/{job_id}").get_json()["data"]["in_flight"] == 0)
+
+    client.post(f"/api/download_jobs/{job_id}/resume")
+    _wait_for(lambda: client.get(f"/api/download_jobs/{job_id}").get_json()["data"]["status"] == "done")
+    data = client.get(f"/api/download_jobs/{job_id}?results=1").get_json()["data"]
+    assert data["done"] == total
+    assert len(data["results"]) == total
+
+    assert client.post(f"/api/download_jobs/{job_id}/cancel").get_json()["data"]["status"] == "done"
+    assert client.post(f"/api/download_jobs/{job_id}/restart").status_code == 400
+    assert client.get("/api/download_jobs/missing").status_code == 404
+
+
+def test_save_files_runs_inline(downloads):
+    _gate, calls = downloads
+    resp = server.app.test_client().post("/api/save_files", json={"links": _links(4, bad={1})})
+    data = resp.get_json()
+    assert (data["code"], data["saved_count"], data["failed_count"]) == (0, 3, 1)
+    assert [one["index"] for one in data["results"]] == [0, 1, 2, 3]
+    assert len(calls) == 4
+    # 同步接口不创建持久化任务
+    assert server._download_job_store is None
@@ -0,0 +1,123 @@
+import hashlib
+import os
+
+import pytest
+
+import server
+
+BODY = bytes(range(256)) * 64
+
+
+@pytest.fixture
+def hash_index(tmp_path):
+    return server.HashIndex(str(tmp_path))
+
+
+def _download(http_server, path, part_path, hash_index):
+    return server._download_to_part(http_server.url + path, str(part_path), {}, hash_index)
+
+
+def test_download_from_scratch(http_server, tmp_path, hash_index):
+    http_server.files["/a.bin"] = BODY
+    result = _download(http_server, "/a.bin", tmp_path / "a.part", hash_index)
+    assert result["hash"] == hashlib.sha256(BODY).hexdigest()
+    assert result["size"] == len(BODY)
+    assert "range" not in http_server.requests[0]
+
+
+def test_download_resumes_with_if_range(http_server, tmp_path, hash_index):
+    http_server.files["/a.bin"] = BODY
+    part_path = tmp_path / "a.part"
+    part_path.write_bytes(BODY[:1000])
+    hash_index.record_partial(str(part_path), "", '"v1"', "")
+
+    result = _download(http_server, "/a.bin", part_path, hash_index)
+    assert result["hash"] == hashlib.sha256(BODY).hexdigest()
+    assert http_server.requests[0]["range"] == "bytes=1000-"
+    assert http_server.requests[0]["if-range"] == '"v1"'
+    assert part_path.read_bytes() == BODY
+
+
+def test_download_restarts_when_remote_changed(http_server, tmp_path, hash_index):
+    new_body = b"new" * 5000
+    http_server.files["/a.bin"] = new_body
+    http_server.etags["/a.bin"] = "v2"
+    part_path = tmp_path / "a.part"
+    part_path.write_bytes(BODY[:1000])
+    hash_index.record_partial(str(part_path), "", '"v1"', "")
+
+    result = _download(http_server, "/a.bin", part_path, hash_index)
+    assert result["hash"] == hashlib.sha256(new_body).hexdigest()
+    assert part_path.read_bytes() == new_body
+
+
+def test_download_discards_part_without_validator(http_server, tmp_path, hash_index):
+    http_server.files["/a.bin"] = BODY
+    part_path = tmp_path / "a.part"
+    part_path.write_bytes(b"?" * 1000)
+
+    result = _download(http_server, "/a.bin", part_path, hash_index)
+    assert result["hash"] == hashlib.sha256(BODY).hexdigest()
+    assert "range" not in http_server.requests[0]
+
+
+def test_download_restarts_on_mismatched_206(http_server, tmp_path, hash_index):
+    http_server.files["/a.bin"] = BODY
+
+    def wrong_range(handler):
+        if handler.headers.get("Range"):
+            return 206, {"ETag": '"v1"', "Content-Range": f"bytes 10-{len(BODY) - 1}/{len(BODY)}"}, BODY[10:]
+        return 200, {"ETag": '"v1"'}, BODY
+
+    http_server.overrides["/a.bin"] = wrong_range
+    part_path = tmp_path / "a.part"
+    part_path.write_bytes(BODY[:1000])
+    hash_index.record_partial(str(part_path), "", '"v1"', "")
+
+    result = _download(http_server, "/a.bin", part_path, hash_index)
+    assert result["hash"] == hashlib.sha256(BODY).hexdigest()
+    assert [req.get("range") for req in http_server.requests] == ["bytes=1000-", None]
+
+
+def test_download_416_with_complete_part(http_server, tmp_path, hash_index):
+    http_server.files["/a.bin"] = BODY
+    part_path = tmp_path / "a.part"
+    part_path.write_bytes(BODY)
+    hash_index.record_partial(str(part_path), "", '"v1"', "")
+
+    result = _download(http_server, "/a.bin", part_path, hash_index)
+    assert result["hash"] == hashlib.sha256(BODY).hexdigest()
+    assert result["etag"] == '"v1"'
+    assert len(http_server.requests) == 1
+
+
+def test_download_416_with_oversized_part(http_server, tmp_path, hash_index):
+    http_server.files["/a.bin"] = BODY
+    part_path = tmp_path / "a.part"
+    part_path.write_bytes(BODY + b"extra")
+    hash_index.record_partial(str(part_path), "", '"v1"', "")
+
+    result = _download(http_server, "/a.bin", part_path, hash_index)
+    assert result["hash"] == hashlib.sha256(BODY).hexdigest()
+    assert part_path.read_bytes() == BODY
+    assert [req.get("range") for req in http_server.requests] == [f"bytes={len(BODY) + 5}-", None]
+
+
+def test_save_single_link_resumes_interrupted_part(http_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "_hash_indexes", {})
+    http_server.files["/a.bin"] = BODY
+    url = http_server.url + "/a.bin"
+    target_dir = tmp_path / "合集" / "other"
+    target_dir.mkdir(parents=True)
+    part_path = server._part_path_for(str(target_dir), "a.bin", url)
+    with open(part_path, "wb") as fh:
+        fh.write(BODY[:5000])
+    server._get_hash_index(str(tmp_path)).record_partial(part_path, url, '"v1"', "")
+
+    result = server._save_single_link({"url": url, "filename": "a.bin", "collectionFolder": "合集"}, str(tmp_path))
+    assert http_server.requests[0]["range"] == "bytes=5000-"
+    with open(result["path"], "rb") as fh:
+        assert fh.read() == BODY
+    # 完成后 .part 与其续传记录都被清理
+    assert sorted(os.listdir(target_dir)) == ["a.bin"]
+    assert server._get_hash_index(str(tmp_path)).lookup_partial(part_path) is None
@@ -0,0 +1,89 @@
+import io
+import zipfile
+
+import cv2
+import numpy as np
+import pytest
+
+import server
+
+
+def _emoji_sheet() -> bytes:
+    sheet = np.zeros((120, 200, 4), dtype=np.uint8)
+    colors = [(0, 0, 255), (0, 255, 0), (255, 0, 0)]
+    for row, top in enumerate((10, 60)):
+        for col, left in enumerate((10, 60, 110)):
+            sheet[top:top + 40, left:left + 40, :3] = colors[(row + col) % 3]
+            sheet[top:top + 40, left:left + 40, 3] = 255
+    # 底部的白色说明条不是表情，应被过滤
+    sheet[105:111, 10:190] = 255
+    ok, encoded = cv2.imencode(".png", sheet)
+    assert ok
+    return encoded.tobytes()
+
+
+def test_split_emoji_sheet_finds_each_tile():
+    tiles = server._split_emoji_sheet(_emoji_sheet())
+    assert [(tile["x"], tile["y"]) for tile in tiles] == [
+        (10, 10), (60, 10), (110, 10), (10, 60), (60, 60), (110, 60),
+    ]
+    for tile in tiles:
+        assert (tile["w"], tile["h"]) == (40 + 2 * server._EMOJI_PAD, 40 + 2 * server._EMOJI_PAD)
+        image = cv2.imdecode(np.frombuffer(tile["png"], dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        assert image.shape == (tile["h"], tile["w"], 4)
+
+
+def test_split_emoji_sheet_without_alpha():
+    sheet = np.zeros((50, 50, 3), dtype=np.uint8)
+    ok, encoded = cv2.imencode(".png", sheet)
+    assert ok
+    # 不带 alpha 的图片视为整张不透明
+    tiles = server._split_emoji_sheet(encoded.tobytes())
+    assert [(tile["x"], tile["y"], tile["w"], tile["h"]) for tile in tiles] == [(0, 0, 50, 50)]
+
+
+def test_split_emoji_sheet_rejects_undecodable_content():
+    with pytest.raises(ValueError):
+        server._split_emoji_sheet(b"not an image")
+
+
+@pytest.fixture
+def emoji(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "_emoji_cache", server.DiskLRUCache(str(tmp_path / "emoji"), 10 * 1024 * 1024))
+    fetched = []
+
+    def fake_fetch(url):
+        fetched.append(url)
+        return _emoji_sheet()
+
+    monkeypatch.setattr(server, "_fetch_image_bytes", fake_fetch)
+    return fetched
+
+
+def test_emoji_tiles_endpoint_serves_cached_tiles(emoji):
+    client = server.app.test_client()
+    url = "https://i0.hdslb.com/bfs/garb/sheet.png"
+    data = client.get("/api/emoji_tiles", query_string={"url": url}).get_json()["data"]
+    assert data["count"] == 6
+    assert client.get("/api/emoji_tiles", query_string={"url": url}).get_json()["data"] == data
+    assert emoji == [url]
+
+    tile = client.get(data["tiles"][0]["url"])
+    assert tile.content_type == "image/png"
+    image = cv2.imdecode(np.frombuffer(tile.data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    assert image.shape[:2] == (data["tiles"][0]["h"], data["tiles"][0]["w"])
+
+    archive = client.get(data["zip"] + "?name=贴纸")
+    assert "attachment" in archive.headers["Content-Disposition"]
+    with zipfile.ZipFile(io.BytesIO(archive.data)) as zf:
+        assert sorted(zf.namelist()) == [f"{index}.png" for index in range(1, 7)]
+
+    client.get("/api/emoji_tiles", query_string={"url": url, "refresh": "1"})
+    assert emoji == [url, url]
+
+
+def test_emoji_tiles_endpoint_errors(emoji):
+    client = server.app.test_client()
+    assert client.get("/api/emoji_tiles?url=ftp://x").status_code == 400
+    assert client.get(f"/api/emoji_tiles/{'0' * 64}/1.png").status_code == 404
+    assert client.get("/api/emoji_tiles/not-a-key.zip").status_code == 404
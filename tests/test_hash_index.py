@@ -0,0 +1,72 @@
+import hashlib
+import os
+
+import pytest
+
+import server
+
+
+def _write(path, data: bytes) -> str:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return str(path)
+
+
+def _sha(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.fixture
+def library(tmp_path):
+    _write(tmp_path / "root.zip", b"root")
+    _write(tmp_path / "合集A" / "img" / "1.png", b"one")
+    _write(tmp_path / "合集A" / "img" / "2.png", b"two")
+    _write(tmp_path / "合集B" / "vid" / "1.mp4", b"video")
+    _write(tmp_path / "合集B" / "vid" / "x.mp4.part", b"partial")
+    _write(tmp_path / ".objects" / "ab" / "hidden", b"hidden")
+    return tmp_path
+
+
+def test_rebuild_indexes_every_visible_file(library):
+    index = server.HashIndex(str(library))
+    stats = index.rebuild()
+    assert (stats["hashed"], stats["total"]) == (4, 4)
+    files = {os.path.relpath(path, library).replace(os.sep, "/"): file_hash for path, file_hash, _ in index.iter_files()}
+    # 根目录下的文件同样登记；.part 与 . 开头的目录被跳过
+    assert files == {
+        "root.zip": _sha(b"root"),
+        "合集A/img/1.png": _sha(b"one"),
+        "合集A/img/2.png": _sha(b"two"),
+        "合集B/vid/1.mp4": _sha(b"video"),
+    }
+
+    # 再次重建只重新计算变化过的文件，已删除目录的记录被清理
+    _write(library / "合集A" / "img" / "2.png", b"two, edited")
+    for name in os.listdir(library / "合集B" / "vid"):
+        os.remove(library / "合集B" / "vid" / name)
+    os.rmdir(library / "合集B" / "vid")
+    stats = index.rebuild()
+    assert (stats["hashed"], stats["total"]) == (1, 3)
+    assert index.rebuild(force=True)["hashed"] == 3
+
+
+def test_find_duplicate_uses_index_and_checks_freshness(library):
+    index = server.HashIndex(str(library))
+    img_dir = str(library / "合集A" / "img")
+    found = index.find_duplicate(img_dir, _sha(b"one"), 3)
+    assert found == str(library / "合集A" / "img" / "1.png")
+    assert index.find_duplicate(img_dir, _sha(b"one"), 3, exclude_path=found) == ""
+    # 只在同一目录内查找
+    assert index.find_duplicate(str(library / "合集B" / "vid"), _sha(b"one"), 3) == ""
+
+    # 文件被手动修改后，旧记录不再命中
+    _write(library / "合集A" / "img" / "1.png", b"changed")
+    assert index.find_duplicate(img_dir, _sha(b"one"), 3) == ""
+    assert index.find_duplicate(img_dir, _sha(b"changed"), 7) == found
+
+
+def test_index_persists_across_instances(library):
+    server.HashIndex(str(library)).rebuild()
+    index = server.HashIndex(str(library))
+    assert len(index.iter_files()) == 4
+    assert index.rebuild()["hashed"] == 0
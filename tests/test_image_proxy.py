@@ -0,0 +1,99 @@
+import os
+import time
+
+import pytest
+
+import server
+
+IMAGE = b"\x89PNG" + os.urandom(5000)
+
+
+def _put(cache, key, size, mtime):
+    cache.put_bytes(key, b"x" * size, {"key": key})
+    os.utime(cache.get(key)["path"], (mtime, mtime))
+
+
+def test_disk_lru_cache_evicts_least_recently_used(tmp_path):
+    cache = server.DiskLRUCache(str(tmp_path / "cache"), max_bytes=1000)
+    now = time.time()
+    keys = [f"{i:02d}" + "a" * 62 for i in range(4)]
+    for i, key in enumerate(keys[:3]):
+        _put(cache, key, 300, now - 30 + i * 10)
+    assert cache.stats()["bytes"] == 900
+
+    # 访问最早写入的条目后，淘汰的是第二个
+    assert cache.get(keys[0])["size"] == 300
+    _put(cache, keys[3], 300, now)
+    assert cache.get(keys[1]) is None
+    assert all(cache.get(key) for key in (keys[0], keys[2], keys[3]))
+    assert cache.stats()["bytes"] == 900
+
+    # 重新打开时按磁盘上的文件统计总大小
+    assert server.DiskLRUCache(str(tmp_path / "cache"), max_bytes=1000).stats()["bytes"] == 900
+
+
+def test_disk_lru_cache_replaces_entry_size(tmp_path):
+    cache = server.DiskLRUCache(str(tmp_path / "cache"), max_bytes=1000)
+    key = "b" * 64
+    cache.put_bytes(key, b"x" * 400, {})
+    cache.put_bytes(key, b"y" * 100, {})
+    assert cache.stats()["bytes"] == 100
+    with open(cache.get(key)["path"], "rb") as fh:
+        assert fh.read() == b"y" * 100
+
+
+def test_disk_lru_cache_creates_directory_on_first_write(tmp_path):
+    cache = server.DiskLRUCache(str(tmp_path / "cache"), max_bytes=1000)
+    assert cache.get("c" * 64) is None
+    assert not (tmp_path / "cache").exists()
+    cache.put_bytes("c" * 64, b"z", {})
+    assert (tmp_path / "cache").is_dir()
+
+
+@pytest.fixture
+def proxy(http_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "_proxy_cache", server.DiskLRUCache(str(tmp_path / "proxy"), 10 * 1024 * 1024))
+    http_server.files["/bfs/card.png"] = IMAGE
+    client = server.app.test_client()
+
+    def get(headers=None):
+        resp = client.get("/api/proxy_img", query_string={"url": http_server.url + "/bfs/card.png"},
+                          headers=headers or {})
+        data = resp.get_data()
+        resp.close()
+        return resp, data
+
+    return http_server, get
+
+
+def test_proxy_streams_then_serves_from_cache(proxy):
+    http_server, get = proxy
+    resp, data = get()
+    assert (resp.status_code, data) == (200, IMAGE)
+    assert resp.headers["Content-Length"] == str(len(IMAGE))
+    assert 'filename="card.png"' in resp.headers["Content-Disposition"]
+
+    cached, data = get()
+    assert (cached.status_code, data) == (200, IMAGE)
+    assert cached.headers["ETag"] == resp.headers["ETag"]
+    assert len(http_server.requests) == 1
+
+    assert get({"If-None-Match": resp.headers["ETag"]})[0].status_code == 304
+
+
+def test_proxy_etag_follows_upstream_change(proxy, monkeypatch):
+    http_server, get = proxy
+    first, _data = get()
+
+    # 缓存过期后源站内容已变化：返回新内容和新的 ETag，而不是对旧 ETag 返回 304
+    monkeypatch.setattr(server, "PROXY_CACHE_FRESH_SECONDS", 0)
+    http_server.files["/bfs/card.png"] = b"\x89PNG-new"
+    http_server.etags["/bfs/card.png"] = "v2"
+    resp, data = get({"If-None-Match": first.headers["ETag"]})
+    assert (resp.status_code, data) == (200, b"\x89PNG-new")
+    assert resp.headers["ETag"] != first.headers["ETag"]
+    assert http_server.requests[-1]["if-none-match"] == '"v1"'
+
+
+def test_proxy_rejects_invalid_url():
+    assert server.app.test_client().get("/api/proxy_img?url=ftp://x").status_code == 400
@@ -0,0 +1,41 @@
+import threading
+import time
+
+import server
+
+
+def test_keyed_lock_serializes_same_key_only():
+    locks = server.KeyedLock()
+    events = []
+
+    def worker(key, name):
+        with locks.hold(key):
+            events.append(("in", name))
+            time.sleep(0.05)
+            events.append(("out", name))
+
+    threads = [threading.Thread(target=worker, args=(key, name)) for key, name in (("a", 1), ("a", 2), ("b", 3))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    same_key = [event for event in events if event[1] in (1, 2)]
+    # 同一 key 的两个持有者不交错；不同 key 可以同时进入
+    assert same_key[0][0] == "in" and same_key[1] == ("out", same_key[0][1])
+    assert events.index(("in", 3)) < events.index(("out", 1)) or events.index(("in", 3)) < events.index(("out", 2))
+
+
+def test_keyed_lock_drops_idle_keys():
+    locks = server.KeyedLock()
+    for i in range(100):
+        with locks.hold(f"part-{i}"):
+            assert len(locks) == 1
+    assert len(locks) == 0
+
+    try:
+        with locks.hold("error"):
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    assert len(locks) == 0
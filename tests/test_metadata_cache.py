@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+import server
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = server.TTLCache(max_items=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["size"] == 2
+
+
+def test_ttl_cache_expires_entries():
+    cache = server.TTLCache(max_items=10, ttl=0.05)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=60)
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 1, 1)
+
+
+def test_ttl_cache_persists_unexpired_entries(tmp_path):
+    path = str(tmp_path / "metadata_cache.json")
+    cache = server.TTLCache(max_items=10, ttl=60, persist_path=path)
+    cache.set("act:1", {"name": "合集"})
+    cache.set("short", 1, ttl=0.01)
+    cache.flush()
+    time.sleep(0.02)
+
+    loaded = server.TTLCache(max_items=10, ttl=60, persist_path=path)
+    assert loaded.get("act:1") == {"name": "合集"}
+    assert loaded.get("short") is None
+
+
+class _FakeDLC:
+    calls = 0
+
+    def __init__(self, act_id):
+        self.act_id = act_id
+
+    async def get_info(self):
+        _FakeDLC.calls += 1
+        return {"act_id": self.act_id, "lottery_list": []}
+
+
+@pytest.fixture
+def fake_dlc(monkeypatch):
+    monkeypatch.setattr(server, "_metadata_cache", server.TTLCache(max_items=10, ttl=60))
+    monkeypatch.setattr(server, "DLC", _FakeDLC)
+    monkeypatch.setattr(server, "_bili_rate_limit", lambda rate_class: None)
+    _FakeDLC.calls = 0
+    return _FakeDLC
+
+
+def test_act_info_is_cached_until_refresh(fake_dlc):
+    assert server._get_act_info("42")["act_id"] == 42
+    assert server._get_act_info("42")["act_id"] == 42
+    assert fake_dlc.calls == 1
+    server._get_act_info("42", refresh=True)
+    assert fake_dlc.calls == 2
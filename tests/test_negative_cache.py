@@ -0,0 +1,82 @@
+import sqlite3
+import time
+
+import server
+
+
+def _cache(tmp_path, ttl=3600):
+    return server.NegativeIdCache(str(tmp_path / "neg.db"), ttl)
+
+
+def test_add_contains_discard(tmp_path):
+    cache = _cache(tmp_path)
+    for act_id in (1, 4095, 4096, 10 ** 7):
+        cache.add(act_id)
+    assert all(cache.contains(act_id) for act_id in (1, 4095, 4096, 10 ** 7))
+    assert not cache.contains(2)
+
+    cache.discard(4096)
+    assert not cache.contains(4096)
+    assert cache.contains(4095)
+    stats = cache.stats()
+    # 只为出现过的块分配内存
+    assert (stats["count"], stats["blocks"]) == (3, 3)
+
+
+def test_flush_persists_to_new_instance(tmp_path):
+    cache = _cache(tmp_path)
+    cache.add(123)
+    cache.add(456)
+    cache.flush()
+    cache.discard(456)
+    cache.flush()
+
+    reopened = _cache(tmp_path)
+    assert reopened.contains(123)
+    assert not reopened.contains(456)
+
+
+def test_expired_generations_are_dropped(tmp_path):
+    cache = _cache(tmp_path, ttl=3600)
+    cache.add(1)
+    cache.flush()
+    # 把记录改写到一代 TTL 之前
+    old_gen = cache._current_gen() - cache.GENERATIONS - 1
+    with sqlite3.connect(str(tmp_path / "neg.db")) as conn:
+        conn.execute("UPDATE blocks SET gen = ?", (old_gen,))
+
+    reopened = _cache(tmp_path)
+    assert not reopened.contains(1)
+    assert reopened.stats()["blocks"] == 0
+
+
+def test_clear_removes_memory_and_disk(tmp_path):
+    cache = _cache(tmp_path)
+    cache.add(7)
+    cache.flush()
+    cache.clear()
+    assert not cache.contains(7)
+    assert cache.stats()["count"] == 0
+    assert not _cache(tmp_path).contains(7)
+
+
+def test_many_dirty_blocks_flush_in_background(tmp_path, monkeypatch):
+    monkeypatch.setattr(server.NegativeIdCache, "FLUSH_BLOCKS", 4)
+    cache = _cache(tmp_path)
+    for block in range(4):
+        cache.add(block * cache.BLOCK_BITS)
+
+    deadline = time.monotonic() + 5
+    while _cache(tmp_path).stats()["count"] < 4:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_negative_cache_endpoint(tmp_path, monkeypatch):
+    cache = _cache(tmp_path)
+    cache.add(9)
+    monkeypatch.setattr(server, "_negative_act_ids", cache)
+    client = server.app.test_client()
+    assert client.get("/api/negative_cache").get_json()["data"]["count"] == 1
+    assert client.delete("/api/negative_cache").get_json()["data"]["count"] == 0
+    assert not cache.contains(9)
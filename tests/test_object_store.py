@@ -0,0 +1,99 @@
+import hashlib
+import os
+
+import pytest
+
+import server
+
+
+def _sha(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = server.ObjectStore(str(tmp_path))
+    assert store.enabled
+    return store
+
+
+def _write(path, data: bytes) -> str:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_ingest_and_link_share_one_object(store, tmp_path):
+    data = b"card" * 1000
+    src = _write(tmp_path / "a" / ".tmp", data)
+    obj_path = store.ingest(src, _sha(data))
+    assert not os.path.exists(src)
+    assert store.has(_sha(data), len(data))
+    assert not store.has(_sha(data), len(data) + 1)
+
+    # 内容已存在时 ingest 只删除源文件
+    dup = _write(tmp_path / "b" / ".tmp", data)
+    assert store.ingest(dup, _sha(data)) == obj_path
+    assert not os.path.exists(dup)
+
+    for name in ("a/x.png", "b/y.png"):
+        dest = tmp_path / name
+        store.link(_sha(data), str(dest))
+        assert dest.read_bytes() == data
+    assert [p for p in os.listdir(tmp_path / "a") if p.startswith(".")] == []
+
+
+def test_adopt_merges_identical_files(store, tmp_path):
+    data = b"same" * 500
+    first = _write(tmp_path / "a" / "1.png", data)
+    second = _write(tmp_path / "b" / "2.png", data)
+    assert store.adopt(first, _sha(data)) is False
+    assert store.adopt(second, _sha(data)) is True
+    assert os.path.samefile(first, second) or store.view_mode == "reflink"
+    assert (tmp_path / "b" / "2.png").read_bytes() == data
+    # 已是对象视图的文件再次纳入时不做处理
+    assert store.adopt(first, _sha(data)) is False
+
+
+def test_adopt_keeps_file_edited_after_indexing(store, tmp_path):
+    old = b"old!" * 500
+    store.ingest(_write(tmp_path / ".tmp", old), _sha(old))
+    path = _write(tmp_path / "a" / "1.png", old)
+    stat = os.stat(path)
+
+    # 文件在索引之后被修改，且大小和 mtime 与索引记录相同
+    edited = b"new!" * 500
+    _write(tmp_path / "a" / "1.png", edited)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    assert store.adopt(path, _sha(old)) is False
+    assert (tmp_path / "a" / "1.png").read_bytes() == edited
+    # 内容不一致的文件也不会以旧哈希的名义入库
+    other = _write(tmp_path / "b" / "2.png", edited)
+    missing = _sha(b"never stored")
+    assert store.adopt(other, missing) is False
+    assert not store.has(missing)
+
+
+def test_prune_removes_unreferenced_objects(store, tmp_path):
+    keep, drop = b"keep" * 100, b"drop" * 200
+    for data in (keep, drop):
+        store.ingest(_write(tmp_path / ".tmp", data), _sha(data))
+    assert store.prune({_sha(keep)}) == {"removed": 1, "freed_bytes": len(drop)}
+    assert store.has(_sha(keep)) and not store.has(_sha(drop))
+
+
+def test_sync_object_store_merges_indexed_duplicates(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "OBJECT_STORE_ENABLED", True)
+    monkeypatch.setattr(server, "_object_stores", {})
+    monkeypatch.setattr(server, "_hash_indexes", {})
+    data = b"dup" * 1000
+    _write(tmp_path / "合集A" / "img" / "1.png", data)
+    _write(tmp_path / "合集B" / "img" / "1.png", data)
+    _write(tmp_path / "合集B" / "img" / "2.png", b"unique")
+    server._get_hash_index(str(tmp_path)).rebuild()
+
+    result = server._sync_object_store(str(tmp_path))
+    assert (result["files"], result["merged"], result["saved_bytes"]) == (3, 1, len(data))
+    assert (tmp_path / "合集B" / "img" / "1.png").read_bytes() == data
+    assert server._sync_object_store(str(tmp_path))["merged"] == 0
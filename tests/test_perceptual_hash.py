@@ -0,0 +1,99 @@
+import random
+
+import cv2
+import numpy as np
+import pytest
+
+import server
+
+
+def test_chunk_variants_cover_radius():
+    masks = server._chunk_variants(2)
+    assert len(masks) == len(set(masks)) == 1 + 16 + 120
+    assert all(mask < 1 << 16 and mask.bit_count() <= 2 for mask in masks)
+
+
+@pytest.fixture
+def index_with_hashes(tmp_path):
+    rng = random.Random(20260610)
+    index = server.PerceptualIndex(str(tmp_path / "phash.db"), max_distance=8)
+    hashes = {}
+    for i in range(200):
+        base = rng.getrandbits(64)
+        hashes[f"base{i}"] = base
+        # 每个基准哈希附带若干个翻转了 1~12 位的近似哈希
+        for j in range(3):
+            flipped = base
+            for bit in rng.sample(range(64), rng.randint(1, 12)):
+                flipped ^= 1 << bit
+            hashes[f"near{i}_{j}"] = flipped
+    for sha, value in hashes.items():
+        index.add(sha, value, 0)
+    return index, hashes, rng
+
+
+@pytest.mark.parametrize("max_distance", [0, 3, 8])
+def test_neighbors_match_brute_force(index_with_hashes, max_distance):
+    index, hashes, rng = index_with_hashes
+    queries = list(hashes.values())[::7] + [rng.getrandbits(64) for _ in range(20)]
+    for query in queries:
+        expected = {
+            (sha, (value ^ query).bit_count())
+            for sha, value in hashes.items()
+            if (value ^ query).bit_count() <= max_distance
+        }
+        found = {(sha, distance) for sha, _p, _d, distance in index.neighbors(query, max_distance)}
+        assert found == expected
+
+
+def test_add_records_pairs_within_max_distance(index_with_hashes):
+    index, hashes, _rng = index_with_hashes
+    with index._lock:
+        pairs = {(a, b): distance for a, b, distance, _d in index._conn.execute("SELECT * FROM phash_pairs")}
+    shas = sorted(hashes)
+    expected = {
+        (a, b): (hashes[a] ^ hashes[b]).bit_count()
+        for i, a in enumerate(shas)
+        for b in shas[i + 1:]
+        if (hashes[a] ^ hashes[b]).bit_count() <= 8
+    }
+    assert pairs == expected
+
+
+def _write_png(path, image):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    ok, encoded = cv2.imencode(".png", image)
+    assert ok
+    path.write_bytes(encoded.tobytes())
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "_hash_indexes", {})
+    monkeypatch.setattr(server, "_perceptual_indexes", {})
+    gradient = np.tile(np.arange(0, 256, 4, dtype=np.uint8), (64, 1))
+    _write_png(tmp_path / "合集A" / "img" / "1.png", gradient)
+    _write_png(tmp_path / "合集B" / "img" / "1.png", gradient)  # 内容相同，只算一次
+    _write_png(tmp_path / "合集A" / "img" / "2.png", np.clip(gradient.astype(np.int16) + 6, 0, 255).astype(np.uint8))
+    _write_png(tmp_path / "合集A" / "img" / "3.png", np.random.default_rng(7).integers(0, 256, (64, 64), dtype=np.uint8))
+    (tmp_path / "合集A" / "img" / "broken.png").write_bytes(b"not an image")
+    (tmp_path / "合集A" / "img" / "gone.png").write_bytes(b"deleted later")
+    (tmp_path / "合集A" / "vid").mkdir()
+    (tmp_path / "合集A" / "vid" / "1.mp4").write_bytes(b"video")
+    server._get_hash_index(str(tmp_path)).rebuild()
+    # 索引之后被删除的文件不应让补算中断
+    (tmp_path / "合集A" / "img" / "gone.png").unlink()
+    return tmp_path
+
+
+def test_backfill_isolates_failures_and_dedupes_content(library):
+    stats = server._backfill_perceptual_hashes(str(library))
+    assert (stats["hashed"], stats["failed"], stats["total"]) == (3, 2, 3)
+    assert stats["pairs"] == 1
+
+    # 已补算的内容不会重复计算，失败的文件下次仍会重试
+    again = server._backfill_perceptual_hashes(str(library))
+    assert (again["hashed"], again["failed"], again["total"]) == (0, 2, 3)
+
+    clusters = server._get_perceptual_index(str(library)).clusters(server.PHASH_MAX_DISTANCE)
+    assert [len(cluster["hashes"]) for cluster in clusters] == [2]
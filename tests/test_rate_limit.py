@@ -0,0 +1,50 @@
+import pytest
+
+import server
+
+
+def test_token_bucket_queues_reservations():
+    bucket = server.AdaptiveTokenBucket("test", rate=10, burst=1, jitter=0)
+    waits = [bucket.reserve() for _ in range(3)]
+    assert waits[0] == 0
+    assert waits[1] == pytest.approx(0.1, abs=0.02)
+    assert waits[2] == pytest.approx(0.2, abs=0.02)
+
+
+def test_token_bucket_backs_off_and_ramps_up_to_ceiling():
+    bucket = server.AdaptiveTokenBucket("test", rate=2, min_rate=0.5, max_rate=4, burst=1,
+                                        ramp_after=2, ramp_factor=1.5, jitter=0)
+    bucket.on_throttled()
+    assert bucket.rate == 1.0
+    assert bucket.snapshot()["ceiling"] == 1.8
+    assert bucket.snapshot()["throttled_count"] == 1
+    # 触发风控后清空积累的令牌，下一个请求至少等一个间隔
+    assert bucket.reserve() == pytest.approx(1.0, abs=0.02)
+
+    for _ in range(2):
+        bucket.on_success()
+    assert bucket.rate == pytest.approx(1.5)
+    for _ in range(2):
+        bucket.on_success()
+    assert bucket.rate == pytest.approx(1.8)
+    for _ in range(2):
+        bucket.on_success()
+    # 达到上限后上限本身缓慢放宽
+    assert bucket.rate == pytest.approx(1.8 * 1.02)
+
+
+def test_token_bucket_respects_min_rate():
+    bucket = server.AdaptiveTokenBucket("test", rate=1, min_rate=0.2, jitter=0)
+    for _ in range(10):
+        bucket.on_throttled()
+    assert bucket.rate == 0.2
+
+
+def test_rate_classes_are_independent(monkeypatch):
+    limiters = {name: server.AdaptiveTokenBucket(name, rate=2, jitter=0) for name in ("act_basic", "search")}
+    monkeypatch.setattr(server, "_RATE_LIMITERS", limiters)
+    server._bili_report("act_basic", throttled=True)
+    server._bili_report("search")
+    assert limiters["act_basic"].rate == 1.0
+    assert limiters["search"].rate == 2
+    assert limiters["search"].snapshot()["success_streak"] == 1
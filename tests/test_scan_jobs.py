@@ -0,0 +1,120 @@
+import time
+import types
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def scan(tmp_path, monkeypatch):
+    """_check_act_ids 换成假实现：3 的倍数存在，fail 中的 ID 前 N 次返回错误。"""
+    store = server.ActIdStore(str(tmp_path / "act_ids.db"))
+    monkeypatch.setattr(server, "_act_id_store", store)
+    monkeypatch.setattr(server, "_SCAN_RETRY_BACKOFF", 0)
+    fail = {}
+    calls = []
+
+    def fake_check(act_ids, refresh=False, cache_metadata=True):
+        calls.append((list(act_ids), cache_metadata))
+        results = []
+        for act_id in act_ids:
+            if fail.get(act_id, (0, False))[0] > 0:
+                remaining, throttled = fail[act_id]
+                fail[act_id] = (remaining - 1, throttled)
+                results.append({"act_id": str(act_id), "error": "网络错误", "throttled": throttled})
+            else:
+                exists = act_id % 3 == 0
+                results.append({"act_id": str(act_id), "exists": exists, "name": f"合集{act_id}" if exists else ""})
+        return results
+
+    monkeypatch.setattr(server, "_check_act_ids", fake_check)
+    return store, fail, calls
+
+
+def test_scan_job_records_found_ids(scan):
+    store, _fail, calls = scan
+    job = server.ScanJob(1, 95)
+    job.run()
+
+    data = job.snapshot()
+    assert data["status"] == "done"
+    assert data["checked"] == 95
+    assert sorted(item["act_id"] for item in data["found"]) == list(range(3, 96, 3))
+    assert data["not_found_count"] == 95 - 31
+    # 命中结果写入可用 act_id 记录；扫描不污染元数据缓存
+    assert store.count() == 31
+    assert all(cache_metadata is False for _ids, cache_metadata in calls)
+    assert max(len(ids) for ids, _ in calls) <= server._SCAN_PAGE_SIZE
+
+
+def test_scan_job_retries_failed_ids(scan):
+    _store, fail, _calls = scan
+    fail.update({4: (1, False), 5: (server._SCAN_MAX_RETRY, False)})
+    job = server.ScanJob(1, 10)
+    job.run()
+    data = job.snapshot()
+    assert data["checked"] == 10
+    assert data["errors"] == [5]
+    assert 4 in data["not_found"]
+
+
+def test_throttled_errors_do_not_back_off(scan, monkeypatch):
+    _store, fail, _calls = scan
+    monkeypatch.setattr(server, "_SCAN_RETRY_BACKOFF", 30)
+    fail.update({2: (1, True)})
+    job = server.ScanJob(1, 5)
+    started = time.monotonic()
+    job.run()
+    # 412 由令牌桶退避，任务本身不再额外等待
+    assert time.monotonic() - started < 5
+    assert job.snapshot()["error_count"] == 0
+
+
+def test_network_errors_back_off_and_cancel_interrupts_wait(scan, monkeypatch):
+    _store, fail, _calls = scan
+    monkeypatch.setattr(server, "_SCAN_RETRY_BACKOFF", 30)
+    fail.update({2: (1, False)})
+    job = server.ScanJob(1, 5)
+    server.threading.Timer(0.2, job.cancel).start()
+    started = time.monotonic()
+    job.run()
+    assert time.monotonic() - started < 5
+    assert job.snapshot()["status"] == "cancelled"
+
+
+def test_snapshot_returns_deltas(scan):
+    job = server.ScanJob(1, 30)
+    job.run()
+    full = job.snapshot()
+    delta = job.snapshot(found_since=4, errors_since=0)
+    assert delta["found_count"] == full["found_count"] == 10
+    assert delta["found"] == full["found"][4:]
+    assert job.snapshot(found_since=10)["found"] == []
+
+
+def test_prune_finished_jobs(monkeypatch):
+    monkeypatch.setattr(server, "JOB_RETENTION_SECONDS", 60)
+    jobs = {
+        "old": types.SimpleNamespace(finished_ts=time.time() - 120),
+        "recent": types.SimpleNamespace(finished_ts=time.time() - 10),
+        "running": types.SimpleNamespace(finished_ts=0.0),
+    }
+    server._prune_finished_jobs(jobs, server.threading.Lock())
+    assert sorted(jobs) == ["recent", "running"]
+
+
+def test_scan_jobs_endpoint(scan, monkeypatch):
+    monkeypatch.setattr(server, "_scan_jobs", {})
+    client = server.app.test_client()
+    assert client.post("/api/scan_jobs", json={"start": 10, "end": 5}).status_code == 400
+    assert client.post("/api/scan_jobs", json={"start": 1, "end": server.SCAN_MAX_RANGE + 1}).status_code == 400
+
+    job_id = client.post("/api/scan_jobs", json={"start": 1, "end": 12}).get_json()["data"]["job_id"]
+    deadline = time.monotonic() + 5
+    while client.get(f"/api/scan_jobs/{job_id}").get_json()["data"]["status"] == "running":
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    data = client.get(f"/api/scan_jobs/{job_id}?found_since=2").get_json()["data"]
+    assert (data["found_count"], [item["act_id"] for item in data["found"]]) == (4, [9, 12])
+    assert client.get("/api/scan_jobs/missing").status_code == 404
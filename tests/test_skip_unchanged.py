@@ -0,0 +1,96 @@
+import hashlib
+import os
+import types
+
+import pytest
+
+import server
+
+BODY = os.urandom(20000)
+
+
+@pytest.fixture
+def save(http_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "_hash_indexes", {})
+    http_server.files["/bfs/a.bin"] = BODY
+
+    def _save(filename="a.bin"):
+        item = {"url": http_server.url + "/bfs/a.bin", "filename": filename, "collectionFolder": "合集"}
+        return server._save_single_link(item, str(tmp_path))
+
+    return http_server, _save
+
+
+def test_unchanged_source_is_skipped_with_conditional_get(save):
+    http_server, save_one = save
+    first = save_one()
+    assert first["duplicate"] is False
+    assert first["hash"] == hashlib.sha256(BODY).hexdigest()
+
+    second = save_one()
+    assert second["skipped"] is True
+    assert second["path"] == first["path"]
+    assert http_server.requests[-1]["if-none-match"] == '"v1"'
+    assert sorted(os.listdir(os.path.dirname(first["path"]))) == ["a.bin"]
+
+
+def test_changed_source_is_downloaded_again(save):
+    http_server, save_one = save
+    first = save_one()
+    http_server.files["/bfs/a.bin"] = b"new content"
+    http_server.etags["/bfs/a.bin"] = "v2"
+
+    second = save_one()
+    assert "skipped" not in second
+    assert second["hash"] == hashlib.sha256(b"new content").hexdigest()
+    with open(first["path"], "rb") as fh:
+        assert fh.read() == BODY
+    with open(second["path"], "rb") as fh:
+        assert fh.read() == b"new content"
+
+
+def test_missing_local_file_is_downloaded_without_conditions(save):
+    http_server, save_one = save
+    first = save_one()
+    os.remove(first["path"])
+
+    second = save_one()
+    assert "skipped" not in second
+    assert "if-none-match" not in http_server.requests[-1]
+    with open(second["path"], "rb") as fh:
+        assert fh.read() == BODY
+
+
+def _resp(status, **headers):
+    return types.SimpleNamespace(status_code=status, headers=headers)
+
+
+def test_is_source_unchanged():
+    known = {"etag": '"v1"', "last_modified": "Wed, 10 Jun 2026 00:00:00 GMT", "size": 5}
+    assert server._is_source_unchanged(_resp(304), known)
+    assert server._is_source_unchanged(_resp(200, ETag='"v1"'), known)
+    assert not server._is_source_unchanged(_resp(200, ETag='"v2"'), known)
+    assert not server._is_source_unchanged(_resp(206, ETag='"v1"'), known)
+
+    # 没有 ETag 时要求 Last-Modified 与大小都一致
+    no_etag = {**known, "etag": ""}
+    lm = known["last_modified"]
+    assert server._is_source_unchanged(_resp(200, **{"Last-Modified": lm, "Content-Length": "5"}), no_etag)
+    assert not server._is_source_unchanged(_resp(200, **{"Last-Modified": lm, "Content-Length": "6"}), no_etag)
+    assert not server._is_source_unchanged(_resp(200, **{"Content-Length": "5"}), no_etag)
+
+
+def test_source_manifest_lookup(tmp_path):
+    index = server.HashIndex(str(tmp_path))
+    path = tmp_path / "合集" / "img" / "1.png"
+    path.parent.mkdir(parents=True)
+    path.write_bytes(b"one")
+    url = "https://i0.hdslb.com/bfs/1.png"
+    index.record_source(url, str(path), '"e"', "", 3, "h1")
+    assert index.lookup_source(url, str(path.parent))["hash"] == "h1"
+    assert index.lookup_source_any(url)["etag"] == '"e"'
+    assert index.lookup_source(url, str(tmp_path / "合集")) is None
+
+    # 本地文件大小变化后清单记录失效
+    path.write_bytes(b"longer")
+    assert index.lookup_source(url, str(path.parent)) is None
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+import server
+
+
+@pytest.fixture(autouse=True)
+def fast_sse(monkeypatch):
+    monkeypatch.setattr(server, "_SSE_INTERVAL", 0)
+
+
+def _events(response) -> list:
+    events = []
+    for block in response.get_data(as_text=True).split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if lines:
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_sse_response_sends_changes_then_end():
+    snapshots = iter([{"n": 1}, {"n": 1}, {"n": 2, "paused": True}, {"n": 3}, {"n": 3, "end": True}])
+    with server.app.test_request_context():
+        response = server._sse_response(
+            lambda: next(snapshots),
+            lambda data: data.get("end"),
+            lambda data: "paused" if data.get("paused") else "progress",
+        )
+    assert response.mimetype == "text/event-stream"
+    assert _events(response) == [
+        ("progress", {"n": 1}), ("paused", {"n": 2, "paused": True}), ("progress", {"n": 3}),
+        ("end", {"n": 3, "end": True}),
+    ]
+
+
+@pytest.fixture
+def job_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "_downloads_dir", lambda: str(tmp_path))
+    monkeypatch.setattr(server, "_download_job_store", None)
+    monkeypatch.setattr(server, "_download_job_threads", {})
+    monkeypatch.setattr(server, "_download_jobs_resumed", False)
+    return server._get_download_job_store()
+
+
+def test_download_job_events_pause_then_end(job_store, monkeypatch):
+    job_id = job_store.create_job([{"url": "https://i0.hdslb.com/a.png"}])
+    job_store.set_status(job_id, "paused")
+    statuses = iter(["paused", "paused", "done"])
+    original = server._download_job_snapshot
+
+    def snapshot(jid, with_results=False):
+        data = original(jid, with_results)
+        data["status"] = next(statuses, "done")
+        return data
+
+    monkeypatch.setattr(server, "_download_job_snapshot", snapshot)
+    events = _events(server.app.test_client().get(f"/api/download_jobs/{job_id}/events"))
+    # 暂停时保持连接并发送 paused 事件，任务结束后才发送 end
+    assert [name for name, _ in events] == ["paused", "end"]
+
+
+def test_cancelled_job_with_stale_in_flight_ends_after_restart(job_store):
+    job_id = job_store.create_job([{"url": f"https://i0.hdslb.com/{i}.png"} for i in range(3)])
+    job_store.claim(job_id, 2)
+    job_store.set_status(job_id, "cancelled")
+
+    # 模拟重启：上次进程遗留的 in_flight 条目在启动时回退，事件流可以正常结束
+    server.resume_download_jobs()
+    events = _events(server.app.test_client().get(f"/api/download_jobs/{job_id}/events"))
+    assert events[-1][0] == "end"
+    assert events[-1][1]["in_flight"] == 0
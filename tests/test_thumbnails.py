@@ -0,0 +1,80 @@
+import cv2
+import numpy as np
+import pytest
+
+import server
+
+
+def _png(width, height, channels=3) -> bytes:
+    image = np.full((height, width, channels), 128, dtype=np.uint8)
+    if channels == 4:
+        image[:, :, 3] = 0
+    ok, encoded = cv2.imencode(".png", image)
+    assert ok
+    return encoded.tobytes()
+
+
+def _decode(content: bytes):
+    return cv2.imdecode(np.frombuffer(content, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+
+
+def test_thumb_width_rounds_up_to_steps():
+    assert server._thumb_width(1) == server._THUMB_WIDTH_STEP
+    assert server._thumb_width(server._THUMB_WIDTH_STEP) == server._THUMB_WIDTH_STEP
+    assert server._thumb_width(server._THUMB_WIDTH_STEP + 1) == 2 * server._THUMB_WIDTH_STEP
+    assert server._thumb_width(10 ** 6) == server._THUMB_MAX_WIDTH
+
+
+def test_make_thumbnail_keeps_aspect_ratio_and_never_upscales():
+    thumb = _decode(server._make_thumbnail(_png(800, 400), 200, "jpeg"))
+    assert thumb.shape[:2] == (100, 200)
+    small = _decode(server._make_thumbnail(_png(100, 50), 200, "webp"))
+    assert small.shape[:2] == (50, 100)
+
+
+def test_make_thumbnail_flattens_alpha_for_jpeg():
+    thumb = _decode(server._make_thumbnail(_png(120, 60, channels=4), 60, "jpeg"))
+    # 全透明像素铺白底
+    assert thumb.ndim == 3 and thumb.shape[2] == 3
+    assert thumb.min() > 240
+    with pytest.raises(ValueError):
+        server._make_thumbnail(b"not an image", 60, "jpeg")
+
+
+@pytest.fixture
+def thumbs(http_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "_proxy_cache", server.DiskLRUCache(str(tmp_path / "proxy"), 10 * 1024 * 1024))
+    monkeypatch.setattr(server, "_thumb_cache", server.DiskLRUCache(str(tmp_path / "thumbs"), 10 * 1024 * 1024))
+    http_server.files["/bfs/card.png"] = _png(800, 400)
+    http_server.files["/bfs/anim.gif"] = b"GIF89a not really"
+    client = server.app.test_client()
+
+    def get(path, **params):
+        return client.get("/api/proxy_img", query_string={"url": http_server.url + path, **params},
+                          headers={"Accept": "image/webp,*/*"})
+
+    return http_server, get
+
+
+def test_proxy_img_serves_cached_thumbnail(thumbs):
+    http_server, get = thumbs
+    resp = get("/bfs/card.png", w=100)
+    assert resp.status_code == 200
+    assert resp.content_type == "image/webp"
+    assert resp.headers["Vary"] == "Accept"
+    assert _decode(resp.data).shape[1] == 120
+    assert "card_w120.webp" in resp.headers["Content-Disposition"]
+
+    # 同一档位的宽度直接命中缩略图缓存，原图只下载一次
+    assert get("/bfs/card.png", w=110).data == resp.data
+    jpeg = get("/bfs/card.png", w=100, format="jpeg")
+    assert jpeg.content_type == "image/jpeg"
+    assert "Vary" not in jpeg.headers
+    assert len(http_server.requests) == 1
+
+
+def test_proxy_img_falls_back_to_original_when_undecodable(thumbs):
+    _http_server, get = thumbs
+    resp = get("/bfs/anim.gif", w=100)
+    assert resp.status_code == 200
+    assert resp.data == b"GIF89a not really"
@@ -0,0 +1,93 @@
+import hashlib
+import os
+import time
+
+import pytest
+
+import server
+
+DATA = os.urandom(300 * 1024)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "_downloads_dir", lambda: str(tmp_path))
+    return server.app.test_client()
+
+
+def _create(client, **payload):
+    return client.post("/api/save_zip/uploads", json={"filename": "合集.zip", **payload}).get_json()["data"]
+
+
+def test_save_zip_raw_body_with_hash(client, tmp_path):
+    resp = client.post("/api/save_zip?filename=a.zip", data=DATA,
+                       headers={"X-Content-SHA256": hashlib.sha256(DATA).hexdigest()})
+    assert resp.get_json()["code"] == 0
+    assert (tmp_path / "a.zip").read_bytes() == DATA
+
+    resp = client.post("/api/save_zip?filename=b.zip", data=DATA, headers={"X-Content-SHA256": "0" * 64})
+    assert resp.status_code == 400
+    assert sorted(os.listdir(tmp_path)) == ["a.zip"]
+
+
+def test_chunked_upload_resume_and_finalize(client, tmp_path):
+    meta = _create(client, size=len(DATA), sha256=hashlib.sha256(DATA).hexdigest())
+    url = f"/api/save_zip/uploads/{meta['upload_id']}"
+
+    assert client.put(f"{url}?offset=0", data=DATA[:100000]).get_json()["data"]["offset"] == 100000
+    # offset 与服务端不一致时返回 409 和正确的 offset，客户端据此续传
+    resp = client.put(f"{url}?offset=0", data=DATA[:100000])
+    assert resp.status_code == 409
+    assert resp.get_json()["data"]["offset"] == 100000
+    assert client.get(url).get_json()["data"]["offset"] == 100000
+
+    resp = client.post(f"{url}/finalize")
+    assert resp.status_code == 409
+    client.put(f"{url}?offset=100000", data=DATA[100000:])
+
+    data = client.post(f"{url}/finalize").get_json()
+    assert data["code"] == 0
+    assert (tmp_path / "合集.zip").read_bytes() == DATA
+    assert client.get(url).status_code == 404
+
+
+def test_chunk_over_declared_size_rejected(client):
+    meta = _create(client, size=10)
+    url = f"/api/save_zip/uploads/{meta['upload_id']}"
+    resp = client.put(f"{url}?offset=0", data=b"x" * 11)
+    assert resp.status_code == 400
+    assert client.get(url).get_json()["data"]["offset"] == 0
+
+
+def test_finalize_rechecks_offset_under_lock(client, monkeypatch):
+    meta = _create(client, size=4)
+    url = f"/api/save_zip/uploads/{meta['upload_id']}"
+    client.put(f"{url}?offset=0", data=b"abcd")
+
+    # finalize 拿到锁之前会话被截断（模拟并发写入改变了状态）：必须按锁内的最新状态判断
+    real_lock = server._upload_lock
+
+    def lock_after_truncate(upload_id):
+        part_path, _meta_path = server._upload_paths(upload_id)
+        with open(part_path, "r+b") as fh:
+            fh.truncate(2)
+        return real_lock(upload_id)
+
+    monkeypatch.setattr(server, "_upload_lock", lock_after_truncate)
+    resp = client.post(f"{url}/finalize")
+    assert resp.status_code == 409
+    assert resp.get_json()["data"]["offset"] == 2
+
+
+def test_expired_upload_sessions_are_pruned(client, tmp_path):
+    stale = _create(client)
+    fresh = _create(client)
+    old = time.time() - server.UPLOAD_EXPIRE_SECONDS - 60
+    for path in server._upload_paths(stale["upload_id"]):
+        os.utime(path, (old, old))
+
+    _create(client)
+    uploads = os.listdir(tmp_path / ".uploads")
+    assert not any(name.startswith(stale["upload_id"]) for name in uploads)
+    assert any(name.startswith(fresh["upload_id"]) for name in uploads)
+    assert client.get(f"/api/save_zip/uploads/{stale['upload_id']}").status_code == 404
@@ -0,0 +1,104 @@
+import struct
+
+import cv2
+import numpy as np
+import pytest
+
+import server
+
+
+def _box(box_type: bytes, payload_size: int) -> bytes:
+    return struct.pack(">I4s", 8 + payload_size, box_type) + b"\0" * payload_size
+
+
+def test_mp4_tail_offset_faststart_returns_none():
+    data = _box(b"ftyp", 16) + _box(b"moov", 100) + _box(b"mdat", 1000)
+    assert server._mp4_tail_offset(data[:200], len(data)) is None
+
+
+def test_mp4_tail_offset_points_after_mdat():
+    ftyp = _box(b"ftyp", 16)
+    mdat_size = 50000
+    head = ftyp + struct.pack(">I4s", mdat_size, b"mdat") + b"\0" * 100
+    total = len(ftyp) + mdat_size + 300
+    assert server._mp4_tail_offset(head, total) == len(ftyp) + mdat_size
+
+
+def test_mp4_tail_offset_moov_cut_by_head():
+    ftyp = _box(b"ftyp", 16)
+    data = ftyp + _box(b"moov", 5000)
+    assert server._mp4_tail_offset(data[:1000], len(data)) == len(ftyp)
+
+
+def test_mp4_tail_offset_largesize_box():
+    ftyp = _box(b"ftyp", 16)
+    mdat_size = 5 * 1024 ** 3
+    head = ftyp + struct.pack(">I4sQ", 1, b"mdat", mdat_size) + b"\0" * 64
+    total = len(ftyp) + mdat_size + 4096
+    assert server._mp4_tail_offset(head, total) == len(ftyp) + mdat_size
+
+
+def test_mp4_tail_offset_box_to_end_of_file():
+    ftyp = _box(b"ftyp", 16)
+    head = ftyp + struct.pack(">I4s", 0, b"mdat") + b"\0" * 64
+    assert server._mp4_tail_offset(head, len(ftyp) + 10000) is None
+
+
+def test_mp4_tail_offset_invalid_box_size():
+    head = _box(b"ftyp", 16) + struct.pack(">I4s", 4, b"free") + b"\0" * 64
+    assert server._mp4_tail_offset(head, 100000) is None
+
+
+
+@pytest.fixture
+def video(http_server, tmp_path, monkeypatch):
+    """mp4v 编码的 3 秒视频，第 i 帧的灰度为 i*8；OpenCV 写出的文件 moov 在末尾。"""
+    path = str(tmp_path / "clip.mp4")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 10, (64, 48))
+    assert writer.isOpened()
+    for i in range(30):
+        writer.write(np.full((48, 64, 3), i * 8, dtype=np.uint8))
+    writer.release()
+    with open(path, "rb") as fh:
+        http_server.files["/upos/clip.mp4"] = fh.read()
+    monkeypatch.setattr(server, "_poster_cache", server.DiskLRUCache(str(tmp_path / "posters"), 10 * 1024 * 1024))
+    # 头部只取一小段，走补取 moov 的分支
+    monkeypatch.setattr(server, "_POSTER_HEAD_BYTES", 256)
+    return http_server
+
+
+def _poster(http_server, **params):
+    client = server.app.test_client()
+    return client.get("/api/video_poster", query_string={"url": http_server.url + "/upos/clip.mp4", **params})
+
+
+def test_fetch_range_reads_partial_content(video):
+    body = video.files["/upos/clip.mp4"]
+    content, total = server._fetch_range(video.url + "/upos/clip.mp4", 4, 11)
+    assert (content, total) == (body[4:12], len(body))
+
+
+def test_video_poster_extracts_requested_frame(video):
+    first = _poster(video)
+    assert first.status_code == 200
+    assert first.content_type == "image/jpeg"
+    later = _poster(video, t="2", w="30")
+    frame = cv2.imdecode(np.frombuffer(later.data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    assert frame.shape[1] == server._THUMB_WIDTH_STEP
+    first_frame = cv2.imdecode(np.frombuffer(first.data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    assert first_frame.mean() < 30 < 120 < frame.mean()
+    # moov 在末尾时除了头部还会按 Range 取回末尾
+    assert any(req.get("range", "").startswith("bytes=") and not req["range"].startswith("bytes=0-")
+               for req in video.requests)
+
+    count = len(video.requests)
+    assert _poster(video, t="2", w="30").data == later.data
+    assert len(video.requests) == count
+
+
+def test_video_poster_errors(video):
+    assert _poster(video, t="abc").status_code == 400
+    client = server.app.test_client()
+    assert client.get("/api/video_poster?url=ftp://x").status_code == 400
+    video.files["/upos/clip.mp4"] = b"not a video" * 10
+    assert _poster(video, t="1").status_code == 502
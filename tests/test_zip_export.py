@@ -0,0 +1,68 @@
+import io
+import os
+import zipfile
+
+import server
+
+
+def test_stream_zip_output_is_valid(http_server):
+    contents = {f"/f{i}.{ext}": os.urandom(1000 * (i + 1)) for i, ext in enumerate(["jpg", "txt", "mp4", "png", "json"])}
+    http_server.files.update(contents)
+    entries = [(f"合集/{path.lstrip('/')}", http_server.url + path) for path in contents]
+    entries.append(("合集/missing.png", http_server.url + "/missing.png"))
+
+    data = b"".join(server._stream_zip(entries))
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        for path, content in contents.items():
+            assert zf.read(f"合集/{path.lstrip('/')}") == content
+        # 已压缩格式直接存储，文本类成员压缩
+        assert zf.getinfo("合集/f0.jpg").compress_type == zipfile.ZIP_STORED
+        assert zf.getinfo("合集/f1.txt").compress_type == zipfile.ZIP_DEFLATED
+        failed = zf.read("下载失败.txt").decode("utf-8")
+        assert "合集/missing.png" in failed
+
+
+def test_stream_zip_closed_early_cleans_up(http_server, monkeypatch):
+    http_server.files.update({f"/{i}.bin": os.urandom(200000) for i in range(8)})
+    tmp_dirs = []
+    real_mkdtemp = server.tempfile.mkdtemp
+
+    def mkdtemp(**kwargs):
+        tmp_dirs.append(real_mkdtemp(**kwargs))
+        return tmp_dirs[-1]
+
+    monkeypatch.setattr(server.tempfile, "mkdtemp", mkdtemp)
+
+    # 客户端读到第一块数据后断开：生成器关闭时删除临时目录
+    stream = server._stream_zip([(f"{i}.bin", f"{http_server.url}/{i}.bin") for i in range(8)])
+    assert next(stream)
+    stream.close()
+    assert tmp_dirs and not os.path.exists(tmp_dirs[0])
+    # 同时进行的下载不超过窗口大小，断开后不再发起新的请求
+    assert len(http_server.requests) <= server.ZIP_EXPORT_WINDOW + 1
+
+
+def test_zip_entries_paths():
+    links = [
+        {"url": "https://i0.hdslb.com/bfs/a.png", "collectionFolder": "合集", "type": "dl-a-img", "filename": "卡.png"},
+        {"url": "https://i0.hdslb.com/bfs/b.png", "collectionFolder": "合集", "type": "dl-a-img", "filename": "卡.png"},
+        {"url": "https://i0.hdslb.com/bfs/c.png", "zipPath": "../x/../y.png"},
+        {"url": "ftp://invalid"},
+        "not a dict",
+    ]
+    assert [arcname for arcname, _url in server._zip_entries(links)] == [
+        "合集/img/卡.png", "合集/img/卡(1).png", "x/y.png",
+    ]
+
+
+def test_export_zip_endpoint(http_server):
+    http_server.files["/a.png"] = b"png"
+    client = server.app.test_client()
+    resp = client.post("/api/export_zip", json={"filename": "合集", "links": [
+        {"url": http_server.url + "/a.png", "zipPath": "合集/a.png"},
+    ]})
+    assert resp.headers["Content-Disposition"].endswith("%E5%90%88%E9%9B%86.zip")
+    with zipfile.ZipFile(io.BytesIO(resp.get_data())) as zf:
+        assert zf.read("合集/a.png") == b"png"
+    assert client.post("/api/export_zip", json={"links": [{"url": "ftp://x"}]}).status_code == 400